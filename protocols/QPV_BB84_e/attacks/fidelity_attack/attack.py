@@ -7,6 +7,7 @@ from QPV_BB84_e.verifiers.protocol import Protocol
 from QPV_BB84_e.custom_models.network_components import ConnectionDirection
 from QPV_BB84_e.custom_models.quantum_gates import PreparationGate
 
+import random
 import argparse
 import netsquid as ns
 
@@ -49,9 +50,22 @@ class Attack():
     :type prob_absorption: optional, float
     :param detector_efficiency: The detection efficiency of the photon detector for Charlie. Defaults to `.96`.
     :type detector_efficiency: optional, float
+    :param sequential_test: A test that stops a run as soon as its decision is settled. Defaults to `None`.
+    :type sequential_test: optional, :class:`QPV_BB84_e.verifiers.sequential_test.SequentialTest`
+    :param channel_noise: How the noise of the source and the fibre from Alice is applied, see
+        :class:`QPV_BB84_e.verifiers.protocol.Protocol`. Defaults to `staged`.
+    :type channel_noise: optional, str
+    :param loss_first: Whether the loss of photons at Alice and in the connection to Dave is sampled up front by
+        Alice, see :class:`QPV_BB84_e.verifiers.protocol.Protocol`. Defaults to `False`.
+    :type loss_first: optional, bool
+    :param record_transcript: Whether the verifiers record the transcript of their side of the rounds, see
+        :class:`QPV_BB84_e.verifiers.protocol.Protocol`. Defaults to `False`.
+    :type record_transcript: optional, bool
     """
-    def __init__(self, n, m, P_A, P_B, P_D, P_E, P_v, charlie_prob_absorption=.3, charlie_detector_efficiency=.96):
-        self.model = Protocol(n, m, P_A, P_B, P_v)
+    def __init__(self, n, m, P_A, P_B, P_D, P_E, P_v, charlie_prob_absorption=.3, charlie_detector_efficiency=.96,
+                 sequential_test=None, channel_noise='staged', loss_first=False, record_transcript=False):
+        self.model = Protocol(n, m, P_A, P_B, P_v, sequential_test=sequential_test, channel_noise=channel_noise,
+                              loss_first=loss_first, record_transcript=record_transcript)
         self.setup(P_D, P_E)
 
         # Calculate l_fraction as described in the thesis.
@@ -59,19 +73,16 @@ class Attack():
                           * 10**((-(P_v - P_A) * .18) / 10))
 
         dave = self.dave['node']
-        # The results that Dave measures.
-        dave.cdata['d_i'] = []
-        dave.cdata['n'] = n
         dave.cdata['m'] = m
         dave.cdata['l_fraction'] = l_fraction
 
         eve = self.eve['node']
-        # The results that Eve measures.
-        eve.cdata['e_i'] = []
-        eve.cdata['n'] = n
         eve.cdata['m'] = m
         eve.cdata['l_fraction'] = l_fraction
 
+        self.protocols = []
+        self.reset(n)
+
     def create_processor(self):
         """Returns a quantum processor. No error models are used, as we do not assume limitations for the adversaries.
         The processor supports the preparation gate used in the QPV_BB84_e protocol and measurement
@@ -120,10 +131,39 @@ class Attack():
 
         self.dave['node'].ports[port_d].forward_input(self.dave['node'].qmemory.ports['qin0'])
 
+    def reset(self, n=None, seed=None, streams=None):
+        """Resets the per-run state of Dave, Eve and the verifiers, so that the protocol can be run again
+        on the same network.
+
+        :param n: The number of rounds to run the protocol for in the next run. Defaults to the current value.
+        :type n: optional, int
+        :param seed: A seed for the random number generators used in the simulation. Defaults to `None`.
+        :type seed: optional, int
+        :param streams: The random streams of the next run. Defaults to `None`, in which case the global random
+            number generators are used.
+        :type streams: optional, :class:`QPV_BB84_e.verifiers.random_streams.RandomStreams`
+        """
+        for protocol in self.protocols:
+            protocol.stop()
+
+        self.protocols = []
+        self.model.reset(n, seed, streams)
+
+        self.dave['node'].qmemory.reset()
+        self.dave['node'].cdata['random'] = streams.player if streams is not None else random
+
+        # The results that Dave and Eve measure.
+        self.dave['node'].cdata['d_i'] = []
+        self.eve['node'].cdata['e_i'] = []
+
+        if n is not None:
+            self.dave['node'].cdata['n'] = n
+            self.eve['node'].cdata['n'] = n
+
     def run(self):
         """Runs the QPV_BB84_e protocol with Dave and Eve partaking as adversaries employing the fidelity attack.
 
-        :return: The simulation statistics, the results of Alice, and the results of Bob.
+        :return: The statistics of the run, the results of Alice, and the results of Bob.
         :rtype: list
         """
         ns.sim_reset()
@@ -134,6 +174,8 @@ class Attack():
         dave_protocol.start()
         eve_protocol.start()
 
+        self.protocols = [dave_protocol, eve_protocol]
+
         return self.model.run()
 
 
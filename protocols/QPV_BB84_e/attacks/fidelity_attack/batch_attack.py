@@ -0,0 +1,304 @@
+from QPV_BB84_e.verifiers.batch_protocol import BatchProtocol, NO_ANSWER
+from QPV_BB84_e.verifiers.protocol import CCONN_SPEED, QCONN_SPEED
+from QPV_BB84_e.custom_models.basis_table import get_basis_table
+
+import math
+import argparse
+import numpy as np
+
+"""
+batch_attack.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains a vectorised implementation of the fidelity attack performed by adversaries Dave and Eve on
+the QPV_BB84_e protocol. The answers of the adversaries are computed for thousands of rounds at once instead of
+simulating each round with NetSquid events.
+"""
+
+
+def fidelities(theta_a, phi_a, theta_v, phi_v, m):
+    r"""Returns the fidelities between :math:`B_A | x \rangle` and :math:`B_V | x \rangle` for arrays of bases,
+    where :math:`B_A` is the adversaries' gate and :math:`B_V` is that of the verifiers. As both gates are in
+    :math:`SU(2)`, the fidelity is the same for both outcomes :math:`x`.
+
+    :param theta_a: The :math:`\theta` parameters of the adversaries' gates.
+    :type theta_a: :class:`numpy.ndarray`
+    :param phi_a: The :math:`\phi` parameters of the adversaries' gates.
+    :type phi_a: :class:`numpy.ndarray`
+    :param theta_v: The :math:`\theta` parameters of the verifiers' gates.
+    :type theta_v: :class:`numpy.ndarray`
+    :param phi_v: The :math:`\phi` parameters of the verifiers' gates.
+    :type phi_v: :class:`numpy.ndarray`
+    :param m: The m parameter in the matrix.
+    :type m: int
+
+    :return: The fidelities.
+    :rtype: :class:`numpy.ndarray`
+    """
+    table = get_basis_table(m)
+
+    return table.fidelities(table.index(theta_a, phi_a), table.index(theta_v, phi_v))
+
+
+class BatchAttack():
+    """This is a vectorised class representation of the attack by Dave and Eve based on fidelity on the
+    QPV_BB84_e protocol. It takes the same parameters as :class:`QPV_BB84_e.attacks.fidelity_attack.attack.Attack`
+    and returns results with the same structure. When instantiating this class, a
+    :class:`QPV_BB84_e.verifiers.batch_protocol.BatchProtocol` object is instantiated, representing the verifiers.
+
+    :param n: The number of rounds to run the protocol for.
+    :type n: int
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param P_A: The position of Alice on the real number line.
+    :type P_A: float
+    :param P_B: The position of Bob on the real number line.
+    :type P_B: float
+    :param P_D: The position of Dave on the real number line.
+    :type P_D: float
+    :param P_E: The position of Eve on the real number line.
+    :type P_E: float
+    :param P_v: The verification position on the real number line.
+    :type P_v: float
+    :param charlie_prob_absorption: The probability of absorption of a photon when travelling through a beam
+        splitter for Charlie. Defaults to `.3`.
+    :type charlie_prob_absorption: optional, float
+    :param charlie_detector_efficiency: The detection efficiency of the photon detector for Charlie.
+        Defaults to `.96`.
+    :type charlie_detector_efficiency: optional, float
+    :param seed: The seed of the random number generator. Defaults to `None`.
+    :type seed: optional, int
+    :param sequential_test: A test that stops a run as soon as its decision is settled. Defaults to `None`.
+    :type sequential_test: optional, :class:`QPV_BB84_e.verifiers.sequential_test.SequentialTest`
+    :param fidelity_loss: The amount of loss in fidelity for qubit initialisation by Alice. Defaults to `.005`.
+    :type fidelity_loss: optional, float
+    :param prob_absorption: The probability of absorption of a photon when travelling through a beam splitter for
+        Alice. Defaults to `.3`.
+    :type prob_absorption: optional, float
+    :param basis_tilt: The probability with which Dave is made to measure in the basis of the verifiers, for
+        importance sampling. Defaults to `0.`, in which case he measures in a random basis.
+    :type basis_tilt: optional, float
+    :param survival_tilt: The probability of survival of the photon on its way to Dave, for importance sampling.
+        Defaults to `None`, in which case the probability of the quantum channel is used.
+    :type survival_tilt: optional, float
+    """
+    def __init__(self, n, m, P_A, P_B, P_D, P_E, P_v, charlie_prob_absorption=.3, charlie_detector_efficiency=.96,
+                 seed=None, sequential_test=None, fidelity_loss=.005, prob_absorption=.3, basis_tilt=0.,
+                 survival_tilt=None):
+        self.model = BatchProtocol(n, m, P_A, P_B, P_v, fidelity_loss=fidelity_loss, prob_absorption=prob_absorption,
+                                   seed=seed, sequential_test=sequential_test)
+        self.dave_position = P_D
+        self.eve_position = P_E
+
+        # Calculate l_fraction as described in the thesis.
+        self.l_fraction = 1 - ((1 - charlie_prob_absorption) * charlie_detector_efficiency
+                               * 10**((-(P_v - P_A) * .18) / 10))
+
+        self.prob_survival, self.bloch_length = self.model.quantum_channel(P_D - P_A)
+
+        self.basis_tilt = basis_tilt
+        self.survival_tilt = survival_tilt
+        self.importance = basis_tilt > 0 or survival_tilt is not None
+
+        self.setup_timing_vals()
+
+    def setup_timing_vals(self):
+        """Computes the times at which Dave and Eve send their answers, relative to the moment that the messages of
+        both verifiers reach P_v.
+        """
+        model = self.model
+        m_0_sent = -model.alice_classical_delta_time_P_v
+        m_1_sent = -model.bob_classical_delta_time_P_v
+
+        # Dave checks for the qubit as soon as m_0 arrives, and measures it without delay.
+        m_0_at_dave = m_0_sent + (self.dave_position - model.alice_position) / CCONN_SPEED * 1e9
+        qubit_at_dave = (self.dave_position - model.verification_position) / QCONN_SPEED * 1e9
+        self.qubit_in_time = qubit_at_dave <= m_0_at_dave or math.isclose(qubit_at_dave, m_0_at_dave)
+
+        # Eve forwards m_1 to Dave, and Dave sends his data to Eve.
+        m_1_at_eve = m_1_sent + (model.bob_position - self.eve_position) / CCONN_SPEED * 1e9
+        m_1_at_dave = m_1_at_eve + (self.eve_position - self.dave_position) / CCONN_SPEED * 1e9
+        data_at_eve = m_0_at_dave + (self.eve_position - self.dave_position) / CCONN_SPEED * 1e9
+
+        self.alice_arrival = (max(m_0_at_dave, m_1_at_dave)
+                              + (self.dave_position - model.alice_position) / CCONN_SPEED * 1e9)
+        self.bob_arrival = max(m_1_at_eve, data_at_eve) + (model.bob_position - self.eve_position) / CCONN_SPEED * 1e9
+
+    def reset(self, n=None, seed=None, streams=None):
+        """Resets the protocol for the next run.
+
+        :param n: The number of rounds to run the protocol for in the next run. Defaults to the current value.
+        :type n: optional, int
+        :param seed: A seed for the random number generator. Defaults to `None`.
+        :type seed: optional, int
+        :param streams: The random streams of the next run. Defaults to `None`.
+        :type streams: optional, :class:`QPV_BB84_e.verifiers.random_streams.RandomStreams`
+        """
+        self.model.reset(n, seed, streams)
+
+    def decide(self, f, d_i):
+        """Decides what result to send for arrays of fidelities and measurement outcomes, as in
+        :meth:`QPV_BB84_e.attacks.fidelity_attack.dave_protocol.DaveProtocol.send_result`.
+
+        :param f: The fidelities between the adversaries' and the verifiers' states.
+        :type f: :class:`numpy.ndarray`
+        :param d_i: Dave's measurement outcomes.
+        :type d_i: :class:`numpy.ndarray`
+
+        :return: The results, where no result is given by `NO_ANSWER`.
+        :rtype: :class:`numpy.ndarray`
+        """
+        outcome = np.full(len(d_i), NO_ANSWER)
+
+        flip = f < (1 - self.l_fraction) / 2
+        keep = f > (1 + self.l_fraction) / 2
+
+        outcome[flip] = (d_i[flip] + 1) % 2
+        outcome[keep] = d_i[keep]
+
+        return outcome
+
+    def answer(self, rounds):
+        """Computes the answers of Dave and Eve for an array of rounds. With importance sampling, the bases of Dave
+        and the survival of the photons are drawn from the tilted distributions, and the logarithm of the likelihood
+        ratio of every round is returned along with the answers.
+
+        :param rounds: A dictionary with the arrays of sampled rounds, as returned by
+            :meth:`QPV_BB84_e.verifiers.batch_protocol.BatchProtocol.sample_rounds`.
+        :type rounds: dict
+
+        :return: A dictionary with the answers to Alice and Bob and their arrival times, and with importance
+            sampling the logarithms of the likelihood ratios (`log_weight`).
+        :rtype: dict
+        """
+        rng = self.model.rng
+        size = len(rounds['b'])
+
+        prob_survival = self.prob_survival if self.survival_tilt is None else self.survival_tilt
+        survived = rng.random(size) < prob_survival
+        arrived = rounds['sent'] & survived & self.qubit_in_time
+
+        # Dave measures in a random basis, the depolarised state gives the outcome b with
+        # probability 1 / 2 + s (f - 1 / 2).
+        theta, phi = self.model.choose_bases(size)
+
+        if self.basis_tilt > 0:
+            # The basis only matters when the photon arrives, so that the other rounds are left untilted.
+            agree = arrived & (rng.random(size) < self.basis_tilt)
+            theta = np.where(agree, rounds['theta'], theta)
+            phi = np.where(agree, rounds['phi'], phi)
+
+        f = fidelities(theta, phi, rounds['theta'], rounds['phi'], self.model.m)
+
+        same = rng.random(size) < .5 + self.bloch_length * (f - .5)
+        d_i = np.where(same, rounds['b'], 1 - rounds['b'])
+
+        # Dave and Eve make the same decision, as they share the measurement outcome and basis.
+        answer = np.where(arrived, self.decide(f, d_i), NO_ANSWER)
+
+        result = {
+            'alice': answer,
+            'bob': answer,
+            'alice_arrival': np.full(size, self.alice_arrival),
+            'bob_arrival': np.full(size, self.bob_arrival)
+        }
+
+        if self.importance:
+            result['log_weight'] = self.log_weights(rounds, theta, phi, survived, arrived)
+
+        return result
+
+    def log_weights(self, rounds, theta, phi, survived, arrived):
+        r"""Returns the logarithms of the likelihood ratios of rounds drawn with importance sampling. When the
+        photon arrives, Dave chooses his basis from the mixture of the distribution of the protocol and the basis
+        of the verifiers, and the photon survives with the tilted probability. The survival only counts in the
+        rounds in which a photon was sent and could reach Dave in time, as it does not affect the answers
+        otherwise.
+
+        :param rounds: A dictionary with the arrays of sampled rounds.
+        :type rounds: dict
+        :param theta: The :math:`\theta` parameters of the bases of Dave.
+        :type theta: :class:`numpy.ndarray`
+        :param phi: The :math:`\phi` parameters of the bases of Dave.
+        :type phi: :class:`numpy.ndarray`
+        :param survived: Whether the photons survived the channel to Dave.
+        :type survived: :class:`numpy.ndarray`
+        :param arrived: Whether the photons reached Dave in time.
+        :type arrived: :class:`numpy.ndarray`
+
+        :return: The logarithms of the likelihood ratios.
+        :rtype: :class:`numpy.ndarray`
+        """
+        m = self.model.m
+        log_weight = np.zeros(len(theta))
+
+        if self.basis_tilt > 0:
+            # The probability of a basis in the protocol, with theta uniform and phi uniform given theta.
+            phi_max = np.round(2 * m * np.sin(np.arccos(2 * (theta / m) - 1))).astype(int)
+            prob_basis = 1 / (m * (phi_max + 1))
+
+            same_basis = (theta == rounds['theta']) & (phi == rounds['phi'])
+            log_weight -= np.where(arrived, np.log((1 - self.basis_tilt) + self.basis_tilt * same_basis / prob_basis),
+                                   0.)
+
+        if self.survival_tilt is not None and self.qubit_in_time:
+            p, q = self.prob_survival, self.survival_tilt
+
+            with np.errstate(divide='ignore'):
+                ratio = np.where(survived, np.log(p) - np.log(q), np.log1p(-p) - np.log1p(-q))
+
+            log_weight += np.where(rounds['sent'], ratio, 0.)
+
+        return log_weight
+
+    def run(self):
+        """Runs the QPV_BB84_e protocol with Dave and Eve partaking as adversaries employing the fidelity attack.
+
+        :return: The statistics of the run, the results of Alice, and the results of Bob.
+        :rtype: list
+        """
+        return self.model.run(self)
+
+
+def main():
+    # For debugging, run the vectorised protocol with Dave and Eve.
+    parser = argparse.ArgumentParser(description="""Vectorised QPV_BB84 simulation.
+                                     Alice and Bob are the verifiers, Dave and Eve are the adversaries.""")
+    parser.add_argument('iterations', metavar='n', type=int, help='The number of iterations (qubits).')
+    parser.add_argument('bases', metavar='m', type=int, help='The number of bases to choose from.')
+    parser.add_argument('positions', metavar='player positions', type=float, nargs=2,
+                        help='The positions of Alice (P_A) and Bob (P_B) on the real number line.')
+    parser.add_argument('adversaries', metavar='adversary positions', type=float, nargs=2,
+                        help="""The positions of adversaries Dave (P_D) and Eve (P_E) on the real number line.""")
+    parser.add_argument('v_pos', metavar='verification position (P_v)', type=float,
+                        help='The position to verify for.')
+
+    args = parser.parse_args()
+
+    if args.positions[0] >= args.positions[1]:
+        parser.error('It is required that P_A < P_B.')
+
+    if ((args.positions[0] >= args.adversaries[0] or args.adversaries[1] >= args.positions[1]) or
+            (args.positions[0] >= args.v_pos or args.v_pos >= args.adversaries[1])):
+        parser.error('It is required that P_A < P_D < P_v < P_E < P_B.')
+
+    P_A, P_B = args.positions
+    P_D, P_E = args.adversaries
+
+    attack = BatchAttack(args.iterations, args.bases, P_A, P_B, P_D, P_E, args.v_pos)
+
+    stats, alice_data, bob_data = attack.run()
+
+    print(stats)
+    print('Alice\'s data (correct / on time per round):')
+    print(alice_data['r_i'], alice_data['t_i'])
+    print('Bob\'s data (correct / on time per round):')
+    print(bob_data['r_i'], bob_data['t_i'])
+
+
+if __name__ == '__main__':
+    main()
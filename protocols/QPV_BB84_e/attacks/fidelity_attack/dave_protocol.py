@@ -3,9 +3,11 @@ from netsquid.components.qprogram import QuantumProgram
 from netsquid.components import instructions as instr
 from netsquid.qubits import qubitapi as qapi
 from QPV_BB84_e.custom_models.quantum_gates import PreparationGate
+from QPV_BB84_e.custom_models.basis_table import get_basis_table
+from QPV_BB84_e.attacks.fidelity_attack.decision_table import ABSTAIN, get_decision_table
+from QPV_BB84_e.verifiers.profiler import profiled
 
 import numpy as np
-import random
 
 """
 dave_protocol.py
@@ -55,19 +57,6 @@ class DaveProtocol(NodeProtocol):
     at a later point in time from Eve, he can decide what value to send to Alice and Bob based on the fidelity
     that can now be computed.
     """
-    def fidelity(self, psi, psi_prime):
-        """Returns the fidelity between two pure quantum states in the ket formalism.
-
-        :param psi: The first quantum state.
-        :type psi: :class:`numpy.ndarray`
-        :param psi_prime: The second quantum state.
-        :type psi: :class:`numpy.ndarray`
-
-        :return: The fidelity between the two states.
-        :rtype: float
-        """
-        return np.abs(np.vdot(psi, psi_prime))**2
-
     def setup_ports(self):
         """Set up the ports used to communicate classically and quantumly with the other parties.
         """
@@ -75,6 +64,7 @@ class DaveProtocol(NodeProtocol):
         self.c_port_alice = self.node.ports['c_alice']
         self.c_port_eve = self.node.ports['c_eve']
 
+    @profiled
     def process_m_0(self):
         """Extract the message m_0 from the port with Alice. Since quantum communication is inherently
         slower than classical communication in the model,
@@ -90,6 +80,7 @@ class DaveProtocol(NodeProtocol):
 
             self.m_0 = None
 
+    @profiled
     def process_m_1(self):
         """Extract the message m_1 from the port with Eve. If we did not receive a photon before,
         we disregard the message and tell Alice that we did not recieve a photon.
@@ -102,16 +93,18 @@ class DaveProtocol(NodeProtocol):
             self.c_port_alice.tx_output(('NO_PHOTON', None))
             self.last_no_photon = False
 
+    @profiled
     def measure_qubit(self):
         r"""Start the quantum measurement program with a random choice of basis(:math:`\theta` and :math:`\phi`).
         """
-        self.theta = random.randint(0, self.m - 1)
-        self.phi = random.randint(0, np.round(2 * self.m * np.sin(np.arccos(2 * (self.theta / self.m) - 1))))
+        self.theta = self.random.randint(0, self.m - 1)
+        self.phi = self.random.randint(0, np.round(2 * self.m * np.sin(np.arccos(2 * (self.theta / self.m) - 1))))
 
         self.measure_program = MeasureProgram()
         self.node.qmemory.execute_program(self.measure_program, m=self.m, theta=self.theta,
                                           phi=self.phi, physical=True)
 
+    @profiled
     def process_measurement(self):
         """Process the measurement outcome, and send the results to Eve along with the basis
         choice and m_0.
@@ -125,6 +118,7 @@ class DaveProtocol(NodeProtocol):
         q = self.node.qmemory.pop(0)[0]
         qapi.discard(q)
 
+    @profiled
     def send_result(self):
         r"""Once we have received m_1 from Eve, we decide what result to send to Alice by comparing
         the fidelity between :math:`B_A | x \rangle` and :math:`B_V | x \rangle`, where :math:`x` is
@@ -134,23 +128,17 @@ class DaveProtocol(NodeProtocol):
         """
         outcome = None
 
-        ket_x = np.array([1, 0]) if not self.d_i else np.array([0, 1])
-
         theta = (self.stored_m_0[0] + self.m_1) % (2 * self.m + 1)
         phi = (self.stored_m_0[1] + self.m_1) % (2 * self.m + 1)
 
-        # The qubit using the gate we (Dave and Eve) used.
-        adv_qubit = np.array(PreparationGate().create_operator(self.theta, self.phi, self.m).arr @ ket_x)
-
-        # The qubit using the gate the verifiers used.
-        ver_qubit = np.array(PreparationGate().create_operator(theta, phi, self.m).arr @ ket_x)
-
-        f = self.fidelity(adv_qubit, ver_qubit)
+        # The decision follows from the fidelity between the qubit using the gate we (Dave and Eve) used and the
+        # qubit using the gate the verifiers used, looked up in the decision table.
+        table = get_basis_table(self.m)
+        decision = get_decision_table(self.m, self.node.cdata['l_fraction'])[table.index(self.theta, self.phi),
+                                                                           table.index(theta, phi)]
 
-        if f < (1 - self.node.cdata['l_fraction']) / 2:
-            outcome = (self.d_i + 1) % 2
-        elif f > (1 + self.node.cdata['l_fraction']) / 2:
-            outcome = self.d_i
+        if decision != ABSTAIN:
+            outcome = (self.d_i + int(decision)) % 2
 
         if outcome is not None:
             self.c_port_alice.tx_output(('MEASUREMENT', outcome))
@@ -159,10 +147,12 @@ class DaveProtocol(NodeProtocol):
 
         self.node.cdata['d_i'].append(outcome)
 
+    @profiled
     def run(self):
         """Continuously check for messages from Alice or Eve.
         """
         self.m = self.node.cdata['m']
+        self.random = self.node.cdata['random']
         self.setup_ports()
 
         received_qubit = False
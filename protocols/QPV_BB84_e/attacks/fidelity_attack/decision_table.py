@@ -0,0 +1,118 @@
+from QPV_BB84_e.custom_models.basis_table import get_basis_table
+
+import os
+import numpy as np
+
+"""
+decision_table.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the table of the decisions of the adversaries in the fidelity attack, for all pairs of the
+basis of the adversaries and the basis of the verifiers. As the fidelity between the states of the adversaries
+and of the verifiers is the same for both measured bits, a decision only depends on the pair of bases. The table
+is computed once per m and l_fraction, and cached on disk, from where it is memory mapped.
+"""
+
+
+DECISION_CACHE = './results/decision_tables'
+
+# The decisions of the adversaries: abstain by answering that no photon arrived, or answer with the measured bit,
+# flipped or not. A decision that is not `ABSTAIN` is added to the bit modulo 2.
+ABSTAIN = -1
+KEEP = 0
+FLIP = 1
+
+# The tables that have been loaded in this process, indexed by m and l_fraction.
+_decision_tables = {}
+
+
+def decisions(f, l_fraction):
+    """Returns the decisions of the adversaries for the given fidelities, as in
+    :meth:`QPV_BB84_e.attacks.fidelity_attack.dave_protocol.DaveProtocol.send_result`.
+
+    :param f: The fidelities between the adversaries' and the verifiers' states.
+    :type f: :class:`numpy.ndarray`
+    :param l_fraction: The fraction of rounds the honest prover loses.
+    :type l_fraction: float
+
+    :return: The decisions.
+    :rtype: :class:`numpy.ndarray`
+    """
+    result = np.full(np.shape(f), ABSTAIN, dtype=np.int8)
+
+    result[f < (1 - l_fraction) / 2] = FLIP
+    result[f > (1 + l_fraction) / 2] = KEEP
+
+    return result
+
+
+def build_decision_table(m, l_fraction, filename=None, block_size=256):
+    """Computes the decisions for all pairs of bases, a block of bases of the adversaries at a time.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param l_fraction: The fraction of rounds the honest prover loses.
+    :type l_fraction: float
+    :param filename: The file to write the table to. Defaults to `None`, in which case it is kept in memory.
+    :type filename: optional, str
+    :param block_size: The number of bases of the adversaries per block. Defaults to `256`.
+    :type block_size: optional, int
+
+    :return: The table, indexed by the index of the basis of the adversaries and that of the verifiers.
+    :rtype: :class:`numpy.ndarray`
+    """
+    table = get_basis_table(m)
+
+    if filename is None:
+        result = np.empty((table.size, table.size), dtype=np.int8)
+    else:
+        result = np.lib.format.open_memmap(filename, mode='w+', dtype=np.int8, shape=(table.size, table.size))
+
+    for start in range(0, table.size, block_size):
+        # The same arithmetic as the lookup of a single pair, so that fidelities at a threshold agree.
+        index_a = np.arange(start, min(start + block_size, table.size))[:, np.newaxis]
+        f = table.fidelities(index_a, np.arange(table.size)[np.newaxis, :])
+
+        result[start:start + block_size] = decisions(f, l_fraction)
+
+    if filename is not None:
+        result.flush()
+
+    return result
+
+
+def get_decision_table(m, l_fraction, cache=DECISION_CACHE):
+    """Returns the decision table for the given m and l_fraction. The table is read from the cache if it has been
+    computed before, and computed and cached otherwise.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param l_fraction: The fraction of rounds the honest prover loses.
+    :type l_fraction: float
+    :param cache: The directory of the cache. Defaults to `DECISION_CACHE`.
+    :type cache: optional, str
+
+    :return: The table, indexed by the index of the basis of the adversaries and that of the verifiers in the
+        basis table.
+    :rtype: :class:`numpy.ndarray`
+    """
+    key = (m, float(l_fraction))
+
+    if key not in _decision_tables:
+        filename = os.path.join(cache, f'decision_table_{m}_{float(l_fraction).hex()}.npy')
+
+        if not os.path.exists(filename):
+            os.makedirs(cache, exist_ok=True)
+
+            # Written under a temporary name first, so that an interrupted write is never read as a table.
+            temporary = f'{filename[:-len(".npy")]}.{os.getpid()}.tmp.npy'
+            build_decision_table(m, l_fraction, temporary)
+            os.replace(temporary, filename)
+
+        _decision_tables[key] = np.load(filename, mmap_mode='r')
+
+    return _decision_tables[key]
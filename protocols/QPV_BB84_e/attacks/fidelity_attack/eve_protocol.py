@@ -1,7 +1,7 @@
 from netsquid.protocols.nodeprotocols import NodeProtocol
-from QPV_BB84_e.custom_models.quantum_gates import PreparationGate
-
-import numpy as np
+from QPV_BB84_e.custom_models.basis_table import get_basis_table
+from QPV_BB84_e.attacks.fidelity_attack.decision_table import ABSTAIN, get_decision_table
+from QPV_BB84_e.verifiers.profiler import profiled
 
 """
 eve_protocol.py
@@ -23,25 +23,13 @@ class EveProtocol(NodeProtocol):
     at a later point in time, she can decide what value to send to Alice and Bob based on the fidelity
     that can now be computed.
     """
-    def fidelity(self, psi, psi_prime):
-        """Returns the fidelity between two pure quantum states in the ket formalism.
-
-        :param psi: The first quantum state.
-        :type psi: :class:`numpy.ndarray`
-        :param psi_prime: The second quantum state.
-        :type psi: :class:`numpy.ndarray`
-
-        :return: The fidelity between the two states.
-        :rtype: float
-        """
-        return np.abs(np.vdot(psi, psi_prime))**2
-
     def setup_ports(self):
         """Set up the ports used to communicate classically with the other parties.
         """
         self.c_port_bob = self.node.ports['c_bob']
         self.c_port_dave = self.node.ports['c_dave']
 
+    @profiled
     def process_m_1(self):
         """Extract the message m_1 from the port with Bob.
         """
@@ -50,6 +38,7 @@ class EveProtocol(NodeProtocol):
 
         self.c_port_dave.tx_output(('m_1', self.m_1))
 
+    @profiled
     def process_message_dave(self):
         r"""Process the message we received from Dave. If Dave did not receive a photon, we forward that
         to Bob. Else, we decide what result to send to Bob by comparing
@@ -66,23 +55,17 @@ class EveProtocol(NodeProtocol):
         if measurement == 'NO_PHOTON':
             self.c_port_bob.tx_output(('NO_PHOTON', None))
         else:
-            ket_x = np.array([1, 0]) if not outcome else np.array([0, 1])
-
             theta = (m_0[0] + self.m_1) % (2 * self.m + 1)
             phi = (m_0[1] + self.m_1) % (2 * self.m + 1)
 
-            # The qubit using the gate we (Dave and Eve) used.
-            adv_qubit = np.array(PreparationGate().create_operator(self.theta, self.phi, self.m).arr @ ket_x)
-
-            # The qubit using the gate the verifiers used.
-            ver_qubit = np.array(PreparationGate().create_operator(theta, phi, self.m).arr @ ket_x)
-
-            f = self.fidelity(adv_qubit, ver_qubit)
+            # The decision follows from the fidelity between the qubit using the gate we (Dave and Eve) used and the
+            # qubit using the gate the verifiers used, looked up in the decision table.
+            table = get_basis_table(self.m)
+            decision = get_decision_table(self.m, self.node.cdata['l_fraction'])[table.index(self.theta, self.phi),
+                                                                               table.index(theta, phi)]
 
-            if f < (1 - self.node.cdata['l_fraction']) / 2:
-                outcome = (measurement + 1) % 2
-            elif f > (1 + self.node.cdata['l_fraction']) / 2:
-                outcome = measurement
+            if decision != ABSTAIN:
+                outcome = (measurement + int(decision)) % 2
 
             if outcome is not None:
                 self.c_port_bob.tx_output(('MEASUREMENT', outcome))
@@ -91,6 +74,7 @@ class EveProtocol(NodeProtocol):
 
         self.node.cdata['e_i'].append(outcome)
 
+    @profiled
     def run(self):
         """Continuously check for messages from Dave or Bob.
         """
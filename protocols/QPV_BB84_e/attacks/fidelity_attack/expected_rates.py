@@ -0,0 +1,274 @@
+from QPV_BB84_e.attacks.fidelity_attack.batch_attack import BatchAttack
+from QPV_BB84_e.custom_models.basis_table import get_basis_table
+
+import numpy as np
+
+"""
+expected_rates.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the exact expected correctness rate R_c and reporting rate R_r of the adversaries in the
+fidelity attack, and their variances per round. Instead of simulating rounds, the rates are summed over the
+distribution of the fidelity between the basis of the adversaries and that of the verifiers, which are drawn
+independently with the distribution of AliceProtocol.choose_basis_and_bit. The distribution is computed once
+per m, after which the rates for any distance and noise parameters take a few binary searches. The model is that
+of :class:`QPV_BB84_e.attacks.fidelity_attack.batch_attack.BatchAttack`.
+"""
+
+
+# The distributions that have been computed in this process, indexed by m.
+_distributions = {}
+
+
+def basis_probabilities(m):
+    r"""Returns the probability with which every basis in the basis table is chosen: :math:`\theta` is chosen
+    uniformly, and then :math:`\phi` uniformly from the values that are valid for :math:`\theta`.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+
+    :return: The probabilities, indexed by the index of the basis in the basis table.
+    :rtype: :class:`numpy.ndarray`
+    """
+    counts = np.diff(get_basis_table(m).offsets)
+
+    return np.repeat(1 / (m * counts), counts)
+
+
+class FidelityDistribution():
+    """This is a class representation of the distribution of the fidelity between the state of the adversaries and
+    that of the verifiers for a given m, when both bases are chosen at random. The distinct fidelities are sorted,
+    along with the cumulative probability and the cumulative expectation of the fidelity, so that the mass below or
+    above a threshold is found with a binary search.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param block_size: The number of bases of the adversaries per block when computing the fidelities.
+        Defaults to `256`.
+    :type block_size: optional, int
+    """
+    def __init__(self, m, block_size=256):
+        self.m = m
+
+        table = get_basis_table(m)
+        p = basis_probabilities(m)
+
+        fidelities = []
+        weights = []
+
+        for start in range(0, table.size, block_size):
+            # The same arithmetic as the decision table, so that fidelities at a threshold are decided alike.
+            index_a = np.arange(start, min(start + block_size, table.size))[:, np.newaxis]
+
+            fidelities.append(table.fidelities(index_a, np.arange(table.size)[np.newaxis, :]).ravel())
+            weights.append((p[index_a] * p[np.newaxis, :]).ravel())
+
+        self.values, inverse = np.unique(np.concatenate(fidelities), return_inverse=True)
+        weights = np.bincount(inverse.ravel(), weights=np.concatenate(weights), minlength=len(self.values))
+
+        self.cumulative_weight = np.concatenate([[0.], np.cumsum(weights)])
+        self.cumulative_fidelity = np.concatenate([[0.], np.cumsum(weights * self.values)])
+
+    def below(self, threshold):
+        """Returns the probability that the fidelity is below the threshold, and the expectation of the fidelity
+        over those pairs of bases.
+
+        :param threshold: The thresholds.
+        :type threshold: float or :class:`numpy.ndarray`
+
+        :return: The probabilities and the partial expectations.
+        :rtype: (float, float) or (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+        """
+        i = np.searchsorted(self.values, threshold, side='left')
+
+        return self.cumulative_weight[i], self.cumulative_fidelity[i]
+
+    def above(self, threshold):
+        """Returns the probability that the fidelity is above the threshold, and the expectation of the fidelity
+        over those pairs of bases.
+
+        :param threshold: The thresholds.
+        :type threshold: float or :class:`numpy.ndarray`
+
+        :return: The probabilities and the partial expectations.
+        :rtype: (float, float) or (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+        """
+        i = np.searchsorted(self.values, threshold, side='right')
+
+        return (self.cumulative_weight[-1] - self.cumulative_weight[i],
+                self.cumulative_fidelity[-1] - self.cumulative_fidelity[i])
+
+
+def get_fidelity_distribution(m):
+    """Returns the fidelity distribution for the given m, computing it if it has not been computed yet in this
+    process.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+
+    :return: The distribution.
+    :rtype: :class:`QPV_BB84_e.attacks.fidelity_attack.expected_rates.FidelityDistribution`
+    """
+    if m not in _distributions:
+        _distributions[m] = FidelityDistribution(m)
+
+    return _distributions[m]
+
+
+def expected_rates(m, l_fraction, bloch_length, prob_arrival):
+    """Returns the expected rates of the adversaries per round in which Alice sent a photon. Dave measures in a
+    random basis and gets the bit of the verifiers with probability 1 / 2 + s (f - 1 / 2), after which the
+    adversaries flip the bit if f < (1 - l_fraction) / 2, keep it if f > (1 + l_fraction) / 2, and abstain
+    otherwise.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param l_fraction: The fraction of rounds the honest prover loses.
+    :type l_fraction: float or :class:`numpy.ndarray`
+    :param bloch_length: The length s of the Bloch vector of the photon when Dave measures it.
+    :type bloch_length: float or :class:`numpy.ndarray`
+    :param prob_arrival: The probability that the photon reaches Dave in time.
+    :type prob_arrival: float or :class:`numpy.ndarray`
+
+    :return: A dictionary with the correctness rate `R_c`, the reporting rate `R_r` and the variances of a single
+        answered round, `var_R_c`, and of a single sent round, `var_R_r`.
+    :rtype: dict
+    """
+    distribution = get_fidelity_distribution(m)
+
+    weight_flip, fidelity_flip = distribution.below((1 - np.asarray(l_fraction)) / 2)
+    weight_keep, fidelity_keep = distribution.above((1 + np.asarray(l_fraction)) / 2)
+
+    answered = weight_flip + weight_keep
+    correct = (answered / 2 + bloch_length * (fidelity_keep - weight_keep / 2)
+               - bloch_length * (fidelity_flip - weight_flip / 2))
+
+    # As in the plots, the correctness rate is 0 if the adversaries never answer.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        R_c = np.where(answered > 0, correct / np.maximum(answered, 1e-300), 0.)
+
+    R_r = prob_arrival * answered
+
+    return {'R_c': R_c, 'R_r': R_r, 'var_R_c': R_c * (1 - R_c), 'var_R_r': R_r * (1 - R_r)}
+
+
+def attack_rates(m, P_A, P_B, P_D, P_E, P_v, charlie_prob_absorption=.3, charlie_detector_efficiency=.96,
+                 fidelity_loss=.005, prob_absorption=.3, p_loss_init=.2, p_loss_length=.18,
+                 fibre_fidelity_loss=(.047, 50)):
+    """Returns the expected rates of the adversaries for the given positions and noise parameters, with the
+    loss, noise and timing of :class:`QPV_BB84_e.attacks.fidelity_attack.batch_attack.BatchAttack`.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param P_A: The position of Alice on the real number line.
+    :type P_A: float
+    :param P_B: The position of Bob on the real number line.
+    :type P_B: float
+    :param P_D: The position of Dave on the real number line.
+    :type P_D: float
+    :param P_E: The position of Eve on the real number line.
+    :type P_E: float
+    :param P_v: The verification position on the real number line.
+    :type P_v: float
+    :param charlie_prob_absorption: The probability of absorption of a photon when travelling through a beam
+        splitter for Charlie. Defaults to `.3`.
+    :type charlie_prob_absorption: optional, float
+    :param charlie_detector_efficiency: The detection efficiency of the photon detector for Charlie.
+        Defaults to `.96`.
+    :type charlie_detector_efficiency: optional, float
+    :param fidelity_loss: The amount of loss in fidelity for qubit initialisation by Alice. Defaults to `.005`.
+    :type fidelity_loss: optional, float
+    :param prob_absorption: The probability of absorption of a photon when travelling through a beam splitter for
+        Alice. Defaults to `.3`.
+    :type prob_absorption: optional, float
+    :param p_loss_init: The probability of qubit loss as it enters the channel to Dave. Defaults to `.2`.
+    :type p_loss_init: optional, float
+    :param p_loss_length: The attenuation of photons in fibre in decibel per kilometre. Defaults to `.18`.
+    :type p_loss_length: optional, float
+    :param fibre_fidelity_loss: A tuple containing the fidelity loss due to the environment for a certain length
+        of fibre. Defaults to `(.047, 50)`.
+    :type fibre_fidelity_loss: optional, (float, float)
+
+    :return: The dictionary of :func:`expected_rates`, with the probability `prob_sent` that Alice sends the
+        photon of a round.
+    :rtype: dict
+    """
+    attack = BatchAttack(1, m, P_A, P_B, P_D, P_E, P_v, charlie_prob_absorption, charlie_detector_efficiency,
+                         fidelity_loss=fidelity_loss, prob_absorption=prob_absorption)
+
+    prob_survival, bloch_length = attack.model.quantum_channel(P_D - P_A, p_loss_init, p_loss_length,
+                                                               fibre_fidelity_loss)
+
+    rates = expected_rates(m, attack.l_fraction, bloch_length, prob_survival * attack.qubit_in_time)
+
+    # Alice sends the photon if it survives the preparation gate, and the X gate for b = 1.
+    rates['prob_sent'] = ((1 - prob_absorption) + (1 - prob_absorption)**2) / 2
+
+    return rates
+
+
+def run_stddevs(rates, n):
+    """Returns the standard deviations of the rates of a single run in which the adversaries answer n rounds, as
+    plotted around the means of the simulated runs. The correctness rate is over the n answered rounds, and the
+    reporting rate over the rounds in which a photon was sent among the first n rounds, which is approximated by
+    its expectation.
+
+    :param rates: The rates, as returned by :func:`attack_rates`.
+    :type rates: dict
+    :param n: The number of rounds to run the protocol for.
+    :type n: int
+
+    :return: The standard deviations of `R_c` and `R_r`.
+    :rtype: dict
+    """
+    return {'R_c': np.sqrt(rates['var_R_c'] / n), 'R_r': np.sqrt(rates['var_R_r'] / (n * rates['prob_sent']))}
+
+
+def rates_over_distance(m, distances, delta_p=.0001, v_pos=0, **kwargs):
+    r"""Returns the expected rates over distance, with the verifiers and the adversaries positioned as in
+    `adversaries_results_over_distance.py`.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param distances: The distances d, with Alice at -d and Bob at d.
+    :type distances: list
+    :param delta_p: The distance between the adversaries and the verifiers. Defaults to `.0001`.
+    :type delta_p: optional, float
+    :param v_pos: The verification position. Defaults to `0`.
+    :type v_pos: optional, float
+    :param \*\*kwargs: The noise parameters, see :func:`attack_rates`.
+    :type \*\*kwargs: dict
+
+    :return: A dictionary with the arrays of the rates and variances.
+    :rtype: dict
+    """
+    rates = [attack_rates(m, -d, d, -d + delta_p, d - delta_p, v_pos, **kwargs) for d in distances]
+
+    return {key: np.array([rate[key] for rate in rates]) for key in rates[0]}
+
+
+def rates_over_m(ms, d, delta_p=.00001, v_pos=0, **kwargs):
+    r"""Returns the expected rates over m, with the verifiers and the adversaries positioned as in
+    `adversaries_results_over_m.py`.
+
+    :param ms: The values of m.
+    :type ms: list
+    :param d: The distance d, with Alice at -d and Bob at d.
+    :type d: float
+    :param delta_p: The distance between the adversaries and the verifiers. Defaults to `.00001`.
+    :type delta_p: optional, float
+    :param v_pos: The verification position. Defaults to `0`.
+    :type v_pos: optional, float
+    :param \*\*kwargs: The noise parameters, see :func:`attack_rates`.
+    :type \*\*kwargs: dict
+
+    :return: A dictionary with the arrays of the rates and variances.
+    :rtype: dict
+    """
+    rates = [attack_rates(m, -d, d, -d + delta_p, d - delta_p, v_pos, **kwargs) for m in ms]
+
+    return {key: np.array([rate[key] for rate in rates]) for key in rates[0]}
@@ -0,0 +1,148 @@
+from QPV_BB84_e.verifiers.outcomes import INCORRECT, CORRECT, NO_PHOTON, NOT_SENT
+from QPV_BB84_e.verifiers.run_stats import run_stats
+from QPV_BB84_e.experiments.result_store import ResultStore
+from QPV_BB84_e.experiments.aggregate import aggregate_store
+from QPV_BB84_e.experiments.roc import success_surface
+from QPV_BB84_e.experiments.bootstrap import bootstrap_surface
+from QPV_BB84_e.benchmarks.benchmark import measure, benchmark_record
+
+import os
+import tempfile
+import numpy as np
+
+"""
+analysis.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the benchmarks of the analysis of the results, on a synthetic corpus of honest and adversarial
+runs over distance. The corpus is written to result stores in a temporary directory, after which the aggregation
+of the rates, the success rates over alpha and their bootstrap intervals are timed.
+"""
+
+
+# The distances of the synthetic sweep in km.
+DISTANCES = [float(d) for d in range(0, 50, 5)]
+
+# The probability that an answer is correct, for the honest prover and the adversaries.
+CORRECTNESS = {'honest': .98, 'adv': .85}
+
+
+def synthetic_run(rng, d, n, correctness):
+    """Returns the results of Alice and Bob for a synthetic run, in which rounds are drawn until n of them are
+    answered. Photons are absorbed at the source and lost over the fibre as in the experiments.
+
+    :param rng: The random number generator.
+    :type rng: :class:`numpy.random.Generator`
+    :param d: The distance from the verifiers to the verification position in kilometres.
+    :type d: float
+    :param n: The number of answered rounds.
+    :type n: int
+    :param correctness: The probability that an answer is correct.
+    :type correctness: float
+
+    :return: The results of Alice and of Bob.
+    :rtype: (dict, dict)
+    """
+    sent = .7 * .85
+    answered = sent * .8 * .7 * .96 * 10**(-.18 * d / 10)
+
+    probabilities = np.array([answered * (1 - correctness), answered * correctness, sent - answered, 1 - sent])
+    r = rng.choice([INCORRECT, CORRECT, NO_PHOTON, NOT_SENT], size=int(2 * n / answered) + 100,
+                   p=probabilities).astype(np.int8)
+
+    # Cut the rounds at the n-th answer.
+    r = r[:np.flatnonzero(r <= CORRECT)[n - 1] + 1]
+    t = rng.random(len(r)) < .99
+
+    alice_data = {'r_i': r, 't_i': t, 'm_0_i': rng.integers(-50, 50, len(r))}
+    bob_data = {'r_i': np.where(r == NOT_SENT, NO_PHOTON, r).astype(np.int8), 't_i': t,
+                'm_1_i': rng.integers(0, 101, len(r))}
+
+    return alice_data, bob_data
+
+
+def synthetic_corpus(path, distances, runs, n, correctness, seed=0):
+    """Writes a synthetic sweep over distance to a result store.
+
+    :param path: The directory of the store.
+    :type path: str
+    :param distances: The distances of the sweep.
+    :type distances: list
+    :param runs: The number of runs per distance.
+    :type runs: int
+    :param n: The number of answered rounds per run.
+    :type n: int
+    :param correctness: The probability that an answer is correct.
+    :type correctness: float
+    :param seed: The seed of the random number generator. Defaults to `0`.
+    :type seed: optional, int
+
+    :return: The total number of rounds of Alice.
+    :rtype: int
+    """
+    rng = np.random.default_rng(seed)
+    store = ResultStore(path, shard='synthetic')
+    rounds = 0
+
+    for d in distances:
+        for i in range(runs):
+            alice_data, bob_data = synthetic_run(rng, d, n, correctness)
+            rounds += len(alice_data['r_i'])
+
+            store.append(d, i, alice_data, bob_data, d, n, 50, 0, stats=run_stats(alice_data))
+
+    return rounds
+
+
+def benchmark_analysis(distances=DISTANCES, runs=100, n=1000, resamples=200, repeats=3, seed=0):
+    """Times the analysis pipeline on a synthetic corpus.
+
+    :param distances: The distances of the sweep. Defaults to `DISTANCES`.
+    :type distances: optional, list
+    :param runs: The number of runs per distance. Defaults to `100`.
+    :type runs: optional, int
+    :param n: The number of answered rounds per run. Defaults to `1000`.
+    :type n: optional, int
+    :param resamples: The number of bootstrap resamples. Defaults to `200`.
+    :type resamples: optional, int
+    :param repeats: The number of timed calls per stage. Defaults to `3`.
+    :type repeats: optional, int
+    :param seed: The seed of the corpus and of the bootstrap. Defaults to `0`.
+    :type seed: optional, int
+
+    :return: The records of the benchmarks by name, see
+        :func:`QPV_BB84_e.benchmarks.benchmark.benchmark_record`.
+    :rtype: dict
+    """
+    alphas = np.linspace(0, 1, 101)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as path:
+        rounds = {}
+
+        for corpus, correctness in CORRECTNESS.items():
+            rounds[corpus] = synthetic_corpus(os.path.join(path, corpus), distances, runs, n, correctness, seed)
+
+        for corpus in CORRECTNESS:
+            wall_time, _, peak_memory = measure(
+                lambda: aggregate_store(ResultStore(os.path.join(path, corpus)), distances, runs, n), repeats)
+
+            results[f'aggregate_{corpus}'] = benchmark_record(wall_time, rounds[corpus], np.nan, peak_memory)
+
+        honest = aggregate_store(ResultStore(os.path.join(path, 'honest')), distances, runs, n)
+        adv = aggregate_store(ResultStore(os.path.join(path, 'adv')), distances, runs, n)
+
+    total = rounds['honest'] + rounds['adv']
+
+    wall_time, _, peak_memory = measure(lambda: success_surface(honest, adv, alphas), repeats)
+    results['success_surface'] = benchmark_record(wall_time, total, np.nan, peak_memory)
+
+    wall_time, _, peak_memory = measure(lambda: bootstrap_surface(honest, adv, alphas, resamples, seed=seed,
+                                                                  processes=1), repeats)
+    results['bootstrap_surface'] = benchmark_record(wall_time, total, np.nan, peak_memory)
+
+    return results
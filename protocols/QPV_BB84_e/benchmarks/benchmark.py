@@ -0,0 +1,112 @@
+import json
+import time
+import tracemalloc
+
+"""
+benchmark.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the measurement of the benchmarks of the QPV_BB84_e protocol, and the comparison of their
+results with a saved baseline. A benchmark is timed over a number of repeats, of which the fastest is kept, and its
+peak memory is measured in a separate traced call, so that tracing does not affect the timing.
+"""
+
+
+def measure(function, repeats=3):
+    """Times a function and measures its peak memory.
+
+    :param function: The function to benchmark, without arguments.
+    :type function: function
+    :param repeats: The number of timed calls. Defaults to `3`.
+    :type repeats: optional, int
+
+    :return: The fastest wall-clock time in seconds, the result of the last call and the peak memory in bytes that
+        was allocated during a call.
+    :rtype: (float, object, int)
+    """
+    times = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+
+    try:
+        function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(times), result, peak_memory
+
+
+def benchmark_record(wall_time, rounds, events, peak_memory):
+    """Returns the record of a benchmark.
+
+    :param wall_time: The wall-clock time in seconds.
+    :type wall_time: float
+    :param rounds: The number of rounds that were simulated or analysed.
+    :type rounds: int
+    :param events: The number of events of the simulation, or `nan`.
+    :type events: float
+    :param peak_memory: The peak memory in bytes.
+    :type peak_memory: int
+
+    :return: A dictionary with the wall-clock time, the rounds and events per second and the peak memory.
+    :rtype: dict
+    """
+    return {
+        'wall_time': wall_time,
+        'rounds_per_second': rounds / wall_time,
+        'events_per_second': events / wall_time,
+        'peak_memory': peak_memory
+    }
+
+
+def save_baseline(results, filename):
+    """Saves the results of the benchmarks as a baseline.
+
+    :param results: The records of the benchmarks by name.
+    :type results: dict
+    :param filename: The name of the file.
+    :type filename: str
+    """
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_baseline(filename):
+    """Loads a baseline.
+
+    :param filename: The name of the file.
+    :type filename: str
+
+    :return: The records of the benchmarks by name.
+    :rtype: dict
+    """
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def regressions(results, baseline, tolerance=.2):
+    """Returns the benchmarks that are slower than in the baseline by more than the tolerance. Benchmarks that are
+    not in the baseline are left out.
+
+    :param results: The records of the benchmarks by name.
+    :type results: dict
+    :param baseline: The records of the baseline by name.
+    :type baseline: dict
+    :param tolerance: The allowed relative increase of the wall-clock time. Defaults to `.2`.
+    :type tolerance: optional, float
+
+    :return: A dictionary with, per regressed benchmark, its wall-clock time and that of the baseline.
+    :rtype: dict
+    """
+    return {name: (record['wall_time'], baseline[name]['wall_time']) for name, record in results.items()
+            if name in baseline and record['wall_time'] > (1 + tolerance) * baseline[name]['wall_time']}
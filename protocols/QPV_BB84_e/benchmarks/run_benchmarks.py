@@ -0,0 +1,60 @@
+from QPV_BB84_e.benchmarks.benchmark import save_baseline, load_baseline, regressions
+from QPV_BB84_e.benchmarks.simulation import benchmark_simulation
+from QPV_BB84_e.benchmarks.analysis import benchmark_analysis
+
+import sys
+import argparse
+
+"""
+run_benchmarks.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file runs the benchmarks of the simulations and of the analysis, prints their results and optionally saves
+them as a baseline or compares them with one. The exit status is nonzero when a benchmark regressed.
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the simulations and the analysis of the results.')
+    parser.add_argument('--suite', choices=['all', 'simulation', 'analysis'], default='all')
+    parser.add_argument('--repeats', type=int, default=3, help='The number of timed calls per benchmark.')
+    parser.add_argument('--save-baseline', metavar='file', default=None, help='Save the results as a baseline.')
+    parser.add_argument('--baseline', metavar='file', default=None, help='Compare the results with a baseline.')
+    parser.add_argument('--tolerance', type=float, default=.2,
+                        help='The allowed relative increase of the wall-clock time over the baseline.')
+
+    args = parser.parse_args()
+
+    results = {}
+
+    if args.suite in ['all', 'simulation']:
+        results.update(benchmark_simulation(repeats=args.repeats))
+
+    if args.suite in ['all', 'analysis']:
+        results.update(benchmark_analysis(repeats=args.repeats))
+
+    print(f'{"benchmark":<32}{"wall time (s)":>16}{"rounds/s":>16}{"events/s":>16}{"peak memory (MB)":>20}')
+
+    for name, record in results.items():
+        print(f'{name:<32}{record["wall_time"]:>16.4f}{record["rounds_per_second"]:>16.0f}'
+              f'{record["events_per_second"]:>16.0f}{record["peak_memory"] / 2**20:>20.1f}')
+
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+
+    if args.baseline:
+        regressed = regressions(results, load_baseline(args.baseline), args.tolerance)
+
+        for name, (wall_time, baseline_time) in regressed.items():
+            print(f'Regression in {name}: {wall_time:.4f} s against {baseline_time:.4f} s in the baseline.')
+
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+from QPV_BB84_e.honest_player.charlie import Charlie
+from QPV_BB84_e.attacks.fidelity_attack.attack import Attack
+from QPV_BB84_e.verifiers.session import Session
+from QPV_BB84_e.benchmarks.benchmark import measure, benchmark_record
+
+import numpy as np
+
+"""
+simulation.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the benchmarks of the simulations of the honest prover Charlie and of the fidelity attack on a
+fixed grid of n, m and distances. The network is built once per point of the grid, as in the experiments, and
+every timed run is reset with the same seed, so that the same rounds are simulated.
+"""
+
+
+# The points (n, m, d) of the grid, with the distance from the verifiers to the verification position in km.
+GRID = [(n, m, d) for n in [100, 1000] for m in [2, 50] for d in [.1, 5., 20.]]
+
+# The distance between the adversaries and the verification position.
+DELTA_P = .0001
+
+
+def player_args(player, n, m, d):
+    """Returns the class and arguments of a player, positioned as in the experiments.
+
+    :param player: The player, `charlie` or `attack`.
+    :type player: str
+    :param n: The number of rounds to run the protocol for.
+    :type n: int
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param d: The distance from the verifiers to the verification position in kilometres.
+    :type d: float
+
+    :return: The class of the player and its positional arguments.
+    :rtype: (type, tuple)
+    """
+    if player == 'charlie':
+        return Charlie, (n, m, -d, 0, d, 0)
+
+    return Attack, (n, m, -d, d, -d + DELTA_P, d - DELTA_P, 0)
+
+
+def benchmark_simulation(grid=GRID, players=('charlie', 'attack'), repeats=3, seed=0):
+    """Times the runs of the players on a grid.
+
+    :param grid: The points (n, m, d) of the grid. Defaults to `GRID`.
+    :type grid: optional, list
+    :param players: The players to benchmark. Defaults to both.
+    :type players: optional, tuple
+    :param repeats: The number of timed runs per point. Defaults to `3`.
+    :type repeats: optional, int
+    :param seed: The seed of every run. Defaults to `0`.
+    :type seed: optional, int
+
+    :return: The records of the benchmarks by name, see
+        :func:`QPV_BB84_e.benchmarks.benchmark.benchmark_record`.
+    :rtype: dict
+    """
+    results = {}
+
+    for player in players:
+        for n, m, d in grid:
+            player_class, args = player_args(player, n, m, d)
+            session = Session(player_class, *args)
+
+            wall_time, (stats, _, _), peak_memory = measure(lambda: session.run(n, seed), repeats)
+
+            results[f'{player}_n{n}_m{m}_d{d}'] = benchmark_record(wall_time, stats['rounds'],
+                                                                  stats.get('events', np.nan), peak_memory)
+
+    return results
@@ -0,0 +1,235 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import netsquid as ns
+
+"""
+basis_table.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains a table of all bases that can be chosen in the QPV_BB84_e protocol for a given m. The matrices
+of the preparation gate and their inverses are computed once, so that all parties can look them up by index.
+The table can be shared across processes through shared memory.
+"""
+
+
+# The tables that have been built or attached in this process, indexed by m.
+_tables = {}
+
+
+def gate_matrix(theta, phi, m):
+    r"""Returns the matrix of the preparation gate for the given parameters, see
+    :class:`QPV_BB84_e.custom_models.quantum_gates.PreparationGate`.
+
+    :param theta: The :math:`\theta` parameter in the matrix.
+    :type theta: float
+    :param phi: The :math:`\phi` parameter in the matrix.
+    :type phi: float
+    :param m: The m parameter in the matrix.
+    :type m: float
+
+    :return: The matrix :math:`U` with the given parameters.
+    :rtype: :class:`numpy.ndarray`
+    """
+    sigma = np.arccos(2 * (theta / m) - 1)
+    delta = ((phi * np.pi) / (m * np.sin(sigma))) if sigma != 0 else 0
+
+    cos = np.cos(sigma / 2)
+    sin = np.sin(sigma / 2)
+
+    return np.nan_to_num(np.array([[cos, np.e**(1j * delta) * sin],
+                                   [-np.e**(-1j * delta) * sin, cos]]))
+
+
+class BasisTable():
+    r"""This is a class representation of the table of all valid bases :math:`(\theta, \phi)` for a given m.
+    The bases are ordered by :math:`\theta` and then by :math:`\phi`, and the matrices of the preparation gate
+    and their inverses are stored as one contiguous array.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param buffer: A buffer holding the matrices, for example in shared memory. Defaults to `None`, in which
+        case the matrices are computed.
+    :type buffer: optional, buffer
+    """
+    def __init__(self, m, buffer=None):
+        self.m = m
+
+        # The number of values for phi per value of theta, as chosen in AliceProtocol.choose_basis_and_bit.
+        theta = np.arange(m)
+        counts = np.round(2 * m * np.sin(np.arccos(2 * (theta / m) - 1))).astype(int) + 1
+
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.size = int(self.offsets[-1])
+        self.theta = np.repeat(theta, counts)
+        self.phi = np.arange(self.size) - np.repeat(self.offsets[:-1], counts)
+
+        if buffer is None:
+            self.matrices = np.empty((2, self.size, 2, 2), dtype=complex)
+
+            for i, (theta, phi) in enumerate(zip(self.theta.tolist(), self.phi.tolist())):
+                self.matrices[0, i] = gate_matrix(theta, phi, m)
+
+            # The gates are unitary, so the inverse is the conjugate transpose.
+            self.matrices[1] = np.conj(np.swapaxes(self.matrices[0], 1, 2))
+        else:
+            self.matrices = np.ndarray((2, self.size, 2, 2), dtype=complex, buffer=buffer)
+
+        self.operators, self.inverses = self.matrices
+        self.__ns_operators = {}
+        self.__shared_memory = None
+
+    def index(self, theta, phi):
+        r"""Returns the index in the table of the given bases.
+
+        :param theta: The :math:`\theta` parameters.
+        :type theta: int or :class:`numpy.ndarray`
+        :param phi: The :math:`\phi` parameters.
+        :type phi: int or :class:`numpy.ndarray`
+
+        :return: The indices of the bases.
+        :rtype: int or :class:`numpy.ndarray`
+        """
+        return self.offsets[theta] + phi
+
+    def lookup(self, theta, phi):
+        r"""Returns the index in the table of a single basis, or `None` if it is not a valid basis.
+
+        :param theta: The :math:`\theta` parameter.
+        :type theta: float
+        :param phi: The :math:`\phi` parameter.
+        :type phi: float
+
+        :return: The index of the basis, or `None`.
+        :rtype: int
+        """
+        if theta != int(theta) or phi != int(phi) or not 0 <= theta < self.m:
+            return None
+
+        index = self.offsets[int(theta)] + int(phi)
+
+        return int(index) if 0 <= phi and index < self.offsets[int(theta) + 1] else None
+
+    def operator(self, index, inverse=False):
+        """Returns the operator object of the preparation gate for the basis with the given index.
+        The operator objects are created once and reused.
+
+        :param index: The index of the basis.
+        :type index: int
+        :param inverse: Whether to return :math:`U` or :math:`U^\\dagger`. Defaults to `False`.
+        :type inverse: optional, bool
+
+        :return: The operator object.
+        :rtype: :class:`netsquid.qubits.Operator`
+        """
+        key = (index, inverse)
+
+        if key not in self.__ns_operators:
+            self.__ns_operators[key] = ns.qubits.Operator('PreparationGate', self.matrices[int(inverse), index].copy())
+
+        return self.__ns_operators[key]
+
+    def fidelities(self, index_a, index_v):
+        r"""Returns the fidelities between :math:`B_A | x \rangle` and :math:`B_V | x \rangle`, where :math:`B_A`
+        and :math:`B_V` are the gates of the given bases. As the gates are in :math:`SU(2)`, the fidelity is the
+        same for both outcomes :math:`x`.
+
+        :param index_a: The indices of the bases of :math:`B_A`.
+        :type index_a: int or :class:`numpy.ndarray`
+        :param index_v: The indices of the bases of :math:`B_V`.
+        :type index_v: int or :class:`numpy.ndarray`
+
+        :return: The fidelities.
+        :rtype: float or :class:`numpy.ndarray`
+        """
+        column_a = self.operators[index_a, :, 0]
+        column_v = self.operators[index_v, :, 0]
+
+        return np.abs(np.sum(np.conj(column_a) * column_v, axis=-1))**2
+
+    def share(self):
+        """Copies the matrices to shared memory, so that other processes can attach to the table without
+        computing it.
+
+        :return: The name of the shared memory block.
+        :rtype: str
+        """
+        if self.__shared_memory is None:
+            self.__shared_memory = shared_memory.SharedMemory(create=True, size=self.matrices.nbytes)
+
+            matrices = np.ndarray(self.matrices.shape, dtype=complex, buffer=self.__shared_memory.buf)
+            matrices[:] = self.matrices
+
+            self.matrices = matrices
+            self.operators, self.inverses = self.matrices
+
+        return self.__shared_memory.name
+
+    @classmethod
+    def attach(cls, m, name):
+        """Returns a table for the given m that uses the matrices in an existing shared memory block.
+
+        :param m: The parameter in the protocol giving the amount of bases to encode in.
+        :type m: int
+        :param name: The name of the shared memory block, as returned by :meth:`share`.
+        :type name: str
+
+        :return: The table.
+        :rtype: :class:`QPV_BB84_e.custom_models.basis_table.BasisTable`
+        """
+        block = shared_memory.SharedMemory(name=name)
+
+        table = cls(m, buffer=block.buf)
+        table.__shared_memory = block
+
+        return table
+
+    def close(self, unlink=False):
+        """Releases the shared memory block of the table, if any.
+
+        :param unlink: Whether to also destroy the block. Should only be done by the process that shared the table.
+            Defaults to `False`.
+        :type unlink: optional, bool
+        """
+        if self.__shared_memory is not None:
+            self.matrices = self.matrices.copy()
+            self.operators, self.inverses = self.matrices
+
+            self.__shared_memory.close()
+
+            if unlink:
+                self.__shared_memory.unlink()
+
+            self.__shared_memory = None
+
+
+def get_basis_table(m):
+    """Returns the basis table for the given m, building it if it has not been built or attached yet
+    in this process.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+
+    :return: The table.
+    :rtype: :class:`QPV_BB84_e.custom_models.basis_table.BasisTable`
+    """
+    if m not in _tables:
+        _tables[m] = BasisTable(m)
+
+    return _tables[m]
+
+
+def attach_basis_table(m, name):
+    """Attaches to a basis table in shared memory, such that :func:`get_basis_table` returns it in this process.
+    This is meant to be used in the initialiser of worker processes.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param name: The name of the shared memory block, as returned by :meth:`BasisTable.share`.
+    :type name: str
+    """
+    _tables[m] = BasisTable.attach(m, name)
@@ -1,6 +1,9 @@
 from netsquid.components.models.qerrormodels import QuantumErrorModel
 from netsquid.qubits import qubitapi
+from QPV_BB84_e.verifiers.profiler import profiled
 
+import functools
+import math
 import numpy as np
 
 """
@@ -15,6 +18,54 @@ This file contains the various error models used to realistically implement the
 """
 
 
+@functools.lru_cache(maxsize=4096)
+def fibre_depolarisation_parameter(purity, fidelity_loss, length_ratio):
+    r"""Returns the parameter :math:`\xi'` of the depolarisation channel of an optical fibre for a qubit, in closed
+    form. For a qubit with Bloch vector length :math:`s`, with :math:`s^2 = 2 \mathrm{tr}(\rho'^2) - 1`, the
+    fidelity :math:`1 - f` after the channel is reached for
+
+    .. math:: \xi' = 1 - 2f \pm \frac{2}{s} \sqrt{(1 - s^2) f (1 - f)},
+
+    where the sign is chosen as in :meth:`OpticalFibreErrorModel.depolarisation_parameter`. The results are cached,
+    as all qubits in the protocol enter the fibres with the same purity.
+
+    :param purity: The purity :math:`\mathrm{tr}(\rho'^2)` of the qubit entering the fibre, rounded to 12 decimals.
+    :type purity: float
+    :param fidelity_loss: The loss in fidelity over the length of the fidelity loss.
+    :type fidelity_loss: float
+    :param length_ratio: The length of the fibre divided by the length of the fidelity loss.
+    :type length_ratio: float
+
+    :return: The depolarisation parameter :math:`\xi'` for the length of the fibre.
+    :rtype: float
+    """
+    s_sq = max(2 * purity - 1, 0.)
+    s = math.sqrt(s_sq)
+    f = fidelity_loss
+
+    # The maximally mixed state is left as is by any depolarisation channel.
+    if s == 0:
+        return 1.
+
+    root = 2 * math.sqrt(max((1 - s_sq) * f * (1 - f), 0.)) / s
+
+    def fidelity(xi_prime):
+        # The fidelity as computed in the general method, where the square root vanishes when negative.
+        return .5 + xi_prime * s_sq / 2 + math.sqrt(max((1 - s_sq) * (1 - xi_prime**2 * s_sq), 0.)) / 2
+
+    # Check whether we need the negative or positive square root in the calculation, with the tolerance of isclose().
+    xi_prime = 1 - 2 * f + root
+
+    if abs(fidelity(xi_prime) - (1 - f)) > 1e-08 + 1e-05 * abs(1 - f):
+        xi_prime = 1 - 2 * f - root
+
+    # Check for the complete positivity condition.
+    assert(xi_prime >= -(1/3) and xi_prime <= 1)
+
+    # Change the parameter for the loss model according to the length of the channel.
+    return float(np.power(xi_prime, length_ratio))
+
+
 class PhotonGeneratorErrorModel(QuantumErrorModel):
     r"""This is a class representation of the photon generator loss model. In this model we use the
     theoretical quantum depolarisation channel to simulate reality.
@@ -29,6 +80,7 @@ class PhotonGeneratorErrorModel(QuantumErrorModel):
 
         self.fidelity_loss = fidelity_loss
 
+    @profiled
     def error_operation(self, qubits, delta_time=0, **kwargs):
         r"""Performs the error operation on the qiven qubits.
 
@@ -44,15 +96,31 @@ class PhotonGeneratorErrorModel(QuantumErrorModel):
             rho = qubit.qstate.qrepr.dm
             d = np.shape(rho)[0]
 
-            # Calculate xi as described in the thesis.
-            xi = (1 - 2 * self.fidelity_loss) / (2 * np.trace(rho @ rho) - 1)
-
-            # Check for the complete positivity condition.
-            assert(xi >= -(1/(d**2 - 1)) and xi <= 1)
+            xi = self.depolarisation_parameter(rho)
 
             new_rho = xi * rho + ((1 - xi) / d) * np.eye(d)
             qubitapi.assign_qstate([qubit], new_rho)
 
+    def depolarisation_parameter(self, rho):
+        r"""Returns the parameter :math:`\xi` of the depolarisation channel that is applied to a qubit
+        in the state :math:`\rho`.
+
+        :param rho: The density matrix of the qubit.
+        :type rho: :class:`numpy.ndarray`
+
+        :return: The depolarisation parameter :math:`\xi`.
+        :rtype: float
+        """
+        d = np.shape(rho)[0]
+
+        # Calculate xi as described in the thesis.
+        xi = np.real((1 - 2 * self.fidelity_loss) / (2 * np.trace(rho @ rho) - 1))
+
+        # Check for the complete positivity condition.
+        assert(xi >= -(1/(d**2 - 1)) and xi <= 1)
+
+        return xi
+
 
 class OpticalFibreErrorModel(QuantumErrorModel):
     r"""This is a class representation of the optical fibre loss model. In this model we use the
@@ -72,6 +140,7 @@ class OpticalFibreErrorModel(QuantumErrorModel):
         self.length = length
         self.fidelity_loss, self.fidelity_loss_length = fidelity_loss
 
+    @profiled
     def error_operation(self, qubits, delta_time=0, **kwargs):
         r"""Performs the error operation on the qiven qubits.
 
@@ -88,38 +157,150 @@ class OpticalFibreErrorModel(QuantumErrorModel):
             if not qubit.qstate:
                 return
 
-            # Calculate the value for xi_prime as described in the thesis.
             rho_prime = qubit.qstate.qrepr.dm
-            rho_prime_sq = rho_prime @ rho_prime
             dim = np.shape(rho_prime)[0]
 
-            a = np.trace(rho_prime_sq - (rho_prime / 2))
-            b = np.trace(rho_prime / 2)
-            c = np.linalg.det(rho_prime_sq - (rho_prime / 2))
-            d = np.linalg.det(rho_prime / 2)
-            f = self.fidelity_loss
+            xi_prime = self.depolarisation_parameter(rho_prime)
+
+            new_rho = xi_prime * rho_prime + ((1 - xi_prime) / dim) * np.eye(dim)
+
+            qubitapi.assign_qstate([qubit], new_rho)
 
-            def xi_prime(sign):
-                return np.real(((sign * 2*np.sqrt(a**2*d + b**2*c + 2*b*c*f - 2*b*c - 4*c*d + c*f**2 - 2*c*f + c)
-                               + a * (-b) - a * f + a) / (a**2 - 4 * c)))
+    def depolarisation_parameter(self, rho_prime):
+        r"""Returns the parameter :math:`\xi'` of the depolarisation channel that is applied to a qubit
+        in the state :math:`\rho'` travelling through the full length of the fibre.
 
-            def fidelity(xi_prime):
-                return np.real(np.trace(xi_prime * (rho_prime_sq - (rho_prime / 2)) + (rho_prime / 2)) +
-                               2 * np.sqrt(xi_prime**2 * np.linalg.det((rho_prime_sq - (rho_prime / 2)))
-                                           + np.linalg.det((rho_prime / 2))))
+        :param rho_prime: The density matrix of the qubit entering the fibre.
+        :type rho_prime: :class:`numpy.ndarray`
 
-            # Check whether we need the negative or positive square root in the calculation.
-            xi_prime = xi_prime(1) if np.isclose(fidelity(xi_prime(1)), 1 - f) else xi_prime(-1)
+        :return: The depolarisation parameter :math:`\xi'` for the length of the fibre.
+        :rtype: float
+        """
+        dim = np.shape(rho_prime)[0]
 
-            # Check for the complete positivity condition.
-            assert(xi_prime >= -(1/(dim**2 - 1)) and xi_prime <= 1)
+        # A qubit only depends on its purity, for which the closed form is used.
+        if dim == 2:
+            purity = float(np.vdot(rho_prime, rho_prime).real)
 
-            # Change the parameter for the loss model according to the length of the channel.
-            xi_prime = xi_prime**(self.length / self.fidelity_loss_length)
+            return fibre_depolarisation_parameter(round(purity, 12), self.fidelity_loss,
+                                                  self.length / self.fidelity_loss_length)
 
-            new_rho = xi_prime * rho_prime + ((1 - xi_prime) / dim) * np.eye(dim)
+        # Calculate the value for xi_prime as described in the thesis.
+        rho_prime_sq = rho_prime @ rho_prime
 
-            qubitapi.assign_qstate([qubit], new_rho)
+        a = np.trace(rho_prime_sq - (rho_prime / 2))
+        b = np.trace(rho_prime / 2)
+        c = np.linalg.det(rho_prime_sq - (rho_prime / 2))
+        d = np.linalg.det(rho_prime / 2)
+        f = self.fidelity_loss
+
+        def xi_prime(sign):
+            return np.real(((sign * 2*np.sqrt(a**2*d + b**2*c + 2*b*c*f - 2*b*c - 4*c*d + c*f**2 - 2*c*f + c)
+                           + a * (-b) - a * f + a) / (a**2 - 4 * c)))
+
+        def fidelity(xi_prime):
+            return np.real(np.trace(xi_prime * (rho_prime_sq - (rho_prime / 2)) + (rho_prime / 2)) +
+                           2 * np.sqrt(xi_prime**2 * np.linalg.det((rho_prime_sq - (rho_prime / 2)))
+                                       + np.linalg.det((rho_prime / 2))))
+
+        # Check whether we need the negative or positive square root in the calculation.
+        xi_prime = xi_prime(1) if np.isclose(fidelity(xi_prime(1)), 1 - f) else xi_prime(-1)
+
+        # Check for the complete positivity condition.
+        assert(xi_prime >= -(1/(dim**2 - 1)) and xi_prime <= 1)
+
+        # Change the parameter for the loss model according to the length of the channel.
+        return xi_prime**(self.length / self.fidelity_loss_length)
+
+
+def compiled_depolarisation_parameter(source_fidelity_loss, fidelity_loss, length_ratio):
+    r"""Returns the parameter of the single depolarisation channel that is equivalent to the photon generator of
+    Alice followed by an optical fibre. The generator depolarises :math:`| 0 \rangle` to a Bloch vector length of
+    :math:`1 - 2 f_s`, the gates in between are unitary and commute with depolarisation, and the fibre then
+    depolarises with the parameter :math:`\xi'` for that purity.
+
+    :param source_fidelity_loss: The loss in fidelity of the photon generator.
+    :type source_fidelity_loss: float
+    :param fidelity_loss: The loss in fidelity of the fibre over the length of the fidelity loss.
+    :type fidelity_loss: float
+    :param length_ratio: The length of the fibre divided by the length of the fidelity loss.
+    :type length_ratio: float
+
+    :return: The depolarisation parameter of the composed channel.
+    :rtype: float
+    """
+    s = 1 - 2 * source_fidelity_loss
+
+    return s * fibre_depolarisation_parameter(round((1 + s**2) / 2, 12), fidelity_loss, length_ratio)
+
+
+class CompiledChannelErrorModel(QuantumErrorModel):
+    r"""This is a class representation of the photon generator of Alice and an optical fibre composed into a
+    single depolarisation channel, with a parameter that is computed once for the length of the fibre. The photons
+    must enter the fibre as prepared by a noiseless generator, see
+    :func:`QPV_BB84_e.custom_models.error_models.compiled_depolarisation_parameter`.
+
+    In validation mode, the photons enter the fibre with the noise of the generator applied, and the staged fibre
+    model is applied instead. The length of the Bloch vector of every photon is then compared with that of the
+    composed channel.
+
+    :param source_fidelity_loss: The loss in fidelity of the photon generator.
+    :type source_fidelity_loss: float
+    :param fidelity_loss: A tuple containing the fidelity loss due to the environment for a certain length of fibre.
+    :type fidelity_loss: (float, float)
+    :param length: The length of the fibre connection in kilometres.
+    :type length: float
+    :param validate: Whether to apply the staged model and compare. Defaults to `False`.
+    :type validate: optional, bool
+    :param \*\*kwargs: Keyword arguments.
+    :type \*\*kwargs: dict
+    """
+    def __init__(self, source_fidelity_loss, fidelity_loss, length, validate=False, **kwargs):
+        super().__init__(**kwargs)
+
+        self.validate = validate
+        self.xi = compiled_depolarisation_parameter(source_fidelity_loss, fidelity_loss[0],
+                                                    length / fidelity_loss[1])
+
+        self.__staged_model = OpticalFibreErrorModel(fidelity_loss, length) if validate else None
+
+    @profiled
+    def error_operation(self, qubits, delta_time=0, **kwargs):
+        r"""Performs the error operation on the qiven qubits.
+
+        :param qubits: A tuple of qubits.
+        :type qubits: (:class:`netsquid.qubits.qubit.Qubit`, :class:`netsquid.qubits.qubit.Qubit`)
+        :param delta_time: The amount of time the qubits have spent on the component in nanoseconds.
+            Defaults to `0`.
+        :type delta_time: optional, float
+        :param \*\*kwargs: Keyword arguments.
+        :type \*\*kwargs: dict
+
+        :raises ValueError: When in validation mode the staged model gives a different state.
+        """
+        if self.validate:
+            self.__staged_model.error_operation(qubits, delta_time, **kwargs)
+
+            for qubit in qubits:
+                if qubit.qstate:
+                    rho = qubit.qstate.qrepr.dm
+                    s = np.sqrt(max(2 * np.vdot(rho, rho).real - 1, 0.))
+
+                    if not np.isclose(s, self.xi):
+                        raise ValueError(f'The staged channel gives a Bloch vector length of {s}, the compiled '
+                                         f'channel {self.xi}.')
+
+            return
+
+        for qubit in qubits:
+            # Do nothing if the qubit has been lost.
+            if not qubit.qstate:
+                return
+
+            rho = qubit.qstate.qrepr.dm
+            dim = np.shape(rho)[0]
+
+            qubitapi.assign_qstate([qubit], self.xi * rho + ((1 - self.xi) / dim) * np.eye(dim))
 
 
 class QubitLossModel(QuantumErrorModel):
@@ -131,6 +312,7 @@ class QubitLossModel(QuantumErrorModel):
     def __init__(self, prob_loss):
         self.prob_loss = prob_loss
 
+    @profiled
     def error_operation(self, qubits, delta_time=0, **kwargs):
         r"""Performs the error operation on the qiven qubits.
 
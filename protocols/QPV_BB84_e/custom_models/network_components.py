@@ -5,7 +5,7 @@ from netsquid.components.models.delaymodels import FibreDelayModel
 from netsquid.components.models.qerrormodels import FibreLossModel
 from netsquid.nodes import DirectConnection
 from enum import Enum
-from QPV_BB84_e.custom_models.error_models import OpticalFibreErrorModel
+from QPV_BB84_e.custom_models.error_models import OpticalFibreErrorModel, CompiledChannelErrorModel
 
 """
 network_components.py
@@ -83,11 +83,33 @@ class QuantumConnection(Connection):
     :param fidelity_loss: A tuple containing the fidelity loss due to the environment for a certain length
         of fibre. Defaults to `(.047, 50)`.
     :type fidelity_loss: optional, (float, float)
+    :param noise: How the noise of the fibre is applied to the photons sent from A to B. With `staged`, the fibre
+        depolarises every photon with a parameter that depends on its state. With `compiled`, the noise of the
+        photon generator at A and of the fibre is applied at once, with a parameter that is computed when the
+        connection is built. The photons must then leave A as prepared by a noiseless generator. With `validate`,
+        the staged noise is applied and compared with the compiled noise. Defaults to `staged`.
+    :type noise: optional, str
+    :param source_fidelity_loss: The loss in fidelity of the photon generator at A, required when the noise is not
+        staged. Defaults to `None`.
+    :type source_fidelity_loss: optional, float
+    :param loss_first: Whether the loss of the photons sent from A to B is sampled up front by the sender, in which
+        case the channel from A to B has no loss model and only delays and depolarises the photons. The probability
+        that a photon survives the channel is then given by `prob_survival`. Defaults to `False`.
+    :type loss_first: optional, bool
+
+    :raises ValueError: When the noise is unknown, or not staged without a loss in fidelity of the generator.
     """
     def __init__(self, length, name='QuantumConnection', direction=ConnectionDirection.BIDIRECTIONAL,
-                 models=None, p_loss_init=.2, p_loss_length=.18, fidelity_loss=(.047, 50)):
+                 models=None, p_loss_init=.2, p_loss_length=.18, fidelity_loss=(.047, 50), noise='staged',
+                 source_fidelity_loss=None, loss_first=False):
         super().__init__(name=name)
 
+        if noise not in ['staged', 'compiled', 'validate']:
+            raise ValueError(f'Unknown noise {noise}, expected staged, compiled or validate.')
+
+        if noise != 'staged' and source_fidelity_loss is None:
+            raise ValueError('The loss in fidelity of the photon generator is required for compiled noise.')
+
         # Have standard fibre properties when no models are given.
         if not models:
             models = {
@@ -96,8 +118,21 @@ class QuantumConnection(Connection):
                 'quantum_noise_model': OpticalFibreErrorModel(fidelity_loss=fidelity_loss, length=length)
             }
 
+        # Only the photons from A are fresh from the generator, so the noise is compiled in that direction only.
+        models_a2b = models
+
+        if noise != 'staged':
+            models_a2b = dict(models, quantum_noise_model=CompiledChannelErrorModel(
+                source_fidelity_loss, fidelity_loss, length, validate=noise == 'validate'))
+
+        # The probability that a photon survives the coupling into the fibre and the attenuation over its length.
+        self.prob_survival = (1 - p_loss_init) * 10**(-length * p_loss_length / 10)
+
+        if loss_first:
+            models_a2b = {key: model for key, model in models_a2b.items() if key != 'quantum_loss_model'}
+
         if direction != ConnectionDirection.B2A:
-            self.add_subcomponent(QuantumChannel('QChannel_A2B', length=length, models=models),
+            self.add_subcomponent(QuantumChannel('QChannel_A2B', length=length, models=models_a2b),
                                   forward_input=[('A', 'send')],
                                   forward_output=[('B', 'recv')])
 
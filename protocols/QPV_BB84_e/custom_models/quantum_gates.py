@@ -1,6 +1,6 @@
 from netsquid.components import IGate, IMeasure
+from QPV_BB84_e.custom_models.basis_table import get_basis_table, gate_matrix
 
-import numpy as np
 import netsquid as ns
 
 """
@@ -67,14 +67,15 @@ class PreparationGate(IGate):
         :return: The operator object for :math:`U` with the given parameters.
         :rtype: :class:`netsquid.qubits.Operator`
         """
-        sigma = np.arccos(2 * (theta / m) - 1)
-        delta = ((phi * np.pi) / (m * np.sin(sigma))) if sigma != 0 else 0
+        table = get_basis_table(m) if m == int(m) else None
+        index = table.lookup(theta, phi) if table else None
 
-        cos = np.cos(sigma / 2)
-        sin = np.sin(sigma / 2)
+        # Look the operator up in the basis table, unless the parameters are not a valid basis.
+        if index is not None:
+            return table.operator(index, inverse)
+
+        op = ns.qubits.Operator('PreparationGate', gate_matrix(theta, phi, m))
 
-        op = ns.qubits.Operator('PreparationGate', np.nan_to_num(np.array([[cos, np.e**(1j * delta) * sin],
-                                                                           [-np.e**(-1j * delta) * sin, cos]])))
         if inverse:
             op = op.inv
 
@@ -1,18 +1,95 @@
 from mpi4py import MPI
+from QPV_BB84_e.experiments.result_store import ResultStore
+from QPV_BB84_e.experiments.executor import Executor, enumerate_jobs, get_session, print_report
+from QPV_BB84_e.experiments.rate_cache import rate_cube
+from QPV_BB84_e.experiments.roc import thresholds
+from QPV_BB84_e.verifiers.profiler import PROFILER, profile_filename
+from QPV_BB84_e.verifiers.random_streams import RandomStreams
+from QPV_BB84_e.verifiers.sequential_test import SequentialTest
 from QPV_BB84_e.attacks.fidelity_attack.attack import Attack
+from QPV_BB84_e.attacks.fidelity_attack.batch_attack import BatchAttack
 
-import os
+import functools
 import numpy as np
 import argparse
 
 RESULTS_FILE_TEMPLATE = './results/adversaries_results_over_distance/result'
+RESULTS_STORE = './results/adversaries_results_over_distance'
+HONEST_RESULTS = './results/honest_results_over_distance'
 
 
-def get_results(min_dist, max_dist, interval, size, rank):
-    dist_per_inst = (max_dist - min_dist) / size
-    my_min_dist = round(rank * dist_per_inst + min_dist, 1)
-    my_max_dist = round(my_min_dist + dist_per_inst, 1)
+def run_replicate(d, i, n, m, v_pos, delta_p, attack_runs, batch=False, profile=False, seed=None,
+                  common=False, basis_tilt=0., survival_tilt=None, alpha=None, stop_thresholds=None,
+                  exclude_not_sent=True):
+    # Importance sampling is only available in the vectorised engine.
+    kwargs = {'basis_tilt': basis_tilt, 'survival_tilt': survival_tilt} if batch else {}
 
+    if alpha is not None:
+        kwargs['sequential_test'] = SequentialTest(n, *stop_thresholds[d], exclude_not_sent=exclude_not_sent,
+                                                   alpha=alpha)
+
+    # Build the network once per distance, and only reset it between runs.
+    session = get_session(d, BatchAttack if batch else Attack, n, m, -d, d, -d + delta_p, d - delta_p, v_pos,
+                          **kwargs)
+
+    if profile:
+        PROFILER.reset()
+        PROFILER.enable()
+
+    streams = RandomStreams(seed, d, i, 'fidelity_attack', common) if seed is not None else None
+
+    stats, alice_data, bob_data = session.run(streams=streams)
+
+    if profile:
+        PROFILER.disable()
+        PROFILER.write(profile_filename(RESULTS_STORE, d, i), param=d, replicate=i, stats=stats)
+
+    ResultStore(RESULTS_STORE).append(d, i, alice_data, bob_data, d, n, m, v_pos, delta_p, stats=stats)
+
+
+def honest_thresholds(distances, runs, n, alpha, exclude_not_sent=True):
+    """Returns the thresholds on R_c and R_r at the given alpha per distance, estimated from the honest runs as in
+    the analysis, see :func:`QPV_BB84_e.experiments.roc.success_curve`.
+
+    :param distances: The distances.
+    :type distances: list
+    :param runs: The number of honest runs per distance.
+    :type runs: int
+    :param n: The number of rounds over which the reporting rate is computed.
+    :type n: int
+    :param alpha: The significance level, between 0 and 1.
+    :type alpha: float
+    :param exclude_not_sent: Whether the rounds in which no photon was sent are left out of the reporting rate.
+        Defaults to `True`.
+    :type exclude_not_sent: optional, bool
+
+    :return: The thresholds on R_c and R_r per distance, which are `nan` for distances without honest runs.
+    :rtype: dict
+    """
+    honest = rate_cube(HONEST_RESULTS, distances, runs, n, exclude_not_sent)
+    result = {}
+
+    for d, R_c, R_r in zip(distances, honest['R_c'], honest['R_r']):
+        found = ~np.isnan(R_c)
+
+        if found.any():
+            result[d] = (float(thresholds(np.sort(R_c[found]), [alpha])[0]),
+                         float(thresholds(np.sort(R_r[found]), [alpha])[0]))
+        else:
+            result[d] = (np.nan, np.nan)
+
+    return result
+
+
+def estimated_cost(d):
+    # The adversaries abstain from more rounds as the loss that the verifiers accept grows.
+    l_fraction = 1 - (.7 * .96 * 10**(-d * .18 / 10))
+
+    return 1 / (1 - l_fraction)
+
+
+def get_results(min_dist, max_dist, interval, executor, batch=False, chunk_size=10, profile=False, seed=None,
+                common=False, basis_tilt=0., survival_tilt=None, alpha=None, exclude_not_sent=True):
     n = 1000
     m = 50
     v_pos = 0
@@ -20,27 +97,46 @@ def get_results(min_dist, max_dist, interval, size, rank):
 
     attack_runs = 1000
 
-    distances = np.arange(my_min_dist, my_max_dist, interval)
+    distances = [round(d, 1) for d in np.arange(min_dist, max_dist, interval)]
+
+    jobs = []
+    stop_thresholds = None
+
+    # The runs are stopped against the thresholds of the honest runs at every distance, estimated from as many runs
+    # as the analysis compares.
+    if alpha is not None:
+        if executor.is_master:
+            stop_thresholds = honest_thresholds(distances, attack_runs, n, alpha, exclude_not_sent)
+
+        if executor.comm is not None:
+            stop_thresholds = executor.comm.bcast(stop_thresholds, root=0)
 
-    exclfile = open('excl_adversaries_results_over_distance.txt', 'r')
-    excllist = ['./results/adversaries_results_over_distance/' + x.rstrip() for x in exclfile.readlines()]
-    exclfile.close()
+        missing = [d for d, (R_c, R_r) in stop_thresholds.items() if np.isnan(R_c)]
 
-    for d in distances:
-        print(f'Distance: {d:.1f}')
+        if missing:
+            raise ValueError(f'There are no honest runs to estimate the thresholds of the sequential test from at '
+                             f'the distances {missing}.')
 
-        for i in range(attack_runs):
+    if executor.is_master:
+        exclfile = open('excl_adversaries_results_over_distance.txt', 'r')
+        excllist = set(['./results/adversaries_results_over_distance/' + x.rstrip() for x in exclfile.readlines()])
+        exclfile.close()
+
+        store = ResultStore(RESULTS_STORE)
+
+        def skip(d, i):
             filename = f'{RESULTS_FILE_TEMPLATE}_{d:.1f}_{i}.npz'
 
-            if filename in excllist or os.path.exists(filename):
-                continue
+            return filename in excllist or store.exists(d, i)
 
-            attack = Attack(n, m, -d, d, -d + delta_p, d - delta_p, v_pos)
+        jobs = enumerate_jobs(distances, attack_runs, skip, chunk_size)
 
-            stats, alice_data, bob_data = attack.run()
+    work = functools.partial(run_replicate, n=n, m=m, v_pos=v_pos, delta_p=delta_p, attack_runs=attack_runs,
+                             batch=batch, profile=profile, seed=seed, common=common, basis_tilt=basis_tilt,
+                             survival_tilt=survival_tilt, alpha=alpha, stop_thresholds=stop_thresholds,
+                             exclude_not_sent=exclude_not_sent)
 
-            np.savez(filename, params=[d, n, m, v_pos, delta_p, attack_runs],
-                     alice_data=alice_data, bob_data=bob_data, stats=stats)
+    return executor.map(work, jobs, estimated_cost, basis_tables=[m])
 
 
 def main():
@@ -48,16 +144,56 @@ def main():
     parser.add_argument('min_dist', type=float)
     parser.add_argument('max_dist', type=float)
     parser.add_argument('interval', type=float)
+    parser.add_argument('--batch', action='store_true', help='Use the vectorised engine instead of NetSquid.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='The number of local processes to use when not running on multiple MPI ranks.')
+    parser.add_argument('--chunk-size', type=int, default=10, help='The number of runs per job.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write a report of the time spent per handler next to the results of every run.')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='The id of the sweep, from which the random streams of every run are derived.')
+    parser.add_argument('--common-random-numbers', action='store_true',
+                        help='Give the verifiers the same random streams as in the sweeps of other players with '
+                             'the same seed.')
+    parser.add_argument('--basis-tilt', type=float, default=0.,
+                        help='Importance sampling: the probability with which Dave measures in the basis of the '
+                             'verifiers. Requires --batch.')
+    parser.add_argument('--survival-tilt', type=float, default=None,
+                        help='Importance sampling: the probability of survival of the photon on its way to Dave. '
+                             'Requires --batch.')
+    parser.add_argument('--sequential-test', type=float, default=None, metavar='ALPHA',
+                        help='Stop every run as soon as the decision against the thresholds on R_c and R_r of the '
+                             'honest runs at this alpha and distance is settled. The analysis only uses the '
+                             'decisions of stopped runs in the joint test at this alpha.')
+    parser.add_argument('--include-not-sent', action='store_true',
+                        help='Count the rounds without a photon sent in R_r in the sequential test, as in an '
+                             'analysis that does not exclude them.')
 
     args = parser.parse_args()
 
+    if (args.basis_tilt or args.survival_tilt is not None) and not args.batch:
+        parser.error('Importance sampling requires --batch.')
+
+    if not 0 <= args.basis_tilt < 1:
+        parser.error('It is required that 0 <= basis tilt < 1.')
+
+    if args.survival_tilt is not None and not 0 < args.survival_tilt < 1:
+        parser.error('It is required that 0 < survival tilt < 1.')
+
+    if args.sequential_test is not None and not 0 <= args.sequential_test <= 1:
+        parser.error('It is required that 0 <= alpha <= 1.')
+
     comm = MPI.COMM_WORLD
+    executor = Executor(comm, args.processes)
 
-    get_results(args.min_dist, args.max_dist, args.interval, comm.Get_size(), comm.Get_rank())
+    report = get_results(args.min_dist, args.max_dist, args.interval, executor, args.batch, args.chunk_size,
+                         args.profile, args.seed, args.common_random_numbers, args.basis_tilt, args.survival_tilt,
+                         args.sequential_test, not args.include_not_sent)
 
     comm.Barrier()
 
     if comm.Get_rank() == 0:
+        print_report(report)
         print('done')
 
 
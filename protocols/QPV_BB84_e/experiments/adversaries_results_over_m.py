@@ -1,18 +1,45 @@
 from mpi4py import MPI
+from QPV_BB84_e.experiments.result_store import ResultStore
+from QPV_BB84_e.experiments.executor import Executor, enumerate_jobs, get_session, print_report
+from QPV_BB84_e.verifiers.profiler import PROFILER, profile_filename
+from QPV_BB84_e.verifiers.random_streams import RandomStreams
 from QPV_BB84_e.attacks.fidelity_attack.attack import Attack
+from QPV_BB84_e.attacks.fidelity_attack.batch_attack import BatchAttack
 
-import os
+import functools
 import numpy as np
 import argparse
 
 RESULTS_FILE_TEMPLATE = './results/adversaries_results_over_m/result'
+RESULTS_STORE = './results/adversaries_results_over_m'
 
 
-def get_results(min_m, max_m, size, rank):
-    m_per_inst = (max_m - min_m) / size
-    my_min_m = round(rank * m_per_inst + min_m)
-    my_max_m = round(my_min_m + m_per_inst)
+def run_replicate(m, i, n, d, v_pos, delta_p, attack_runs, batch=False, profile=False, seed=None,
+                  common=False):
+    # Build the network once per m, and only reset it between runs.
+    session = get_session(m, BatchAttack if batch else Attack, n, m, -d, d, -d + delta_p, d - delta_p, v_pos)
 
+    if profile:
+        PROFILER.reset()
+        PROFILER.enable()
+
+    streams = RandomStreams(seed, m, i, 'fidelity_attack', common) if seed is not None else None
+
+    stats, alice_data, bob_data = session.run(streams=streams)
+
+    if profile:
+        PROFILER.disable()
+        PROFILER.write(profile_filename(RESULTS_STORE, m, i), param=m, replicate=i, stats=stats)
+
+    ResultStore(RESULTS_STORE).append(m, i, alice_data, bob_data, d, n, m, v_pos, delta_p, stats=stats)
+
+
+def estimated_cost(m):
+    # The number of bases, and with it the cost of building and using the basis table, grows with m.
+    return m
+
+
+def get_results(min_m, max_m, executor, batch=False, chunk_size=10, profile=False, seed=None, common=False):
     n = 1000
     d = 0.1
     v_pos = 0
@@ -20,43 +47,60 @@ def get_results(min_m, max_m, size, rank):
 
     attack_runs = 1000
 
-    ms = np.arange(my_min_m, my_max_m)
+    ms = [int(m) for m in np.arange(round(min_m), round(max_m))]
+
+    jobs = []
 
-    exclfile = open('excl_adversaries_results_over_m.txt', 'r')
-    excllist = ['./results/adversaries_results_over_m/' + x.rstrip() for x in exclfile.readlines()]
-    exclfile.close()
+    if executor.is_master:
+        exclfile = open('excl_adversaries_results_over_m.txt', 'r')
+        excllist = set(['./results/adversaries_results_over_m/' + x.rstrip() for x in exclfile.readlines()])
+        exclfile.close()
 
-    for m in ms:
-        print('m:', m)
+        store = ResultStore(RESULTS_STORE)
 
-        for i in range(attack_runs):
+        def skip(m, i):
             filename = f'{RESULTS_FILE_TEMPLATE}_{m:.1f}_{i}.npz'
 
-            if filename in excllist or os.path.exists(filename):
-                continue
+            return filename in excllist or store.exists(m, i)
 
-            stats, alice_data, bob_data = Attack(n, m, -d, d, -d + delta_p, d - delta_p, v_pos).run()
+        jobs = enumerate_jobs(ms, attack_runs, skip, chunk_size)
 
-            np.savez(filename, params=[d, n, m, v_pos, delta_p, attack_runs],
-                     alice_data=alice_data, bob_data=bob_data, stats=stats)
+    work = functools.partial(run_replicate, n=n, d=d, v_pos=v_pos, delta_p=delta_p, attack_runs=attack_runs,
+                             batch=batch, profile=profile, seed=seed, common=common)
+
+    return executor.map(work, jobs, estimated_cost, basis_tables=ms)
 
 
 def main():
     parser = argparse.ArgumentParser(description='Get the adversaries\' results over m.')
     parser.add_argument('min_m', type=float)
     parser.add_argument('max_m', type=float)
+    parser.add_argument('--batch', action='store_true', help='Use the vectorised engine instead of NetSquid.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='The number of local processes to use when not running on multiple MPI ranks.')
+    parser.add_argument('--chunk-size', type=int, default=10, help='The number of runs per job.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write a report of the time spent per handler next to the results of every run.')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='The id of the sweep, from which the random streams of every run are derived.')
+    parser.add_argument('--common-random-numbers', action='store_true',
+                        help='Give the verifiers the same random streams as in the sweeps of other players with '
+                             'the same seed.')
 
     args = parser.parse_args()
 
     comm = MPI.COMM_WORLD
+    executor = Executor(comm, args.processes)
 
-    get_results(args.min_m, args.max_m, comm.Get_size(), comm.Get_rank())
+    report = get_results(args.min_m, args.max_m, executor, args.batch, args.chunk_size, args.profile, args.seed,
+                         args.common_random_numbers)
+
+    comm.Barrier()
 
     if comm.Get_rank() == 0:
+        print_report(report)
         print('done')
 
-    comm.Barrier()
-
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,284 @@
+from QPV_BB84_e.verifiers.outcomes import INCORRECT, CORRECT, NOT_SENT, VALUES, encode_outcomes
+from QPV_BB84_e.verifiers.sequential_test import ACCEPT, REJECT
+from QPV_BB84_e.experiments.result_store import ResultStore, STATS_COLUMNS, DECISION_DTYPE
+
+import os
+import multiprocessing
+import numpy as np
+
+"""
+aggregate.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the aggregation of the results of a sweep. The correctness rate R_c, the reporting rate R_r
+and the rate of answers on time are computed for all runs at once, by counting the outcome codes of Alice per
+run with a single bincount over all rounds. The statistics and the likelihood ratios of the runs are gathered
+along with the rates. Runs that a sequential test stopped early have no rates, as their rounds are incomplete,
+and are represented by the decision of the test instead, with the alpha and the thresholds it was made for.
+"""
+
+
+# The arrays in the result of an aggregation.
+COLUMNS = ['R_c', 'R_r', 'on_time', 'sim_time'] + STATS_COLUMNS + ['weight'] + list(DECISION_DTYPE.names)
+
+
+def segment_counts(r, t, starts, lengths):
+    """Counts the outcome codes and answers on time in segments of an array of rounds.
+
+    :param r: The outcome codes of all rounds.
+    :type r: :class:`numpy.ndarray`
+    :param t: Whether the answers of all rounds were on time.
+    :type t: :class:`numpy.ndarray`
+    :param starts: The index of the first round of every segment. The segments may not overlap.
+    :type starts: :class:`numpy.ndarray`
+    :param lengths: The number of rounds of every segment.
+    :type lengths: :class:`numpy.ndarray`
+
+    :return: The number of rounds per segment and outcome code, and the number of answers on time per segment.
+    :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+
+    counts = np.zeros((len(starts), len(VALUES)), dtype=np.int64)
+    on_time = np.zeros(len(starts), dtype=np.int64)
+
+    # Empty segments have no counts, and would share their start with the next segment.
+    valid = np.flatnonzero(lengths > 0)
+
+    if not len(valid):
+        return counts, on_time
+
+    order = valid[np.argsort(starts[valid], kind='stable')]
+    segment_starts = starts[order]
+    segment_ends = segment_starts + lengths[order]
+
+    # Label every round with its segment, and mask out the rounds in between.
+    first, last = segment_starts[0], segment_ends[-1]
+
+    delta = np.zeros(last - first + 1, dtype=np.int32)
+    np.add.at(delta, segment_starts - first, 1)
+    np.add.at(delta, segment_ends - first, -1)
+    inside = np.cumsum(delta[:-1]) > 0
+
+    marker = np.zeros(last - first, dtype=np.int32)
+    marker[segment_starts - first] = 1
+    labels = (np.cumsum(marker) - 1)[inside]
+
+    codes = np.asarray(r[first:last])[inside].astype(np.int64)
+    timing = np.asarray(t[first:last])[inside]
+
+    size = len(order)
+
+    counts[order] = np.bincount(labels * len(VALUES) + codes, minlength=size * len(VALUES)).reshape(size, -1)
+    on_time[order] = np.bincount(labels, weights=timing, minlength=size).astype(np.int64)
+
+    return counts, on_time
+
+
+def rates(counts, first_counts, on_time, exclude_not_sent=True):
+    """Computes the correctness rate, reporting rate and rate of answers on time of runs.
+
+    :param counts: The number of rounds per run and outcome code.
+    :type counts: :class:`numpy.ndarray`
+    :param first_counts: The number of rounds per run and outcome code, over the first n rounds of every run.
+    :type first_counts: :class:`numpy.ndarray`
+    :param on_time: The number of answers on time per run.
+    :type on_time: :class:`numpy.ndarray`
+    :param exclude_not_sent: Whether the rounds in which no photon was sent are left out of the reporting rate.
+        Defaults to `True`.
+    :type exclude_not_sent: optional, bool
+
+    :return: A dictionary with the arrays `R_c`, `R_r` and `on_time`.
+    :rtype: dict
+    """
+    answered = counts[:, CORRECT] + counts[:, INCORRECT]
+    first_answered = first_counts[:, CORRECT] + first_counts[:, INCORRECT]
+
+    reported = first_counts.sum(axis=1)
+
+    if exclude_not_sent:
+        reported = reported - first_counts[:, NOT_SENT]
+
+    rounds = counts.sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'R_c': np.where(answered > 0, counts[:, CORRECT] / np.maximum(answered, 1), 0.),
+            'R_r': np.where(reported > 0, first_answered / np.maximum(reported, 1), 0.),
+            'on_time': np.where(rounds > 0, on_time / np.maximum(rounds, 1), 0.)
+        }
+
+
+def aggregate_store(store, params, runs, n, exclude_not_sent=True):
+    """Computes the rates of the first runs of every parameter in a result store.
+
+    :param store: The result store of the sweep.
+    :type store: :class:`QPV_BB84_e.experiments.result_store.ResultStore`
+    :param params: The parameters of the sweep.
+    :type params: list
+    :param runs: The number of runs per parameter.
+    :type runs: int
+    :param n: The number of rounds over which the reporting rate is computed.
+    :type n: int
+    :param exclude_not_sent: Whether the rounds in which no photon was sent are left out of the reporting rate.
+        Defaults to `True`.
+    :type exclude_not_sent: optional, bool
+
+    :return: A dictionary with the arrays `R_c`, `R_r`, `on_time`, `sim_time`, the statistics, the likelihood
+        ratios (`weight`) and the decisions of the sequential test with the alpha and thresholds they were made
+        for (`decision`, `decision_alpha`, `R_c_threshold` and `R_r_threshold`) of the runs, of shape
+        (parameters, runs). Missing runs, statistics, ratios and decisions are `nan`. The runs that the sequential
+        test stopped before n answers have `nan` as `R_c` and `R_r`.
+    :rtype: dict
+    """
+    result = {key: np.full((len(params), runs), np.nan) for key in COLUMNS}
+
+    records = []
+    positions = []
+
+    for i, param in enumerate(params):
+        param_records = store.runs(param, runs)
+
+        records.append(param_records)
+        positions.extend((i, j) for j in range(len(param_records)))
+
+    if not positions:
+        return result
+
+    records = np.concatenate(records)
+    positions = np.array(positions)
+
+    for shard in np.unique(records['shard']):
+        selected = np.flatnonzero(records['shard'] == shard)
+        shard_records = records[selected]
+        rounds = store.rounds(str(shard))
+
+        starts = shard_records['alice_offset']
+        lengths = shard_records['alice_length']
+
+        counts, on_time = segment_counts(rounds['r'], rounds['t'], starts, lengths)
+        first_counts, _ = segment_counts(rounds['r'], rounds['t'], starts, np.minimum(lengths, n))
+
+        shard_rates = rates(counts, first_counts, on_time, exclude_not_sent)
+
+        for key in ['sim_time'] + STATS_COLUMNS:
+            values = shard_records[key].astype(float)
+
+            # Missing counts are stored as -1.
+            values[values < 0] = np.nan
+            shard_rates[key] = values
+
+        shard_rates['weight'] = shard_records['weight']
+        shard_rates['decision'] = np.where(shard_records['decision'] < 0, np.nan, shard_records['decision'])
+
+        for key in DECISION_DTYPE.names[1:]:
+            shard_rates[key] = shard_records[key]
+
+        # The rates of a run that was stopped early are not those of its complete run, its decision is.
+        stopped = (np.isin(shard_records['decision'], [ACCEPT, REJECT])
+                   & (shard_records['answered'] < shard_records['n']))
+        shard_rates['R_c'][stopped] = np.nan
+        shard_rates['R_r'][stopped] = np.nan
+
+        for key, values in shard_rates.items():
+            result[key][positions[selected, 0], positions[selected, 1]] = values
+
+    return result
+
+
+def decode_npz(filename):
+    """Decodes the rounds of Alice from a result file in the former npz format.
+
+    :param filename: The name of the file.
+    :type filename: str
+
+    :return: The outcome codes and whether the answers were on time, or `None` if the file does not exist.
+    :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+    """
+    if not os.path.exists(filename):
+        return None
+
+    alice_data = np.load(filename, allow_pickle=True)['alice_data'].item()
+
+    return encode_outcomes(alice_data['r_i']), np.asarray(alice_data['t_i'], dtype=bool)
+
+
+def aggregate_npz(template, params, runs, n, exclude_not_sent=True, processes=None):
+    """Computes the rates of the first runs of every parameter from result files in the former npz format,
+    `{template}_{param:.1f}_{run}.npz`. The files are decoded by a pool of processes.
+
+    :param template: The template of the filenames.
+    :type template: str
+    :param params: The parameters of the sweep.
+    :type params: list
+    :param runs: The number of runs per parameter.
+    :type runs: int
+    :param n: The number of rounds over which the reporting rate is computed.
+    :type n: int
+    :param exclude_not_sent: Whether the rounds in which no photon was sent are left out of the reporting rate.
+        Defaults to `True`.
+    :type exclude_not_sent: optional, bool
+    :param processes: The number of processes to decode with. Defaults to `None`, in which case the number of
+        CPUs is used.
+    :type processes: optional, int
+
+    :return: A dictionary with the arrays `R_c`, `R_r`, `on_time` and `sim_time` of shape (parameters, runs).
+        Missing runs are `nan`.
+    :rtype: dict
+    """
+    filenames = [f'{template}_{param:.1f}_{run}.npz' for param in params for run in range(runs)]
+
+    with multiprocessing.Pool(processes) as pool:
+        decoded = pool.map(decode_npz, filenames, chunksize=max(1, len(filenames) // (8 * os.cpu_count())))
+
+    found = [i for i, rounds in enumerate(decoded) if rounds is not None]
+    result = {key: np.full(len(filenames), np.nan) for key in COLUMNS}
+
+    if found:
+        r = np.concatenate([decoded[i][0] for i in found])
+        t = np.concatenate([decoded[i][1] for i in found])
+
+        lengths = np.array([len(decoded[i][0]) for i in found])
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+        counts, on_time = segment_counts(r, t, starts, lengths)
+        first_counts, _ = segment_counts(r, t, starts, np.minimum(lengths, n))
+
+        for key, values in rates(counts, first_counts, on_time, exclude_not_sent).items():
+            result[key][found] = values
+
+    return {key: values.reshape(len(params), runs) for key, values in result.items()}
+
+
+def aggregate(path, params, runs, n, exclude_not_sent=True, npz=False, processes=None):
+    """Computes the rates of the first runs of every parameter of a sweep, from its result store or from result
+    files in the former npz format in the same directory.
+
+    :param path: The directory of the results.
+    :type path: str
+    :param params: The parameters of the sweep.
+    :type params: list
+    :param runs: The number of runs per parameter.
+    :type runs: int
+    :param n: The number of rounds over which the reporting rate is computed.
+    :type n: int
+    :param exclude_not_sent: Whether the rounds in which no photon was sent are left out of the reporting rate.
+        Defaults to `True`.
+    :type exclude_not_sent: optional, bool
+    :param npz: Whether to read the npz files instead of the result store. Defaults to `False`.
+    :type npz: optional, bool
+    :param processes: The number of processes to decode npz files with. Defaults to `None`.
+    :type processes: optional, int
+
+    :return: A dictionary with the arrays `R_c`, `R_r`, `on_time` and `sim_time` of shape (parameters, runs).
+    :rtype: dict
+    """
+    if npz:
+        return aggregate_npz(os.path.join(path, 'result'), params, runs, n, exclude_not_sent, processes)
+
+    return aggregate_store(ResultStore(path), params, runs, n, exclude_not_sent)
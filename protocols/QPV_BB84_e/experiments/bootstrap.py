@@ -0,0 +1,216 @@
+from QPV_BB84_e.experiments.roc import TESTS, thresholds, stopped_runs, stopped_outcomes
+
+import functools
+import multiprocessing
+import numpy as np
+
+"""
+bootstrap.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains bootstrap confidence intervals on the success rate of the adversaries. Both the honest and the
+adversarial runs are resampled, so that the intervals account for the thresholds being estimated from a finite
+number of honest runs. The resamples are drawn as index arrays, and the parameters of a sweep are spread over a
+pool of processes. The likelihood ratios of runs simulated with importance sampling are resampled along with
+their rates, as are the decisions of runs that a sequential test stopped early, which only count where their
+outcome at the thresholds of a resample is known.
+"""
+
+
+def bootstrap_curves(R_c_honest, R_r_honest, R_c_adv, R_r_adv, alphas, resamples=1000, seed=None, batch_size=100,
+                     weights=None, stopped=None):
+    """Returns the success curves of the adversaries for bootstrap resamples of the honest and adversarial runs,
+    see :func:`QPV_BB84_e.experiments.roc.success_curve`.
+
+    :param R_c_honest: The correctness rates of the honest runs.
+    :type R_c_honest: :class:`numpy.ndarray`
+    :param R_r_honest: The reporting rates of the honest runs.
+    :type R_r_honest: :class:`numpy.ndarray`
+    :param R_c_adv: The correctness rates of the runs of the adversaries.
+    :type R_c_adv: :class:`numpy.ndarray`
+    :param R_r_adv: The reporting rates of the runs of the adversaries.
+    :type R_r_adv: :class:`numpy.ndarray`
+    :param alphas: The significance levels, between 0 and 1.
+    :type alphas: :class:`numpy.ndarray`
+    :param resamples: The number of resamples. Defaults to `1000`.
+    :type resamples: optional, int
+    :param seed: The seed of the random number generator. Defaults to `None`.
+    :type seed: optional, int or :class:`numpy.random.SeedSequence`
+    :param batch_size: The number of resamples that are evaluated at once. Defaults to `100`.
+    :type batch_size: optional, int
+    :param weights: The likelihood ratios of the runs of the adversaries, where `nan` counts as `1`. Defaults to
+        `None`, in which case every run counts once.
+    :type weights: optional, :class:`numpy.ndarray`
+    :param stopped: The decisions of the sequential test, with the alpha and the thresholds they were made for, of
+        the runs of the adversaries that it stopped early, see :func:`QPV_BB84_e.experiments.roc.stopped_runs`. A
+        stopped run only counts in the joint test at the alpha of its decision, where its outcome at the
+        thresholds of a resample is known, see :func:`QPV_BB84_e.experiments.roc.stopped_outcomes`. Defaults to
+        `None`.
+    :type stopped: optional, dict
+
+    :return: A dictionary with the success rates for the joint test and the tests on R_c and R_r alone, of shape
+        (resamples, alphas). The rates are `nan` where no run counts.
+    :rtype: dict
+    """
+    alphas = np.asarray(alphas, dtype=float)
+
+    if not (len(R_c_honest) and len(R_c_adv)):
+        return {test: np.full((resamples, len(alphas)), np.nan) for test in TESTS}
+
+    rng = np.random.default_rng(seed)
+    order = np.argsort(alphas, kind='stable')
+
+    if weights is None:
+        weights = np.ones(len(R_c_adv))
+    else:
+        weights = np.nan_to_num(np.asarray(weights, dtype=float), nan=1.)
+
+    is_stopped = ~np.isnan(stopped['decision']) if stopped is not None else np.zeros(len(R_c_adv), dtype=bool)
+
+    result = {test: np.empty((resamples, len(alphas))) for test in TESTS}
+
+    for start in range(0, resamples, batch_size):
+        size = min(batch_size, resamples - start)
+
+        honest_index = rng.integers(0, len(R_c_honest), (size, len(R_c_honest)))
+        adv_index = rng.integers(0, len(R_c_adv), (size, len(R_c_adv)))
+
+        # The thresholds of every resample, nondecreasing in the sorted alphas.
+        R_c_thresholds = thresholds(np.sort(R_c_honest[honest_index], axis=1), alphas[order])
+        R_r_thresholds = thresholds(np.sort(R_r_honest[honest_index], axis=1), alphas[order])
+
+        # A run passes a test at alpha if its rate exceeds the threshold of its resample at alpha. The rates of
+        # the runs that were stopped early are `nan`, so that they never pass on them.
+        passes = {
+            'R_c': R_c_adv[adv_index][:, :, np.newaxis] > R_c_thresholds[:, np.newaxis, :],
+            'R_r': R_r_adv[adv_index][:, :, np.newaxis] > R_r_thresholds[:, np.newaxis, :]
+        }
+        passes['joint'] = passes['R_c'] & passes['R_r']
+
+        # The complete runs count in every test, the stopped runs only where their outcome is known.
+        known = np.broadcast_to(~is_stopped[adv_index][:, :, np.newaxis], passes['R_c'].shape)
+        known = {test: known for test in TESTS}
+
+        if is_stopped.any():
+            passed, known_stopped = stopped_outcomes({key: values[adv_index] for key, values in stopped.items()},
+                                                     alphas[order], R_c_thresholds, R_r_thresholds)
+
+            passes['joint'] = np.where(known['joint'], passes['joint'], passed)
+            known['joint'] = known['joint'] | known_stopped
+
+        # Every resampled run counts with its likelihood ratio.
+        adv_weights = weights[adv_index][:, :, np.newaxis]
+
+        for test in TESTS:
+            runs = np.count_nonzero(known[test], axis=1)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rates = np.where(runs > 0, np.sum(passes[test] * adv_weights, axis=1) / runs, np.nan)
+
+            result[test][start:start + size, order] = rates
+
+    return result
+
+
+def bootstrap_row(row, alphas, resamples, confidence, batch_size):
+    """Returns the bootstrap intervals for one parameter of a sweep, see :func:`bootstrap_surface`.
+
+    :param row: The rates of the honest and adversarial runs, the likelihood ratios and the stopped runs of the
+        adversaries, see :func:`QPV_BB84_e.experiments.roc.stopped_runs`, and the seed of the parameter.
+    :type row: tuple
+    :param alphas: The significance levels, between 0 and 1.
+    :type alphas: :class:`numpy.ndarray`
+    :param resamples: The number of resamples.
+    :type resamples: int
+    :param confidence: The confidence level of the intervals.
+    :type confidence: float
+    :param batch_size: The number of resamples that are evaluated at once.
+    :type batch_size: int
+
+    :return: A dictionary with the lower and upper bounds per test, of shape (alphas,).
+    :rtype: dict
+    """
+    R_c_honest, R_r_honest, R_c_adv, R_r_adv, weights, stopped, seed = row
+
+    curves = bootstrap_curves(R_c_honest, R_r_honest, R_c_adv, R_r_adv, alphas, resamples, seed, batch_size,
+                              weights, stopped)
+    result = {}
+
+    for test in TESTS:
+        if np.isnan(curves[test]).all():
+            result[test] = (np.full(len(alphas), np.nan), np.full(len(alphas), np.nan))
+        else:
+            result[test] = tuple(np.percentile(curves[test], [50 * (1 - confidence), 50 * (1 + confidence)],
+                                               axis=0))
+
+    return result
+
+
+def bootstrap_surface(honest, adv, alphas, resamples=1000, confidence=.95, seed=None, processes=None,
+                      batch_size=100):
+    """Returns percentile bootstrap intervals on the success rates of the adversaries for every parameter of a
+    sweep and every alpha. Missing runs are left out. The parameters are spread over a pool of processes, each with
+    an independent random stream.
+
+    :param honest: The rates of the honest runs, with the arrays `R_c` and `R_r` of shape (parameters, runs).
+    :type honest: dict
+    :param adv: The rates of the runs of the adversaries, with the arrays `R_c` and `R_r` of shape
+        (parameters, runs), and optionally their likelihood ratios `weight` and the decisions of their sequential
+        test with the alpha and thresholds they were made for, `decision`, `decision_alpha`, `R_c_threshold` and
+        `R_r_threshold`, of the same shape.
+    :type adv: dict
+    :param alphas: The significance levels, between 0 and 1.
+    :type alphas: :class:`numpy.ndarray`
+    :param resamples: The number of resamples. Defaults to `1000`.
+    :type resamples: optional, int
+    :param confidence: The confidence level of the intervals. Defaults to `.95`.
+    :type confidence: optional, float
+    :param seed: The seed of the random number generators. Defaults to `None`.
+    :type seed: optional, int
+    :param processes: The number of processes. Defaults to `None`, in which case the number of CPUs is used.
+        With `1`, the intervals are computed in this process.
+    :type processes: optional, int
+    :param batch_size: The number of resamples that are evaluated at once. Defaults to `100`.
+    :type batch_size: optional, int
+
+    :return: A dictionary with the lower bounds (`{test}_low`) and upper bounds (`{test}_high`) for the joint test
+        and the tests on R_c and R_r alone, of shape (parameters, alphas).
+    :rtype: dict
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(honest['R_c']))
+    weights = adv.get('weight')
+    stopped = stopped_runs(adv)
+    rows = []
+
+    for i in range(len(honest['R_c'])):
+        honest_found = ~np.isnan(honest['R_c'][i])
+        adv_found = ~np.isnan(adv['R_c'][i])
+
+        if stopped is not None:
+            adv_found |= ~np.isnan(stopped['decision'][i])
+
+        rows.append((honest['R_c'][i][honest_found], honest['R_r'][i][honest_found], adv['R_c'][i][adv_found],
+                     adv['R_r'][i][adv_found], weights[i][adv_found] if weights is not None else None,
+                     {key: values[i][adv_found] for key, values in stopped.items()} if stopped is not None
+                     else None, seeds[i]))
+
+    work = functools.partial(bootstrap_row, alphas=np.asarray(alphas, dtype=float), resamples=resamples,
+                             confidence=confidence, batch_size=batch_size)
+
+    if processes == 1:
+        intervals = list(map(work, rows))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            intervals = pool.map(work, rows)
+
+    result = {}
+
+    for test in TESTS:
+        result[f'{test}_low'] = np.array([interval[test][0] for interval in intervals]).reshape(len(rows), -1)
+        result[f'{test}_high'] = np.array([interval[test][1] for interval in intervals]).reshape(len(rows), -1)
+
+    return result
@@ -0,0 +1,283 @@
+from QPV_BB84_e.verifiers.session import Session
+from QPV_BB84_e.custom_models.basis_table import attach_basis_table, get_basis_table
+
+import os
+import time
+import functools
+import multiprocessing
+
+"""
+executor.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains an executor for the experiments, which hands out (parameter, replicate) jobs dynamically to
+the ranks of an MPI communicator or to a local process pool. The most expensive jobs are handed out first, so
+that no worker is left with a long tail of expensive runs while the others idle. The basis tables of a sweep are
+built once by the master and shared with the workers of a local pool.
+"""
+
+
+# The MPI message tags used between the master and the workers.
+TAG_READY = 1
+TAG_JOB = 2
+TAG_STOP = 3
+
+# The sessions built in this process, indexed by their key.
+_sessions = {}
+
+
+def get_session(key, player_class, *args, **kwargs):
+    r"""Returns the session for the given key in this process, building it if needed. Only the session of the
+    last key is kept, as the jobs are handed out in chunks of replicates of the same parameter.
+
+    :param key: A key identifying the network, for example the distance.
+    :type key: object
+    :param player_class: The class of the player, see :class:`QPV_BB84_e.verifiers.session.Session`.
+    :type player_class: type
+    :param \*args: Positional arguments for the player.
+    :type \*args: list
+    :param \*\*kwargs: Keyword arguments for the player.
+    :type \*\*kwargs: dict
+
+    :return: The session.
+    :rtype: :class:`QPV_BB84_e.verifiers.session.Session`
+    """
+    if key not in _sessions:
+        _sessions.clear()
+        _sessions[key] = Session(player_class, *args, **kwargs)
+
+    return _sessions[key]
+
+
+def enumerate_jobs(params, replicates, skip=None, chunk_size=1):
+    """Enumerates the jobs for the given parameters, as chunks of replicates of the same parameter.
+
+    :param params: The parameters to run the experiment for.
+    :type params: list
+    :param replicates: The number of replicates per parameter.
+    :type replicates: int
+    :param skip: A function of the parameter and replicate that returns whether the replicate can be skipped,
+        for example because its results exist already. Defaults to `None`.
+    :type skip: optional, function
+    :param chunk_size: The maximum number of replicates per job. Defaults to `1`.
+    :type chunk_size: optional, int
+
+    :return: The jobs, as tuples of the parameter and a list of replicates.
+    :rtype: list
+    """
+    jobs = []
+
+    for param in params:
+        todo = [i for i in range(replicates) if not skip or not skip(param, i)]
+
+        for start in range(0, len(todo), chunk_size):
+            jobs.append((param, todo[start:start + chunk_size]))
+
+    return jobs
+
+
+def run_job(work, job):
+    """Runs all replicates of a job and measures the time spent.
+
+    :param work: The function of the parameter and replicate that runs a replicate.
+    :type work: function
+    :param job: The parameter and the list of replicates.
+    :type job: (object, list)
+
+    :return: The id of the worker, the parameter, the number of replicates and the time spent in seconds.
+    :rtype: (int, object, int, float)
+    """
+    param, replicates = job
+    start = time.perf_counter()
+
+    for i in replicates:
+        work(param, i)
+
+    return os.getpid(), param, len(replicates), time.perf_counter() - start
+
+
+def initialize_worker(basis_tables, initializer, initargs):
+    """Initialises a worker process of a local pool. The worker attaches to the basis tables that the master has
+    shared, and then calls the initializer of the executor, if any.
+
+    :param basis_tables: The names of the shared memory blocks of the basis tables, indexed by m.
+    :type basis_tables: dict
+    :param initializer: The initializer of the executor, or `None`.
+    :type initializer: function
+    :param initargs: The arguments of the initializer.
+    :type initargs: tuple
+    """
+    for m, name in basis_tables.items():
+        attach_basis_table(m, name)
+
+    if initializer:
+        initializer(*initargs)
+
+
+class Executor():
+    """This is a class representation of an executor that runs jobs on a dynamic work queue. If an MPI
+    communicator with more than one rank is given, rank 0 hands out the jobs and the other ranks run them.
+    Otherwise, the jobs are run by a local process pool, or in this process if only one process is used.
+
+    :param comm: The MPI communicator. Defaults to `None`.
+    :type comm: optional, :class:`mpi4py.MPI.Comm`
+    :param processes: The number of processes of the local pool. Defaults to `None`, in which case the number
+        of CPUs is used.
+    :type processes: optional, int
+    :param initializer: A function that is called at the start of every local worker process. Defaults to
+        `None`.
+    :type initializer: optional, function
+    :param initargs: The arguments of the initializer. Defaults to `()`.
+    :type initargs: optional, tuple
+    """
+    def __init__(self, comm=None, processes=None, initializer=None, initargs=()):
+        self.comm = comm if comm is not None and comm.Get_size() > 1 else None
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+
+    @property
+    def is_master(self):
+        """Returns whether this process hands out the jobs and gathers the report.
+
+        :return: Whether this process is the master.
+        :rtype: bool
+        """
+        return self.comm is None or self.comm.Get_rank() == 0
+
+    def map(self, work, jobs, cost=None, basis_tables=()):
+        """Runs the given jobs, handing them out in order of decreasing estimated cost. With a local pool, the
+        basis tables for the given values of m are built in this process and shared with the workers, which attach
+        to them instead of building their own. The ranks of an MPI communicator build their own tables.
+
+        :param work: The function of the parameter and replicate that runs a replicate. For a local pool, it
+            must be picklable, for example a module level function or a :func:`functools.partial` of one.
+        :type work: function
+        :param jobs: The jobs, as returned by :func:`enumerate_jobs`. Only the jobs given to the master are used.
+        :type jobs: list
+        :param cost: A function of the parameter that estimates the cost of a replicate. Defaults to `None`,
+            in which case the jobs are handed out in the given order.
+        :type cost: optional, function
+        :param basis_tables: The values of m of the basis tables that the jobs use. Defaults to `()`.
+        :type basis_tables: optional, list
+
+        :return: The utilisation report on the master, `None` on the other ranks.
+        :rtype: dict
+        """
+        if self.is_master and cost:
+            jobs = sorted(jobs, key=lambda job: cost(job[0]) * len(job[1]), reverse=True)
+
+        if self.comm is not None:
+            return self.__map_mpi(work, jobs)
+
+        start = time.perf_counter()
+
+        if self.processes == 1:
+            if self.initializer:
+                self.initializer(*self.initargs)
+
+            done = [run_job(work, job) for job in jobs]
+        else:
+            tables = [get_basis_table(m) for m in basis_tables]
+            names = {table.m: table.share() for table in tables}
+
+            try:
+                with multiprocessing.Pool(self.processes, initialize_worker,
+                                          (names, self.initializer, self.initargs)) as pool:
+                    done = list(pool.imap_unordered(functools.partial(run_job, work), jobs, chunksize=1))
+            finally:
+                # The tables of this process are copied out of the blocks before they are destroyed.
+                for table in tables:
+                    table.close(unlink=True)
+
+        return self.report(done, time.perf_counter() - start)
+
+    def __map_mpi(self, work, jobs):
+        """A private method that runs the jobs on the ranks of the communicator. The master sends a job to
+        every worker that reports it is ready, until the queue is empty.
+
+        :param work: The function of the parameter and replicate that runs a replicate.
+        :type work: function
+        :param jobs: The jobs, ordered by decreasing estimated cost.
+        :type jobs: list
+
+        :return: The utilisation report on the master, `None` on the other ranks.
+        :rtype: dict
+        """
+        from mpi4py import MPI
+
+        status = MPI.Status()
+
+        if not self.is_master:
+            self.comm.send(None, dest=0, tag=TAG_READY)
+
+            while True:
+                job = self.comm.recv(source=0, tag=MPI.ANY_TAG, status=status)
+
+                if status.Get_tag() == TAG_STOP:
+                    return None
+
+                worker, param, count, elapsed = run_job(work, job)
+                self.comm.send((self.comm.Get_rank(), param, count, elapsed), dest=0, tag=TAG_READY)
+
+        start = time.perf_counter()
+        queue = list(reversed(jobs))
+        active = self.comm.Get_size() - 1
+        done = []
+
+        while active:
+            result = self.comm.recv(source=MPI.ANY_SOURCE, tag=TAG_READY, status=status)
+            worker = status.Get_source()
+
+            if result is not None:
+                done.append(result)
+
+            if queue:
+                self.comm.send(queue.pop(), dest=worker, tag=TAG_JOB)
+            else:
+                self.comm.send(None, dest=worker, tag=TAG_STOP)
+                active -= 1
+
+        return self.report(done, time.perf_counter() - start)
+
+    def report(self, done, wall_time):
+        """Computes the utilisation of every worker, that is the fraction of the wall time spent running jobs.
+
+        :param done: The finished jobs, as returned by :func:`run_job`.
+        :type done: list
+        :param wall_time: The total time spent in seconds.
+        :type wall_time: float
+
+        :return: A dictionary with the wall time and per worker the number of jobs and replicates, the time spent
+            and the utilisation.
+        :rtype: dict
+        """
+        workers = {}
+
+        for worker, _, count, elapsed in done:
+            stats = workers.setdefault(worker, {'jobs': 0, 'replicates': 0, 'busy_time': 0.})
+            stats['jobs'] += 1
+            stats['replicates'] += count
+            stats['busy_time'] += elapsed
+
+        for stats in workers.values():
+            stats['utilisation'] = stats['busy_time'] / wall_time if wall_time else 0.
+
+        return {'wall_time': wall_time, 'workers': workers}
+
+
+def print_report(report):
+    """Prints the utilisation report of an executor.
+
+    :param report: The report, as returned by :meth:`Executor.map`.
+    :type report: dict
+    """
+    print(f'Wall time: {report["wall_time"]:.1f} s')
+
+    for worker, stats in sorted(report['workers'].items()):
+        print(f'Worker {worker}: {stats["jobs"]} jobs, {stats["replicates"]} replicates, '
+              f'{stats["busy_time"]:.1f} s busy, utilisation {stats["utilisation"]:.1%}')
@@ -1,45 +1,80 @@
 from mpi4py import MPI
+from QPV_BB84_e.experiments.result_store import ResultStore
+from QPV_BB84_e.experiments.executor import Executor, enumerate_jobs, get_session, print_report
+from QPV_BB84_e.verifiers.profiler import PROFILER, profile_filename
+from QPV_BB84_e.verifiers.random_streams import RandomStreams
 from QPV_BB84_e.honest_player.charlie import Charlie
+from QPV_BB84_e.honest_player.batch_charlie import BatchCharlie
 
-import os
+import functools
 import numpy as np
 import argparse
 
 RESULTS_FILE_TEMPLATE = './results/honest_results_over_distance/result'
+RESULTS_STORE = './results/honest_results_over_distance'
 
 
-def get_results(min_dist, max_dist, interval, size, rank):
-    dist_per_inst = (max_dist - min_dist) / size
-    my_min_dist = round(rank * dist_per_inst + min_dist, 1)
-    my_max_dist = round(my_min_dist + dist_per_inst, 1)
+def run_replicate(d, i, n, m, v_pos, honest_runs, batch=False, loss_first=False, fast_forward=False,
+                  profile=False, seed=None, common=False):
+    # Build the network once per distance, and only reset it between runs. The vectorised engine always samples
+    # the loss up front.
+    if batch:
+        session = get_session(d, BatchCharlie, n, m, -d, 0, d, 0)
+    else:
+        session = get_session(d, Charlie, n, m, -d, 0, d, 0, loss_first=loss_first or fast_forward,
+                              fast_forward=fast_forward)
 
+    if profile:
+        PROFILER.reset()
+        PROFILER.enable()
+
+    streams = RandomStreams(seed, d, i, 'honest', common) if seed is not None else None
+
+    stats, alice_data, bob_data = session.run(streams=streams)
+
+    if profile:
+        PROFILER.disable()
+        PROFILER.write(profile_filename(RESULTS_STORE, d, i), param=d, replicate=i, stats=stats)
+
+    ResultStore(RESULTS_STORE).append(d, i, alice_data, bob_data, d, n, m, v_pos, stats=stats)
+
+
+def estimated_cost(d):
+    # The number of rounds needed for n answers grows with the attenuation in the fibre.
+    return 10**(.18 * d / 10)
+
+
+def get_results(min_dist, max_dist, interval, executor, batch=False, chunk_size=10, loss_first=False,
+                fast_forward=False, profile=False, seed=None, common=False):
     n = 1000
     m = 50
     v_pos = 0
 
     honest_runs = 1000
 
-    distances = np.arange(my_min_dist, my_max_dist, interval)
+    distances = [round(d, 1) for d in np.arange(min_dist, max_dist, interval)]
+
+    jobs = []
 
-    exclfile = open('excl_honest_results_over_distance.txt', 'r')
-    excllist = ['./results/honest_results_over_distance/' + x.rstrip() for x in exclfile.readlines()]
-    exclfile.close()
+    if executor.is_master:
+        exclfile = open('excl_honest_results_over_distance.txt', 'r')
+        excllist = set(['./results/honest_results_over_distance/' + x.rstrip() for x in exclfile.readlines()])
+        exclfile.close()
 
-    for d in distances:
-        print(f'Distance: {d:.1f}')
+        store = ResultStore(RESULTS_STORE)
 
-        for i in range(honest_runs):
+        def skip(d, i):
             filename = f'{RESULTS_FILE_TEMPLATE}_{d:.1f}_{i}.npz'
 
-            if filename in excllist or os.path.exists(filename):
-                continue
+            return filename in excllist or store.exists(d, i)
 
-            charlie = Charlie(n, m, -d, 0, d, 0)
+        jobs = enumerate_jobs(distances, honest_runs, skip, chunk_size)
 
-            stats, alice_data, bob_data = charlie.run()
+    work = functools.partial(run_replicate, n=n, m=m, v_pos=v_pos, honest_runs=honest_runs, batch=batch,
+                             loss_first=loss_first, fast_forward=fast_forward, profile=profile, seed=seed,
+                             common=common)
 
-            np.savez(filename, params=[d, n, m, v_pos, honest_runs],
-                     alice_data=alice_data, bob_data=bob_data, stats=stats)
+    return executor.map(work, jobs, estimated_cost, basis_tables=[m])
 
 
 def main():
@@ -47,16 +82,34 @@ def main():
     parser.add_argument('min_dist', type=float)
     parser.add_argument('max_dist', type=float)
     parser.add_argument('interval', type=float)
+    parser.add_argument('--batch', action='store_true', help='Use the vectorised engine instead of NetSquid.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='The number of local processes to use when not running on multiple MPI ranks.')
+    parser.add_argument('--chunk-size', type=int, default=10, help='The number of runs per job.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write a report of the time spent per handler next to the results of every run.')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='The id of the sweep, from which the random streams of every run are derived.')
+    parser.add_argument('--common-random-numbers', action='store_true',
+                        help='Give the verifiers the same random streams as in the sweeps of other players with '
+                             'the same seed.')
+    parser.add_argument('--loss-first', action='store_true',
+                        help='Sample the loss of photons up front, and only simulate the photons that survive.')
+    parser.add_argument('--fast-forward', action='store_true',
+                        help='Skip the runs of lost rounds at once, which implies --loss-first.')
 
     args = parser.parse_args()
 
     comm = MPI.COMM_WORLD
+    executor = Executor(comm, args.processes)
 
-    get_results(args.min_dist, args.max_dist, args.interval, comm.Get_size(), comm.Get_rank())
+    report = get_results(args.min_dist, args.max_dist, args.interval, executor, args.batch, args.chunk_size,
+                         args.loss_first, args.fast_forward, args.profile, args.seed, args.common_random_numbers)
 
     comm.Barrier()
 
     if comm.Get_rank() == 0:
+        print_report(report)
         print('done')
 
 
@@ -35,6 +35,9 @@ class Plot():
     coordinates {{{self.get_coords(xdata, ydata)}}};
     \\addlegendentry{{{label}}}""")
 
+        # The deviations below and above the data may differ, for example for confidence intervals.
+        below, above = stddevs if isinstance(stddevs, tuple) else (stddevs, stddevs)
+
         if stddevs is not None:
             name = uuid.uuid4()
             for side in ['top', 'bot']:
@@ -45,8 +48,8 @@ class Plot():
         opacity=0.5,
         color={colour}!30
     ]
-    coordinates {{{self.get_coords(xdata, [x[0] + x[1] for x in zip(ydata, stddevs)]) if side == 'top' else
-           self.get_coords(xdata, [x[0] - x[1] for x in zip(ydata, stddevs)])}}};""")
+    coordinates {{{self.get_coords(xdata, [x[0] + x[1] for x in zip(ydata, above)]) if side == 'top' else
+           self.get_coords(xdata, [x[0] - x[1] for x in zip(ydata, below)])}}};""")
 
             self.plots.append(
                 f"""
@@ -56,7 +59,7 @@ class Plot():
             plt.plot(xdata, ydata, label=label, c=colour)
 
             if stddevs is not None:
-                plt.fill_between(xdata, ydata - stddevs, ydata + stddevs, facecolor=colour, alpha=0.5)
+                plt.fill_between(xdata, ydata - below, ydata + above, facecolor=colour, alpha=0.5)
 
     def generate_latex_code(self):
         return f"""\\begin{{tikzpicture}}
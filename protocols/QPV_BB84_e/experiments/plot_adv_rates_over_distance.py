@@ -1,77 +1,71 @@
-from collections import defaultdict, Counter
 from QPV_BB84_e.experiments.plot import Plot
+from QPV_BB84_e.experiments.aggregate import aggregate
+from QPV_BB84_e.attacks.fidelity_attack.expected_rates import rates_over_distance, run_stddevs
 
 import numpy as np
 import argparse
 
 
-def calc_R_c(counter):
-    if counter[True] + counter[False] > 0:
-        return counter[True] / (counter[True] + counter[False])
-    else:
-        return 0
-
-
-def calc_R_r(counter):
-    if sum(counter.values()) > 0:
-        return (counter[True] + counter[False]) / (sum(counter.values()) - counter['NOT_SENT'])
-    else:
-        return 0
-
-
 def within_bounds(x, bounds):
     return x > bounds[0]
 
 
-def get_results(min_dist, max_dist, interval, n, runs):
+def get_results(min_dist, max_dist, interval, n, runs, npz=False, processes=None):
     distances = np.arange(min_dist, max_dist, interval)
 
-    result = defaultdict(list)
+    rates = aggregate('./results/adversaries_results_over_distance', np.round(distances, 1), runs, n, npz=npz,
+                      processes=processes)
 
-    for d in distances:
-        print(f'{d:.1f}')
-        RESULTS_FILE_TEMPLATE = f'./results/adversaries_results_over_distance/result_{d:.1f}'
+    return {key: rates[key] for key in ['R_c', 'R_r']}, distances
 
-        R_c_honest = []
-        R_r_honest = []
 
-        for run in range(runs):
-            honest_results = np.load(f'{RESULTS_FILE_TEMPLATE}_{run}.npz', allow_pickle=True)
-            counter = Counter(honest_results['alice_data'].item()['r_i'])
-
-            R_c_honest.append(calc_R_c(counter))
-            R_r_honest.append(calc_R_r(Counter(honest_results['alice_data'].item()['r_i'][:n])))
-
-        result['R_c'].append(R_c_honest)
-        result['R_r'].append(R_r_honest)
+def get_expected_results(min_dist, max_dist, interval, n, m=50):
+    distances = np.arange(min_dist, max_dist, interval)
 
-    return result, distances
+    # The same positions as in adversaries_results_over_distance.py.
+    rates = rates_over_distance(m, np.round(distances, 1), delta_p=.0001, v_pos=0)
 
+    return rates, run_stddevs(rates, n), distances
 
-def plot_results(ratios, distances):
-    R_c_means = np.mean(ratios['R_c'], axis=1)
-    R_c_stddevs = np.std(ratios['R_c'], axis=1)
 
+def plot_results(ratios, distances, expected=None):
     title = ''
     xlabel = 'Distance $d$ in km'
     ylabel = 'Correctness rate $R_c$'
 
     latex_plot = Plot(title, xlabel, ylabel)
-    latex_plot.add_plot(distances, R_c_means, 'The adversaries\' correctness rate', 'red', R_c_stddevs, True)
+
+    if ratios is not None:
+        R_c_means = np.mean(ratios['R_c'], axis=1)
+        R_c_stddevs = np.std(ratios['R_c'], axis=1)
+
+        latex_plot.add_plot(distances, R_c_means, 'The adversaries\' correctness rate', 'red', R_c_stddevs, True)
+
+    if expected is not None:
+        rates, stddevs, expected_distances = expected
+        latex_plot.add_plot(expected_distances, rates['R_c'], 'The adversaries\' expected correctness rate', 'blue',
+                            stddevs['R_c'], True)
 
     print(latex_plot.generate_latex_code())
 
     latex_plot.plot_matplotlib()
 
-    R_r_means = np.mean(ratios['R_r'], axis=1)
-    R_r_stddevs = np.std(ratios['R_r'], axis=1)
-
     title = ''
     xlabel = 'Distance $d$ in km'
     ylabel = 'Reporting rate $R_r$'
 
     latex_plot = Plot(title, xlabel, ylabel)
-    latex_plot.add_plot(distances, R_r_means, 'The adversaries\' reporting rate', 'red', R_r_stddevs, True)
+
+    if ratios is not None:
+        R_r_means = np.mean(ratios['R_r'], axis=1)
+        R_r_stddevs = np.std(ratios['R_r'], axis=1)
+
+        latex_plot.add_plot(distances, R_r_means, 'The adversaries\' reporting rate', 'red', R_r_stddevs, True)
+
+    if expected is not None:
+        rates, stddevs, expected_distances = expected
+        latex_plot.add_plot(expected_distances, rates['R_r'], 'The adversaries\' expected reporting rate', 'blue',
+                            stddevs['R_r'], True)
 
     print(latex_plot.generate_latex_code())
 
@@ -85,12 +79,26 @@ def main():
     parser.add_argument('interval', type=float)
     parser.add_argument('n', type=int)
     parser.add_argument('runs', type=int)
+    parser.add_argument('--npz', action='store_true', help='Read the results from npz files instead of the store.')
+    parser.add_argument('--processes', type=int, default=None, help='The number of processes to decode with.')
+    parser.add_argument('--expected', action='store_true',
+                        help='Also plot the exact expected rates, with the standard deviation of a single run.')
+    parser.add_argument('--expected-only', action='store_true',
+                        help='Only plot the exact expected rates, without reading the results of the simulations.')
 
     args = parser.parse_args()
 
-    result, distances = get_results(args.min_dist, args.max_dist, args.interval, args.n, args.runs)
+    result, distances = None, None
+    expected = None
+
+    if not args.expected_only:
+        result, distances = get_results(args.min_dist, args.max_dist, args.interval, args.n, args.runs, args.npz,
+                                        args.processes)
+
+    if args.expected or args.expected_only:
+        expected = get_expected_results(args.min_dist, args.max_dist, args.interval, args.n)
 
-    plot_results(result, distances)
+    plot_results(result, distances, expected)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,7 @@
-from collections import Counter
 from QPV_BB84_e.experiments.plot import Plot
+from QPV_BB84_e.experiments.result_store import ResultStore
+from QPV_BB84_e.verifiers.outcomes import decode_counts
+from QPV_BB84_e.attacks.fidelity_attack.expected_rates import rates_over_m, run_stddevs
 
 import numpy as np
 import argparse
@@ -23,17 +25,14 @@ def get_results(min_m, max_m, runs):
     ms = range(min_m, max_m)
 
     result = []
+    store = ResultStore('./results/adversaries_results_over_m')
 
     for m in ms:
-        ADV_RESULTS_FILE_TEMPLATE = f'./results/adversaries_results_over_m/result_{m:.1f}'
-
         R_c_adv = []
         R_r_adv = []
 
-        for run in range(runs):
-            print(run)
-            adv_results = np.load(f'{ADV_RESULTS_FILE_TEMPLATE}_{run}.npz', allow_pickle=True)
-            counter = Counter(adv_results['alice_data'].item()['r_i'])
+        for record in store.runs(m, runs):
+            counter = decode_counts(store.alice(record)['r'])
 
             R_c_adv.append(calc_R_c(counter))
             R_r_adv.append(calc_R_r(counter))
@@ -43,16 +42,32 @@ def get_results(min_m, max_m, runs):
     return result, ms
 
 
-def plot_results(result, ms):
-    means = np.mean(result, axis=1)
-    stddevs = np.std(result, axis=1)
+def get_expected_results(min_m, max_m, n=1000):
+    ms = range(min_m, max_m)
+
+    # The same positions as in adversaries_results_over_m.py.
+    rates = rates_over_m(ms, .1, delta_p=.00001, v_pos=0)
+
+    return rates['R_c'], run_stddevs(rates, n)['R_c'], ms
+
 
+def plot_results(result, ms, expected=None):
     title = """The correctness rate $R_c$ of the adversaries in the fidelity attack over m. $n = 10^3$."""
     xlabel = '$m$'
     ylabel = 'Correctness rate $R_c$'
 
     latex_plot = Plot(title, xlabel, ylabel)
-    latex_plot.add_plot(ms, means, 'Adversaries\' correctness rate', 'red', stddevs, True)
+
+    if result is not None:
+        means = np.mean(result, axis=1)
+        stddevs = np.std(result, axis=1)
+
+        latex_plot.add_plot(ms, means, 'Adversaries\' correctness rate', 'red', stddevs, True)
+
+    if expected is not None:
+        expected_means, expected_stddevs, expected_ms = expected
+        latex_plot.add_plot(expected_ms, expected_means, 'Adversaries\' expected correctness rate', 'blue',
+                            expected_stddevs, True)
     print(latex_plot.generate_latex_code())
 
     latex_plot.plot_matplotlib()
@@ -63,12 +78,23 @@ def main():
     parser.add_argument('min_m', type=int)
     parser.add_argument('max_m', type=int)
     parser.add_argument('runs', type=int)
+    parser.add_argument('--expected', action='store_true',
+                        help='Also plot the exact expected rate, with the standard deviation of a single run.')
+    parser.add_argument('--expected-only', action='store_true',
+                        help='Only plot the exact expected rate, without reading the results of the simulations.')
 
     args = parser.parse_args()
 
-    result, ms = get_results(args.min_m, args.max_m, args.runs)
+    result, ms = None, None
+    expected = None
+
+    if not args.expected_only:
+        result, ms = get_results(args.min_m, args.max_m, args.runs)
+
+    if args.expected or args.expected_only:
+        expected = get_expected_results(args.min_m, args.max_m)
 
-    plot_results(result, ms)
+    plot_results(result, ms, expected)
 
 
 if __name__ == '__main__':
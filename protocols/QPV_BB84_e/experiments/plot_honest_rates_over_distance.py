@@ -1,56 +1,21 @@
-from collections import defaultdict, Counter
 from QPV_BB84_e.experiments.plot import Plot
+from QPV_BB84_e.experiments.aggregate import aggregate
 
 import numpy as np
 import argparse
 
 
-def calc_R_c(counter):
-    if counter[True] + counter[False] > 0:
-        return counter[True] / (counter[True] + counter[False])
-    else:
-        return 0
-
-
-def calc_R_r(counter):
-    if sum(counter.values()) > 0:
-        return (counter[True] + counter[False]) / (sum(counter.values()) - counter['NOT_SENT'])
-    else:
-        return 0
-
-
 def within_bounds(x, bounds):
     return x > bounds[0]
 
 
-def get_results(min_dist, max_dist, interval, n, runs):
+def get_results(min_dist, max_dist, interval, n, runs, npz=False, processes=None):
     distances = np.arange(min_dist, max_dist, interval)
 
-    result = defaultdict(list)
-
-    for d in distances:
-        print(f'{d:.1f}')
-        RESULTS_FILE_TEMPLATE = f'./results/honest_results_over_distance/result_{d:.1f}'
-
-        R_c_honest = []
-        R_r_honest = []
-        sim_time_honest = []
-
-        for run in range(runs):
-            print(d, run)
-            honest_results = np.load(f'{RESULTS_FILE_TEMPLATE}_{run}.npz', allow_pickle=True)
-            counter = Counter(honest_results['alice_data'].item()['r_i'])
-
-            sim_time_honest.append(float(str(honest_results['stats'].item()).splitlines()[5].split()[3]))
-
-            R_c_honest.append(calc_R_c(counter))
-            R_r_honest.append(calc_R_r(Counter(honest_results['alice_data'].item()['r_i'][:n])))
-
-        result['R_c'].append(R_c_honest)
-        result['R_r'].append(R_r_honest)
-        result['sim_time'].append(sim_time_honest)
+    rates = aggregate('./results/honest_results_over_distance', np.round(distances, 1), runs, n, npz=npz,
+                      processes=processes)
 
-    return result, distances
+    return {key: rates[key] for key in ['R_c', 'R_r', 'sim_time']}, distances
 
 
 def plot_results(ratios, distances):
@@ -104,10 +69,13 @@ def main():
     parser.add_argument('interval', type=float)
     parser.add_argument('n', type=int)
     parser.add_argument('runs', type=int)
+    parser.add_argument('--npz', action='store_true', help='Read the results from npz files instead of the store.')
+    parser.add_argument('--processes', type=int, default=None, help='The number of processes to decode with.')
 
     args = parser.parse_args()
 
-    result, distances = get_results(args.min_dist, args.max_dist, args.interval, args.n, args.runs)
+    result, distances = get_results(args.min_dist, args.max_dist, args.interval, args.n, args.runs, args.npz,
+                                    args.processes)
 
     plot_results(result, distances)
 
@@ -0,0 +1,139 @@
+from QPV_BB84_e.experiments.aggregate import aggregate_store, aggregate_npz
+from QPV_BB84_e.experiments.result_store import ResultStore
+
+import os
+import hashlib
+import numpy as np
+
+"""
+rate_cache.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains a persistent cache of the rates of the runs of a sweep. The rates are stored as a cube of
+shape (parameters, runs) per rate, in a file named after a hash of the source runs and of the arguments of the
+aggregation, so that a cube is computed again as soon as the runs, the number of runs or n change.
+"""
+
+
+RATE_CACHE = './results/rate_cache'
+
+# The rates that are stored in a cube.
+RATES = ['R_c', 'R_r', 'on_time', 'sim_time', 'weight', 'decision', 'decision_alpha', 'R_c_threshold',
+         'R_r_threshold']
+
+
+def store_fingerprint(store, params, runs):
+    """Returns a hash of the runs of a result store that are aggregated.
+
+    :param store: The result store.
+    :type store: :class:`QPV_BB84_e.experiments.result_store.ResultStore`
+    :param params: The parameters of the sweep.
+    :type params: list
+    :param runs: The number of runs per parameter.
+    :type runs: int
+
+    :return: The hexadecimal digest.
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+
+    for param in params:
+        records = store.runs(param, runs)
+
+        digest.update(np.float64(param).tobytes())
+
+        for name in ['replicate', 'alice_offset', 'alice_length', 'shard']:
+            digest.update(np.ascontiguousarray(records[name]).tobytes())
+
+    return digest.hexdigest()
+
+
+def npz_fingerprint(template, params, runs):
+    """Returns a hash of the result files in the former npz format that are aggregated, by their names, sizes and
+    modification times.
+
+    :param template: The template of the filenames.
+    :type template: str
+    :param params: The parameters of the sweep.
+    :type params: list
+    :param runs: The number of runs per parameter.
+    :type runs: int
+
+    :return: The hexadecimal digest.
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+
+    for param in params:
+        for run in range(runs):
+            filename = f'{template}_{param:.1f}_{run}.npz'
+
+            if os.path.exists(filename):
+                status = os.stat(filename)
+                digest.update(f'{filename}:{status.st_size}:{status.st_mtime_ns};'.encode())
+
+    return digest.hexdigest()
+
+
+def rate_cube(path, params, runs, n, exclude_not_sent=True, npz=False, processes=None, cache=RATE_CACHE):
+    """Returns the rates of the first runs of every parameter of a sweep. The cube is read from the cache if the
+    source runs and the arguments are unchanged, and is aggregated and cached otherwise.
+
+    :param path: The directory of the results.
+    :type path: str
+    :param params: The parameters of the sweep.
+    :type params: list
+    :param runs: The number of runs per parameter.
+    :type runs: int
+    :param n: The number of rounds over which the reporting rate is computed.
+    :type n: int
+    :param exclude_not_sent: Whether the rounds in which no photon was sent are left out of the reporting rate.
+        Defaults to `True`.
+    :type exclude_not_sent: optional, bool
+    :param npz: Whether to read the npz files instead of the result store. Defaults to `False`.
+    :type npz: optional, bool
+    :param processes: The number of processes to decode npz files with. Defaults to `None`.
+    :type processes: optional, int
+    :param cache: The directory of the cache. Defaults to `RATE_CACHE`.
+    :type cache: optional, str
+
+    :return: A dictionary with the arrays `R_c`, `R_r`, `on_time`, `sim_time`, `weight`, `decision`,
+        `decision_alpha`, `R_c_threshold` and `R_r_threshold` of shape (parameters, runs). Missing runs are `nan`.
+    :rtype: dict
+    """
+    params = np.asarray(params, dtype=float)
+
+    if npz:
+        template = os.path.join(path, 'result')
+        source = npz_fingerprint(template, params, runs)
+    else:
+        store = ResultStore(path)
+        source = store_fingerprint(store, params, runs)
+
+    # The rates are part of the key, so that cubes without a rate are not read.
+    key = hashlib.sha1(f'{os.path.abspath(path)};{params.tobytes().hex()};{runs};{n};{exclude_not_sent};{source};'
+                       f'{",".join(RATES)}'.encode()).hexdigest()
+    filename = os.path.join(cache, f'{os.path.basename(os.path.normpath(path))}_{key}.npz')
+
+    if os.path.exists(filename):
+        cube = np.load(filename)
+
+        return {rate: cube[rate] for rate in RATES}
+
+    if npz:
+        cube = aggregate_npz(template, params, runs, n, exclude_not_sent, processes)
+    else:
+        cube = aggregate_store(store, params, runs, n, exclude_not_sent)
+
+    os.makedirs(cache, exist_ok=True)
+
+    # Written under a temporary name first, so that an interrupted write is never read as a cube.
+    temporary = f'{filename[:-len(".npz")]}.{os.getpid()}.tmp.npz'
+    np.savez(temporary, **cube)
+    os.replace(temporary, filename)
+
+    return cube
@@ -0,0 +1,478 @@
+from QPV_BB84_e.verifiers.outcomes import encode_outcomes
+from QPV_BB84_e.verifiers.run_stats import STATS_DTYPE, SIMULATION_TIME, run_stats, stats_to_record, summary_value
+
+import os
+import re
+import glob
+import socket
+import argparse
+import numpy as np
+
+"""
+result_store.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains an append-only store for the results of the experiments. Every writing process appends the
+rounds of its runs as typed columns to its own shard file, and a record per run to its own index file, with the
+statistics of the run in a stats file alongside. The shards can be read back as memory maps, without unpickling
+any objects. The likelihood ratios of runs simulated with importance sampling are kept in a weights file, which
+is only written by the shards that have them, so that stores without weights are read as before. The same holds
+for the decisions of the sequential test of runs that were simulated with one.
+"""
+
+
+# The columns of a round as recorded by one of the verifiers: the outcome code, whether the answer was on time
+# and the message sent by the verifier (m_0_i for Alice, m_1_i for Bob).
+ROUND_DTYPE = np.dtype([('r', 'i1'), ('t', '?'), ('m', '<i4')])
+
+# The record of a run. The rounds of Alice and Bob are stored consecutively in the shard of the run.
+INDEX_DTYPE = np.dtype([('param', '<f8'), ('replicate', '<i8'),
+                        ('alice_offset', '<i8'), ('alice_length', '<i8'),
+                        ('bob_offset', '<i8'), ('bob_length', '<i8'),
+                        ('d', '<f8'), ('n', '<i8'), ('m', '<i8'), ('v_pos', '<f8'), ('delta_p', '<f8'),
+                        ('sim_time', '<f8')])
+
+# The statistics of a run that are joined into the index, the simulated time is recorded there already.
+STATS_COLUMNS = [name for name in STATS_DTYPE.names if name not in INDEX_DTYPE.names]
+
+# The likelihood ratio of a run, which is `nan` for runs simulated without importance sampling.
+WEIGHT_DTYPE = np.dtype('<f8')
+
+# The decision of the sequential test of a run, see QPV_BB84_e.verifiers.sequential_test, with the alpha and the
+# thresholds on R_c and R_r it was made for. The decision is `-1` and the others are `nan` for runs simulated
+# without one.
+DECISION_DTYPE = np.dtype([('decision', 'i1'), ('decision_alpha', '<f8'), ('R_c_threshold', '<f8'),
+                           ('R_r_threshold', '<f8')])
+
+
+def decision_to_record(stats):
+    """Converts the decision of the sequential test in the statistics of a run to a record. Missing fields are
+    `nan` or `-1`.
+
+    :param stats: The statistics, with the fields of
+        :meth:`QPV_BB84_e.verifiers.sequential_test.SequentialTest.record`.
+    :type stats: dict
+
+    :return: The record.
+    :rtype: :class:`numpy.ndarray`
+    """
+    record = np.zeros(1, dtype=DECISION_DTYPE)
+
+    for name in DECISION_DTYPE.names:
+        missing = np.nan if DECISION_DTYPE[name].kind == 'f' else -1
+        record[name] = stats.get(name, missing) if stats is not None else missing
+
+    return record
+
+
+def rounds_to_columns(data, m_key):
+    """Converts the results of a verifier to an array of rounds.
+
+    :param data: The results of the verifier, with the entries `r_i`, `t_i` and the given message key.
+    :type data: dict
+    :param m_key: The key of the messages sent by the verifier, `m_0_i` or `m_1_i`.
+    :type m_key: str
+
+    :return: The rounds.
+    :rtype: :class:`numpy.ndarray`
+    """
+    rows = np.zeros(len(data['r_i']), dtype=ROUND_DTYPE)
+
+    rows['r'] = encode_outcomes(data['r_i'])
+    rows['t'][:len(data['t_i'])] = data['t_i']
+    rows['m'][:len(data[m_key])] = data[m_key]
+
+    return rows
+
+
+def append_aligned(filename, row, records, missing):
+    """Appends the row of a run to a file with a row per record of an index. The file is first brought in line
+    with the index: rows of runs that never reached the index, for example because the writing process died in
+    between, are cut off, and the rows of runs that were appended without one are filled in.
+
+    :param filename: The name of the file.
+    :type filename: str
+    :param row: The row of the run.
+    :type row: :class:`numpy.ndarray`
+    :param records: The number of records in the index before the run.
+    :type records: int
+    :param missing: The row of a run without one.
+    :type missing: :class:`numpy.ndarray`
+    """
+    itemsize = row.dtype.itemsize
+    size = os.path.getsize(filename) if os.path.exists(filename) else 0
+    written = min(size // itemsize, records)
+
+    if size != written * itemsize:
+        os.truncate(filename, written * itemsize)
+
+    with open(filename, 'ab') as f:
+        f.write(np.repeat(missing, records - written).tobytes())
+        f.write(row.tobytes())
+
+
+def read_aligned(filename, dtype, records, missing):
+    """Reads a file with a row per record of an index, see :func:`append_aligned`. The file may be missing, or
+    be shorter than the index.
+
+    :param filename: The name of the file.
+    :type filename: str
+    :param dtype: The type of a row.
+    :type dtype: :class:`numpy.dtype`
+    :param records: The number of records in the index.
+    :type records: int
+    :param missing: The value of the rows of runs without one.
+    :type missing: object
+
+    :return: The rows.
+    :rtype: :class:`numpy.ndarray`
+    """
+    rows = np.full(records, missing, dtype=dtype)
+
+    if os.path.exists(filename):
+        written = np.fromfile(filename, dtype=dtype)[:records]
+        rows[:len(written)] = written
+
+    return rows
+
+
+class ResultStore():
+    """This is a class representation of the result store of an experiment. All files are kept in a single
+    directory, which contains a shard and an index file per writing process.
+
+    :param path: The directory of the store.
+    :type path: str
+    :param shard: The name of the shard to append to. Defaults to `None`, in which case a name based on the host
+        and process id is used, which is unique among the processes that write at the same time.
+    :type shard: optional, str
+    """
+    def __init__(self, path, shard=None):
+        self.path = path
+        self.shard = shard if shard is not None else f'{socket.gethostname()}-{os.getpid()}'
+
+        self.__index = None
+        self.__keys = set()
+        self.__shards = {}
+
+    def shard_filename(self, shard):
+        """Returns the name of the file with the rounds of the given shard.
+
+        :param shard: The name of the shard.
+        :type shard: str
+
+        :return: The filename.
+        :rtype: str
+        """
+        return os.path.join(self.path, f'rounds_{shard}.bin')
+
+    def index_filename(self, shard):
+        """Returns the name of the index file of the given shard.
+
+        :param shard: The name of the shard.
+        :type shard: str
+
+        :return: The filename.
+        :rtype: str
+        """
+        return os.path.join(self.path, f'index_{shard}.bin')
+
+    def stats_filename(self, shard):
+        """Returns the name of the file with the statistics of the runs of the given shard. The statistics are
+        stored in the same order as the records in the index file.
+
+        :param shard: The name of the shard.
+        :type shard: str
+
+        :return: The filename.
+        :rtype: str
+        """
+        return os.path.join(self.path, f'stats_{shard}.bin')
+
+    def weights_filename(self, shard):
+        """Returns the name of the file with the likelihood ratios of the runs of the given shard. The ratios are
+        stored in the same order as the records in the index file.
+
+        :param shard: The name of the shard.
+        :type shard: str
+
+        :return: The filename.
+        :rtype: str
+        """
+        return os.path.join(self.path, f'weights_{shard}.bin')
+
+    def decisions_filename(self, shard):
+        """Returns the name of the file with the decisions of the sequential test of the runs of the given shard.
+        The decisions are stored in the same order as the records in the index file.
+
+        :param shard: The name of the shard.
+        :type shard: str
+
+        :return: The filename.
+        :rtype: str
+        """
+        return os.path.join(self.path, f'decisions_{shard}.bin')
+
+    def append(self, param, replicate, alice_data, bob_data, d, n, m, v_pos, delta_p=np.nan, sim_time=np.nan,
+               stats=None):
+        """Appends a run to the shard of this process. The rounds and statistics are written before the index
+        record, so that a run is only visible once it has been written completely.
+
+        :param param: The parameter of the experiment, for example the distance or m.
+        :type param: float
+        :param replicate: The number of the run for the parameter.
+        :type replicate: int
+        :param alice_data: The results of Alice.
+        :type alice_data: dict
+        :param bob_data: The results of Bob.
+        :type bob_data: dict
+        :param d: The distance from the verifiers to the verification position in kilometres.
+        :type d: float
+        :param n: The number of rounds the protocol was run for.
+        :type n: int
+        :param m: The parameter in the protocol giving the amount of bases to encode in.
+        :type m: int
+        :param v_pos: The verification position.
+        :type v_pos: float
+        :param delta_p: The distance between the adversaries and the verification position. Defaults to `nan`.
+        :type delta_p: optional, float
+        :param sim_time: The simulated time of the run in nanoseconds. Defaults to `nan`, in which case the
+            simulated time in the statistics is used.
+        :type sim_time: optional, float
+        :param stats: The statistics of the run, see :func:`QPV_BB84_e.verifiers.run_stats.run_stats`. Its
+            likelihood ratio (`weight`) and the decision of its sequential test with the alpha and thresholds it
+            was made for (`decision`, `decision_alpha`, `R_c_threshold` and `R_r_threshold`), if any, are
+            written to the weights and decisions files. Defaults to `None`.
+        :type stats: optional, dict
+        """
+        os.makedirs(self.path, exist_ok=True)
+
+        if np.isnan(sim_time) and stats is not None:
+            sim_time = stats['sim_time']
+
+        alice_rows = rounds_to_columns(alice_data, 'm_0_i')
+        bob_rows = rounds_to_columns(bob_data, 'm_1_i')
+
+        filename = self.shard_filename(self.shard)
+        offset = os.path.getsize(filename) // ROUND_DTYPE.itemsize if os.path.exists(filename) else 0
+
+        with open(filename, 'ab') as f:
+            f.write(alice_rows.tobytes())
+            f.write(bob_rows.tobytes())
+
+        record = np.array([(param, replicate, offset, len(alice_rows), offset + len(alice_rows), len(bob_rows),
+                            d, n, m, v_pos, delta_p, sim_time)], dtype=INDEX_DTYPE)
+
+        index_filename = self.index_filename(self.shard)
+        stats_filename = self.stats_filename(self.shard)
+
+        records = os.path.getsize(index_filename) // INDEX_DTYPE.itemsize if os.path.exists(index_filename) else 0
+
+        append_aligned(stats_filename, stats_to_record(stats), records, stats_to_record(None))
+
+        if stats is not None and 'weight' in stats:
+            append_aligned(self.weights_filename(self.shard), np.array([stats['weight']], dtype=WEIGHT_DTYPE),
+                           records, np.array([np.nan], dtype=WEIGHT_DTYPE))
+
+        if stats is not None and 'decision' in stats:
+            append_aligned(self.decisions_filename(self.shard), decision_to_record(stats), records,
+                           decision_to_record(None))
+
+        with open(index_filename, 'ab') as f:
+            f.write(record.tobytes())
+
+    def index(self, reload=False):
+        """Returns the records of all runs in the store, with their statistics, likelihood ratios and decisions of
+        the sequential test, and with the name of their shard in the `shard` column. Runs without statistics have
+        `nan` or `-1` in the statistics columns, runs without a likelihood ratio have `nan` in the `weight` column,
+        and runs without a sequential test have `-1` in the `decision` column and `nan` as the alpha and the
+        thresholds of the test.
+
+        :param reload: Whether to read the index files again. Defaults to `False`.
+        :type reload: optional, bool
+
+        :return: The records.
+        :rtype: :class:`numpy.ndarray`
+        """
+        if self.__index is None or reload:
+            records = []
+            stats = []
+            weights = []
+            decisions = []
+            shards = []
+
+            for filename in sorted(glob.glob(os.path.join(self.path, 'index_*.bin'))):
+                shard = os.path.basename(filename)[len('index_'):-len('.bin')]
+                shard_records = np.fromfile(filename, dtype=INDEX_DTYPE)
+
+                # The rows of a run may have been written before its index record.
+                records.append(shard_records)
+                stats.append(read_aligned(self.stats_filename(shard), STATS_DTYPE, len(shard_records),
+                                          stats_to_record(None)))
+                weights.append(read_aligned(self.weights_filename(shard), WEIGHT_DTYPE, len(shard_records), np.nan))
+                decisions.append(read_aligned(self.decisions_filename(shard), DECISION_DTYPE, len(shard_records),
+                                              decision_to_record(None)))
+                shards.extend([shard] * len(shard_records))
+
+            records = np.concatenate(records) if records else np.zeros(0, dtype=INDEX_DTYPE)
+            stats = np.concatenate(stats) if stats else np.zeros(0, dtype=STATS_DTYPE)
+            weights = np.concatenate(weights) if weights else np.zeros(0, dtype=WEIGHT_DTYPE)
+            decisions = np.concatenate(decisions) if decisions else np.zeros(0, dtype=DECISION_DTYPE)
+
+            columns = ([(name, STATS_DTYPE[name]) for name in STATS_COLUMNS] + [('weight', WEIGHT_DTYPE)]
+                       + DECISION_DTYPE.descr)
+            index = np.zeros(len(records), dtype=INDEX_DTYPE.descr + columns + [('shard', 'U64')])
+
+            for name in INDEX_DTYPE.names:
+                index[name] = records[name]
+
+            for name in STATS_COLUMNS:
+                index[name] = stats[name]
+
+            index['weight'] = weights
+            for name in DECISION_DTYPE.names:
+                index[name] = decisions[name]
+
+            index['shard'] = shards
+
+            self.__index = index
+            self.__keys = set(zip(np.round(index['param'], 6).tolist(), index['replicate'].tolist()))
+
+        return self.__index
+
+    def runs(self, param, runs=None):
+        """Returns the records of the runs for the given parameter, ordered by replicate.
+
+        :param param: The parameter of the experiment.
+        :type param: float
+        :param runs: The maximum number of runs to return. Defaults to `None`, in which case all runs are returned.
+        :type runs: optional, int
+
+        :return: The records.
+        :rtype: :class:`numpy.ndarray`
+        """
+        index = self.index()
+        records = index[np.isclose(index['param'], param)]
+        records = records[np.argsort(records['replicate'], kind='stable')]
+
+        return records[:runs] if runs is not None else records
+
+    def exists(self, param, replicate):
+        """Returns whether the store contains a run for the given parameter and replicate.
+
+        :param param: The parameter of the experiment.
+        :type param: float
+        :param replicate: The number of the run for the parameter.
+        :type replicate: int
+
+        :return: Whether the run exists.
+        :rtype: bool
+        """
+        self.index()
+
+        return (round(float(param), 6), int(replicate)) in self.__keys
+
+    def rounds(self, shard):
+        """Returns a read-only memory map of the rounds of the given shard.
+
+        :param shard: The name of the shard.
+        :type shard: str
+
+        :return: The rounds.
+        :rtype: :class:`numpy.memmap`
+        """
+        if shard not in self.__shards:
+            self.__shards[shard] = np.memmap(self.shard_filename(shard), dtype=ROUND_DTYPE, mode='r')
+
+        return self.__shards[shard]
+
+    def alice(self, record):
+        """Returns the rounds recorded by Alice in the given run.
+
+        :param record: The record of the run.
+        :type record: :class:`numpy.void`
+
+        :return: The rounds.
+        :rtype: :class:`numpy.ndarray`
+        """
+        offset = int(record['alice_offset'])
+
+        return self.rounds(str(record['shard']))[offset:offset + int(record['alice_length'])]
+
+    def bob(self, record):
+        """Returns the rounds recorded by Bob in the given run.
+
+        :param record: The record of the run.
+        :type record: :class:`numpy.void`
+
+        :return: The rounds.
+        :rtype: :class:`numpy.ndarray`
+        """
+        offset = int(record['bob_offset'])
+
+        return self.rounds(str(record['shard']))[offset:offset + int(record['bob_length'])]
+
+
+def import_npz(store, directory):
+    """Imports the results in the former format, one `result_{param}_{replicate}.npz` file per run, into a store.
+    Runs that are in the store already are skipped.
+
+    :param store: The store to import the results into.
+    :type store: :class:`QPV_BB84_e.experiments.result_store.ResultStore`
+    :param directory: The directory with the npz files.
+    :type directory: str
+
+    :return: The number of imported runs.
+    :rtype: int
+    """
+    pattern = re.compile(r'result_(-?[0-9.]+)_([0-9]+)\.npz$')
+    imported = 0
+
+    for filename in sorted(os.listdir(directory)):
+        match = pattern.match(filename)
+
+        if not match:
+            continue
+
+        param, replicate = float(match.group(1)), int(match.group(2))
+
+        if store.exists(param, replicate):
+            continue
+
+        results = np.load(os.path.join(directory, filename), allow_pickle=True)
+        params = results['params']
+
+        # The honest results have no delta_p: [d, n, m, v_pos, runs] or [d, n, m, v_pos, delta_p, runs].
+        delta_p = params[4] if len(params) > 5 else np.nan
+
+        # The statistics of the simulator were pickled, the batch engines have none.
+        sim_stats = results['stats'].item()
+
+        if isinstance(sim_stats, dict):
+            sim_stats = None
+
+        alice_data = results['alice_data'].item()
+        stats = run_stats(alice_data, summary_value(sim_stats, SIMULATION_TIME), sim_stats=sim_stats)
+
+        store.append(param, replicate, alice_data, results['bob_data'].item(), params[0], params[1], params[2],
+                     params[3], delta_p, stats=stats)
+        imported += 1
+
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import npz results into a result store.')
+    parser.add_argument('directory', type=str, help='The directory with the npz files.')
+    parser.add_argument('store', type=str, help='The directory of the result store.')
+
+    args = parser.parse_args()
+
+    print(import_npz(ResultStore(args.store), args.directory), 'runs imported')
+
+
+if __name__ == '__main__':
+    main()
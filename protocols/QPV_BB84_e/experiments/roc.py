@@ -0,0 +1,229 @@
+from QPV_BB84_e.verifiers.sequential_test import ACCEPT, REJECT
+from QPV_BB84_e.experiments.result_store import DECISION_DTYPE
+
+import numpy as np
+
+"""
+roc.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the success rate of the adversaries over the significance level alpha. The verifiers accept
+a run when its correctness rate R_c and reporting rate R_r exceed the alpha-percentiles of the rates of the
+honest prover. The honest samples are sorted once, after which the thresholds and the success rates for all
+alphas follow from a single search per adversarial sample. Runs of the adversaries simulated with importance
+sampling count with their likelihood ratio, which gives an unbiased estimate of the success rate under the
+distribution of the protocol. Runs that a sequential test stopped early only have the decision of the test, which
+is their outcome in the joint test at the alpha and the thresholds it was made for. At other alphas, and in the
+tests on R_c and R_r alone, they are left out as missing.
+"""
+
+
+# The tests of which the success rates are computed: both rates, or only one of them.
+TESTS = ['joint', 'R_c', 'R_r']
+
+
+def thresholds(honest, alphas):
+    """Returns the alpha-percentiles of the honest samples, interpolated linearly between the closest ranks.
+
+    :param honest: The sorted honest samples, or rows of sorted samples.
+    :type honest: :class:`numpy.ndarray`
+    :param alphas: The sorted significance levels, between 0 and 1.
+    :type alphas: :class:`numpy.ndarray`
+
+    :return: The thresholds, nondecreasing in alpha, per row of samples.
+    :rtype: :class:`numpy.ndarray`
+    """
+    index = (np.shape(honest)[-1] - 1) * np.asarray(alphas, dtype=float)
+
+    lower = np.floor(index).astype(int)
+    upper = np.ceil(index).astype(int)
+    fraction = index - lower
+
+    # Exact between equal samples, and kept nondecreasing against rounding, so that it can be searched.
+    return np.maximum.accumulate(honest[..., lower] + fraction * (honest[..., upper] - honest[..., lower]), axis=-1)
+
+
+def stopped_runs(rates):
+    """Returns the decisions of the sequential test, with the alpha and the thresholds they were made for, of the
+    runs that it stopped early, which are the runs with a decision but without rates.
+
+    :param rates: The rates of the runs, with the array `R_c` and optionally `decision`, `decision_alpha`,
+        `R_c_threshold` and `R_r_threshold`.
+    :type rates: dict
+
+    :return: A dictionary with these arrays for the stopped runs and `nan` for the other runs, or `None` if no
+        run was simulated with a sequential test.
+    :rtype: dict
+    """
+    if rates.get('decision') is None:
+        return None
+
+    stopped = np.isnan(rates['R_c']) & ~np.isnan(rates['decision'])
+
+    return {key: np.where(stopped, rates[key], np.nan) for key in DECISION_DTYPE.names}
+
+
+def stopped_outcomes(stopped, alphas, R_c_thresholds, R_r_thresholds):
+    """Returns the outcomes of the joint test for runs that a sequential test stopped early, and whether they are
+    known. An outcome is only known at the alpha the decision was made for. An accepted run has rates above the
+    thresholds of its test, so that it passes at thresholds that are not higher, and a rejected run has a rate
+    that does not exceed its threshold, so that it fails at thresholds that are not lower. For thresholds estimated
+    from the same honest runs, both hold.
+
+    :param stopped: The decisions, alphas and thresholds of the stopped runs, see :func:`stopped_runs`, of shape
+        (..., runs).
+    :type stopped: dict
+    :param alphas: The significance levels, between 0 and 1.
+    :type alphas: :class:`numpy.ndarray`
+    :param R_c_thresholds: The thresholds on R_c at the alphas, of shape (..., alphas).
+    :type R_c_thresholds: :class:`numpy.ndarray`
+    :param R_r_thresholds: The thresholds on R_r at the alphas, of shape (..., alphas).
+    :type R_r_thresholds: :class:`numpy.ndarray`
+
+    :return: Whether the runs pass and whether their outcome is known, of shape (..., runs, alphas).
+    :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+    """
+    decision = stopped['decision'][..., np.newaxis]
+    R_c = stopped['R_c_threshold'][..., np.newaxis]
+    R_r = stopped['R_r_threshold'][..., np.newaxis]
+
+    R_c_thresholds = R_c_thresholds[..., np.newaxis, :]
+    R_r_thresholds = R_r_thresholds[..., np.newaxis, :]
+
+    # The same thresholds may differ by rounding, as they are interpolated for a different list of alphas.
+    R_c_equal = np.isclose(R_c_thresholds, R_c, rtol=1e-12, atol=0)
+    R_r_equal = np.isclose(R_r_thresholds, R_r, rtol=1e-12, atol=0)
+
+    at_alpha = np.isclose(stopped['decision_alpha'][..., np.newaxis], alphas)
+    accepted = (decision == ACCEPT) & ((R_c_thresholds <= R_c) | R_c_equal) & ((R_r_thresholds <= R_r) | R_r_equal)
+    rejected = (decision == REJECT) & ((R_c_thresholds >= R_c) | R_c_equal) & ((R_r_thresholds >= R_r) | R_r_equal)
+
+    return at_alpha & accepted, at_alpha & (accepted | rejected)
+
+
+def success_curve(R_c_honest, R_r_honest, R_c_adv, R_r_adv, alphas, weights=None, stopped=None):
+    """Returns the rate at which the runs of the adversaries pass the tests of the verifiers, for every alpha. A run
+    passes a test at alpha if its rate exceeds the threshold at alpha. As the thresholds do not decrease in alpha, a
+    run passes for all alphas below the first at which the threshold reaches its rate, which is found by a binary
+    search.
+
+    :param R_c_honest: The correctness rates of the honest runs.
+    :type R_c_honest: :class:`numpy.ndarray`
+    :param R_r_honest: The reporting rates of the honest runs.
+    :type R_r_honest: :class:`numpy.ndarray`
+    :param R_c_adv: The correctness rates of the runs of the adversaries.
+    :type R_c_adv: :class:`numpy.ndarray`
+    :param R_r_adv: The reporting rates of the runs of the adversaries.
+    :type R_r_adv: :class:`numpy.ndarray`
+    :param alphas: The significance levels, between 0 and 1.
+    :type alphas: :class:`numpy.ndarray`
+    :param weights: The likelihood ratios of the runs of the adversaries, where `nan` counts as `1`. Defaults to
+        `None`, in which case every run counts once.
+    :type weights: optional, :class:`numpy.ndarray`
+    :param stopped: The decisions of the sequential test, with the alpha and the thresholds they were made for, of
+        the runs of the adversaries that it stopped early, which have no rates, see :func:`stopped_runs`. A
+        stopped run only counts in the joint test at the alpha of its decision, see :func:`stopped_outcomes`, and
+        is left out of the success rates elsewhere. Defaults to `None`.
+    :type stopped: optional, dict
+
+    :return: A dictionary with the success rates for the joint test and the tests on R_c and R_r alone. The rates
+        are `nan` where no run counts.
+    :rtype: dict
+    """
+    alphas = np.asarray(alphas, dtype=float)
+
+    if not (len(R_c_honest) and len(R_c_adv)):
+        return {test: np.full(len(alphas), np.nan) for test in TESTS}
+
+    order = np.argsort(alphas, kind='stable')
+
+    R_c_thresholds = thresholds(np.sort(R_c_honest), alphas[order])
+    R_r_thresholds = thresholds(np.sort(R_r_honest), alphas[order])
+
+    if weights is not None:
+        weights = np.nan_to_num(np.asarray(weights, dtype=float), nan=1.)
+
+    is_stopped = ~np.isnan(stopped['decision']) if stopped is not None else np.zeros(len(R_c_adv), dtype=bool)
+    complete = ~is_stopped
+
+    # The number of sorted alphas for which every complete run passes.
+    passes = {
+        'R_c': np.searchsorted(R_c_thresholds, R_c_adv[complete], side='left'),
+        'R_r': np.searchsorted(R_r_thresholds, R_r_adv[complete], side='left')
+    }
+    passes['joint'] = np.minimum(passes['R_c'], passes['R_r'])
+
+    complete_weights = weights[complete] if weights is not None else None
+    counts = {}
+    runs = {}
+
+    for test in TESTS:
+        # The (weighted) number of runs that pass for at least k + 1 alphas, at index k.
+        counts[test] = np.cumsum(np.bincount(passes[test], complete_weights,
+                                             minlength=len(alphas) + 1)[::-1])[::-1][1:]
+        runs[test] = np.full(len(alphas), np.count_nonzero(complete))
+
+    if is_stopped.any():
+        passed, known = stopped_outcomes({key: values[is_stopped] for key, values in stopped.items()},
+                                         alphas[order], R_c_thresholds, R_r_thresholds)
+        stopped_weights = weights[is_stopped] if weights is not None else np.ones(np.count_nonzero(is_stopped))
+
+        counts['joint'] = counts['joint'] + np.sum(passed * stopped_weights[:, np.newaxis], axis=0)
+        runs['joint'] = runs['joint'] + np.count_nonzero(known, axis=0)
+
+    result = {}
+
+    for test in TESTS:
+        rates = np.empty(len(alphas))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates[order] = np.where(runs[test] > 0, counts[test] / runs[test], np.nan)
+
+        result[test] = rates
+
+    return result
+
+
+def success_surface(honest, adv, alphas):
+    """Returns the success rates of the adversaries for every parameter of a sweep and every alpha. Missing runs are
+    left out.
+
+    :param honest: The rates of the honest runs, with the arrays `R_c` and `R_r` of shape (parameters, runs).
+    :type honest: dict
+    :param adv: The rates of the runs of the adversaries, with the arrays `R_c` and `R_r` of shape
+        (parameters, runs), and optionally their likelihood ratios `weight` and the decisions of their sequential
+        test with the alpha and thresholds they were made for, `decision`, `decision_alpha`, `R_c_threshold` and
+        `R_r_threshold`, of the same shape. The runs that were stopped early have `nan` rates and a decision.
+    :type adv: dict
+    :param alphas: The significance levels, between 0 and 1.
+    :type alphas: :class:`numpy.ndarray`
+
+    :return: A dictionary with the success rates for the joint test and the tests on R_c and R_r alone, of shape
+        (parameters, alphas).
+    :rtype: dict
+    """
+    result = {test: np.empty((len(honest['R_c']), len(alphas))) for test in TESTS}
+    weights = adv.get('weight')
+    stopped = stopped_runs(adv)
+
+    for i in range(len(honest['R_c'])):
+        honest_found = ~np.isnan(honest['R_c'][i])
+        adv_found = ~np.isnan(adv['R_c'][i])
+
+        if stopped is not None:
+            adv_found |= ~np.isnan(stopped['decision'][i])
+
+        curve = success_curve(honest['R_c'][i][honest_found], honest['R_r'][i][honest_found],
+                              adv['R_c'][i][adv_found], adv['R_r'][i][adv_found], alphas,
+                              weights[i][adv_found] if weights is not None else None,
+                              {key: values[i][adv_found] for key, values in stopped.items()}
+                              if stopped is not None else None)
+
+        for test in TESTS:
+            result[test][i] = curve[test]
+
+    return result
@@ -0,0 +1,221 @@
+from collections import Counter
+from QPV_BB84_e.honest_player.charlie import Charlie
+from QPV_BB84_e.verifiers.batch_protocol import BatchProtocol, NO_ANSWER
+from QPV_BB84_e.verifiers.protocol import CCONN_SPEED, QCONN_SPEED, MEASURE_TIME
+from QPV_BB84_e.verifiers.outcomes import INCORRECT, CORRECT, NO_PHOTON, NOT_SENT, count_outcomes
+
+import math
+import argparse
+import numpy as np
+
+"""
+batch_charlie.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains a vectorised implementation of an honest player Charlie in the QPV_BB84_e protocol, which
+computes the answers for thousands of rounds at once instead of simulating each round with NetSquid events.
+"""
+
+
+# The categories of Alice's results that are compared in the cross-check.
+CATEGORIES = {'CORRECT': CORRECT, 'INCORRECT': INCORRECT, 'NO_PHOTON': NO_PHOTON, 'NOT_SENT': NOT_SENT}
+
+
+class BatchCharlie():
+    """This is a vectorised class representation of the honest player Charlie in the QPV_BB84_e protocol.
+    It takes the same parameters as :class:`QPV_BB84_e.honest_player.charlie.Charlie`, and is statistically
+    equivalent to it. When instantiating this class, a :class:`QPV_BB84_e.verifiers.batch_protocol.BatchProtocol`
+    object is instantiated, representing the verifiers.
+
+    :param n: The number of rounds to run the protocol for.
+    :type n: int
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param P_A: The position of Alice on the real number line.
+    :type P_A: float
+    :param P_C: The position of Charlie on the real number line.
+    :type P_C: float
+    :param P_B: The position of Bob on the real number line.
+    :type P_B: float
+    :param P_v: The verification position on the real number line.
+    :type P_v: float
+    :param prob_absorption: The probability of absorption of a photon when travelling through a beam splitter.
+        Defaults to `.3`.
+    :type prob_absorption: optional, float
+    :param detector_efficiency: The detection efficiency of the photon detector. Defaults to `.96`.
+    :type detector_efficiency: optional, float
+    :param seed: The seed of the random number generator. Defaults to `None`.
+    :type seed: optional, int
+    :param sequential_test: A test that stops a run as soon as its decision is settled. Defaults to `None`.
+    :type sequential_test: optional, :class:`QPV_BB84_e.verifiers.sequential_test.SequentialTest`
+    """
+    def __init__(self, n, m, P_A, P_C, P_B, P_v, prob_absorption=.3, detector_efficiency=.96, seed=None,
+                 sequential_test=None):
+        self.model = BatchProtocol(n, m, P_A, P_B, P_v, seed=seed, sequential_test=sequential_test)
+        self.params = (n, m, P_A, P_C, P_B, P_v)
+        self.position = P_C
+
+        self.prob_detection = (1 - prob_absorption) * detector_efficiency
+        self.prob_survival, self.bloch_length = self.model.quantum_channel(P_C - P_A)
+
+        self.setup_timing_vals()
+
+    def setup_timing_vals(self):
+        """Computes the arrival times of the messages of the verifiers and the qubit at Charlie, relative to the
+        moment that the messages of both verifiers reach P_v.
+        """
+        self.m_0_arrival = (self.position - self.model.verification_position) / CCONN_SPEED * 1e9
+        self.m_1_arrival = (self.model.verification_position - self.position) / CCONN_SPEED * 1e9
+        self.qubit_arrival = (self.position - self.model.verification_position) / QCONN_SPEED * 1e9
+
+        # Charlie waits for a picosecond after receiving both messages before checking for the qubit.
+        self.act_time = max(self.m_0_arrival, self.m_1_arrival) + .001
+        self.qubit_in_time = self.qubit_arrival <= self.act_time or math.isclose(self.qubit_arrival, self.act_time)
+
+    def reset(self, n=None, seed=None, streams=None):
+        """Resets the protocol for the next run.
+
+        :param n: The number of rounds to run the protocol for in the next run. Defaults to the current value.
+        :type n: optional, int
+        :param seed: A seed for the random number generator. Defaults to `None`.
+        :type seed: optional, int
+        :param streams: The random streams of the next run. Defaults to `None`.
+        :type streams: optional, :class:`QPV_BB84_e.verifiers.random_streams.RandomStreams`
+        """
+        self.model.reset(n, seed, streams)
+
+    def answer(self, rounds):
+        """Computes Charlie's answers for an array of rounds.
+
+        :param rounds: A dictionary with the arrays of sampled rounds, as returned by
+            :meth:`QPV_BB84_e.verifiers.batch_protocol.BatchProtocol.sample_rounds`.
+        :type rounds: dict
+
+        :return: A dictionary with the answers to Alice and Bob and their arrival times.
+        :rtype: dict
+        """
+        rng = self.model.rng
+        size = len(rounds['b'])
+
+        arrived = rounds['sent'] & (rng.random(size) < self.prob_survival) & self.qubit_in_time
+        detected = arrived & (rng.random(size) < self.prob_detection)
+
+        # The depolarised state gives the correct outcome with probability (1 + s) / 2 after the inverse gate.
+        correct = rng.random(size) < (1 + self.bloch_length) / 2
+        outcome = np.where(correct, rounds['b'], 1 - rounds['b'])
+        answer = np.where(detected, outcome, NO_ANSWER)
+
+        # The measurement program only runs when the qubit has arrived.
+        send_time = self.act_time + np.where(arrived, MEASURE_TIME, 0)
+
+        return {
+            'alice': answer,
+            'bob': answer,
+            'alice_arrival': send_time + (self.position - self.model.alice_position) / CCONN_SPEED * 1e9,
+            'bob_arrival': send_time + (self.model.bob_position - self.position) / CCONN_SPEED * 1e9
+        }
+
+    def run(self):
+        """Runs the QPV_BB84_e protocol with Charlie partaking as an honest player.
+
+        :return: The statistics of the run, the results of Alice, and the results of Bob.
+        :rtype: list
+        """
+        return self.model.run(self)
+
+    def cross_check(self, runs, threshold=4):
+        """Compares this engine with the event-driven :class:`QPV_BB84_e.honest_player.charlie.Charlie` by running
+        both for the given number of runs. For every category of Alice's results and for the timing, the
+        proportion of rounds is compared with a two-proportion z-test.
+
+        :param runs: The number of runs for each engine.
+        :type runs: int
+        :param threshold: The largest absolute z-score for which the engines are considered equivalent.
+            Defaults to `4`.
+        :type threshold: optional, float
+
+        :return: A dictionary with per category the proportions of both engines, the z-score and the p-value,
+            and whether all categories passed.
+        :rtype: dict
+        """
+        counters = []
+
+        for engine in ['batch', 'event']:
+            counter = Counter()
+
+            for _ in range(runs):
+                if engine == 'batch':
+                    _, alice_data, _ = self.run()
+                else:
+                    _, alice_data, _ = Charlie(*self.params).run()
+
+                counts = count_outcomes(alice_data['r_i'])
+
+                for category, code in CATEGORIES.items():
+                    counter[category] += int(counts[code])
+
+                counter['on_time'] += int(np.count_nonzero(alice_data['t_i']))
+                counter['rounds'] += len(alice_data['r_i'])
+
+            counters.append(counter)
+
+        report = {'passed': True}
+
+        for category in list(CATEGORIES) + ['on_time']:
+            (x_1, n_1), (x_2, n_2) = [(counter[category], counter['rounds']) for counter in counters]
+            p_1, p_2 = x_1 / n_1, x_2 / n_2
+            p = (x_1 + x_2) / (n_1 + n_2)
+
+            stderr = math.sqrt(p * (1 - p) * (1 / n_1 + 1 / n_2))
+            z = (p_1 - p_2) / stderr if stderr > 0 else 0
+
+            report[category] = {'batch': p_1, 'event': p_2, 'z': z, 'p_value': math.erfc(abs(z) / math.sqrt(2))}
+            report['passed'] = report['passed'] and abs(z) <= threshold
+
+        return report
+
+
+def main():
+    # For debugging, run the vectorised protocol with Charlie.
+    parser = argparse.ArgumentParser(description="""Vectorised QPV_BB84 simulation.
+                                     Alice and Bob are the verifiers, Charlie is the prover.""")
+    parser.add_argument('iterations', metavar='n', type=int, help='The number of iterations (qubits).')
+    parser.add_argument('bases', metavar='m', type=int, help='The number of bases to choose from.')
+    parser.add_argument('positions', metavar='player positions', type=float, nargs=3,
+                        help='The positions of Alice (P_A), Charlie (P_C), and Bob (P_B) on the real number line.')
+    parser.add_argument('v_pos', metavar='verification position (P_V)', type=float,
+                        help='The position to verify for. In order to succeed, P_C should be equal P_V.')
+    parser.add_argument('--cross-check', metavar='runs', type=int, default=0,
+                        help='Compare the vectorised and event-driven engines over the given number of runs.')
+
+    args = parser.parse_args()
+
+    if ((args.positions[0] >= args.positions[1] or args.positions[1] >= args.positions[2]) or
+            (args.positions[0] >= args.v_pos or args.v_pos >= args.positions[2])):
+        parser.error('It is required that P_A < P_C < P_B and P_A < P_V < P_B.')
+
+    P_A, P_C, P_B = args.positions
+
+    charlie = BatchCharlie(args.iterations, args.bases, P_A, P_C, P_B, args.v_pos)
+
+    if args.cross_check:
+        report = charlie.cross_check(args.cross_check)
+
+        for category, values in report.items():
+            print(category, values)
+    else:
+        stats, alice_data, bob_data = charlie.run()
+
+        print(stats)
+        print('Alice\'s data (correct / on time per round):')
+        print(alice_data['r_i'], alice_data['t_i'])
+        print('Bob\'s data (correct / on time per round):')
+        print(bob_data['r_i'], bob_data['t_i'])
+
+
+if __name__ == '__main__':
+    main()
@@ -39,17 +39,39 @@ class Charlie():
     :type P_B: float
     :param P_v: The verification position on the real number line.
     :type P_v: float
+    :param pipeline_depth: The maximum number of rounds in flight at once, see
+        :class:`QPV_BB84_e.verifiers.protocol.Protocol`. Defaults to `1`.
+    :type pipeline_depth: optional, int
+    :param round_period: The time between the start of consecutive rounds in nanoseconds in pipelined mode.
+    :type round_period: optional, float
+    :param sequential_test: A test that stops a run as soon as its decision is settled. Defaults to `None`.
+    :type sequential_test: optional, :class:`QPV_BB84_e.verifiers.sequential_test.SequentialTest`
+    :param channel_noise: How the noise of the source and the fibre from Alice is applied, see
+        :class:`QPV_BB84_e.verifiers.protocol.Protocol`. Defaults to `staged`.
+    :type channel_noise: optional, str
+    :param loss_first: Whether the loss of photons, including at the beam splitter and the detector of Charlie, is
+        sampled up front by Alice, see :class:`QPV_BB84_e.verifiers.protocol.Protocol`. Defaults to `False`.
+    :type loss_first: optional, bool
+    :param fast_forward: Whether the runs of lost rounds are skipped in loss-first mode, see
+        :class:`QPV_BB84_e.verifiers.protocol.Protocol`. Defaults to `False`.
+    :type fast_forward: optional, bool
+    :param record_transcript: Whether the verifiers record the transcript of their side of the rounds, see
+        :class:`QPV_BB84_e.verifiers.protocol.Protocol`. Defaults to `False`.
+    :type record_transcript: optional, bool
     """
-    def __init__(self, n, m, P_A, P_C, P_B, P_v):
-        self.model = Protocol(n, m, P_A, P_B, P_v)
+    def __init__(self, n, m, P_A, P_C, P_B, P_v, pipeline_depth=1, round_period=None, sequential_test=None,
+                 channel_noise='staged', loss_first=False, fast_forward=False, record_transcript=False):
+        self.model = Protocol(n, m, P_A, P_B, P_v, pipeline_depth, round_period, sequential_test, channel_noise,
+                              loss_first, fast_forward, record_transcript)
+        self.loss_first = loss_first
         self.setup(P_C)
 
         charlie = self.charlie['node']
-        # The results that Charlie measures.
-        charlie.cdata['c_i'] = []
-        charlie.cdata['n'] = n
         charlie.cdata['m'] = m
 
+        self.protocol = None
+        self.reset(n)
+
     def create_processor(self, prob_absorption=.3, detector_efficiency=.96):
         """Returns a quantum processor with the given specifications. The processor
         supports the preparation gate used in the QPV_BB84_e protocol and loss-resistant measurement
@@ -67,6 +89,13 @@ class Charlie():
         operation_error_model = BeamSplitterErrorModel(prob_absorption=prob_absorption)
         measurement_error_model = PhotonDetectorErrorModel(efficiency=detector_efficiency)
 
+        # In loss-first mode, Alice samples the loss of our components up front.
+        if self.loss_first:
+            self.model.set_prover_survival((1 - prob_absorption) * detector_efficiency)
+
+            operation_error_model = None
+            measurement_error_model = None
+
         instructions = [
             PhysicalInstruction(PreparationGate(), duration=0, quantum_noise_model=operation_error_model),
             PhysicalInstruction(MeasurementGate(), duration=.02, quantum_noise_model=measurement_error_model,
@@ -100,16 +129,42 @@ class Charlie():
 
         self.charlie['node'].ports[port_c].forward_input(self.charlie['node'].qmemory.ports['qin0'])
 
+    def reset(self, n=None, seed=None, streams=None):
+        """Resets the per-run state of Charlie and the verifiers, so that the protocol can be run again
+        on the same network.
+
+        :param n: The number of rounds to run the protocol for in the next run. Defaults to the current value.
+        :type n: optional, int
+        :param seed: A seed for the random number generators used in the simulation. Defaults to `None`.
+        :type seed: optional, int
+        :param streams: The random streams of the next run. Defaults to `None`, in which case the global random
+            number generators are used.
+        :type streams: optional, :class:`QPV_BB84_e.verifiers.random_streams.RandomStreams`
+        """
+        if self.protocol:
+            self.protocol.stop()
+
+        self.model.reset(n, seed, streams)
+
+        charlie = self.charlie['node']
+        charlie.qmemory.reset()
+
+        # The results that Charlie measures.
+        charlie.cdata['c_i'] = []
+
+        if n is not None:
+            charlie.cdata['n'] = n
+
     def run(self):
         """Runs the QPV_BB84_e protocol with Charlie partaking as an honest player.
 
-        :return: The simulation statistics, the results of Alice, and the results of Bob.
+        :return: The statistics of the run, the results of Alice, and the results of Bob.
         :rtype: list
         """
         ns.sim_reset()
 
-        protocol = CharlieProtocol(self.charlie['node'])
-        protocol.start()
+        self.protocol = CharlieProtocol(self.charlie['node'])
+        self.protocol.start()
 
         return self.model.run()
 
@@ -124,6 +179,8 @@ def main():
                         help='The positions of Alice (P_A), Charlie (P_C), and Bob (P_B) on the real number line.')
     parser.add_argument('v_pos', metavar='verification position (P_V)', type=float,
                         help='The position to verify for. In order to succeed, P_C should be equal P_V.')
+    parser.add_argument('--pipeline', metavar=('depth', 'period'), type=float, nargs=2, default=None,
+                        help='Run with up to depth rounds in flight, starting a round every period nanoseconds.')
 
     args = parser.parse_args()
 
@@ -133,11 +190,16 @@ def main():
 
     P_A, P_C, P_B = args.positions
 
-    charlie = Charlie(args.iterations, args.bases, P_A, P_C, P_B, args.v_pos)
+    if args.pipeline:
+        charlie = Charlie(args.iterations, args.bases, P_A, P_C, P_B, args.v_pos, int(args.pipeline[0]),
+                          args.pipeline[1])
+    else:
+        charlie = Charlie(args.iterations, args.bases, P_A, P_C, P_B, args.v_pos)
 
     stats, alice_data, bob_data = charlie.run()
 
     print(stats)
+    print('Verification rate: {} rounds per second of simulated time'.format(charlie.model.verification_rate()))
     print('Alice\'s data (correct / on time per round):')
     print(alice_data['r_i'], alice_data['t_i'])
     print('Bob\'s data (correct / on time per round):')
@@ -3,6 +3,7 @@ from netsquid.components.qprogram import QuantumProgram
 from netsquid.components import instructions as instr
 from netsquid.qubits import qubitapi as qapi
 from QPV_BB84_e.custom_models.quantum_gates import PreparationGate
+from QPV_BB84_e.verifiers.profiler import profiled
 
 import netsquid as ns
 
@@ -63,10 +64,12 @@ class CharlieProtocol(NodeProtocol):
         self.c_port_bob = self.node.ports['c_bob']
 
     def process_m_0(self):
-        """Extract the message m_0 from the port with Alice.
+        """Extract the message m_0 from the port with Alice. In pipelined mode, the message also carries
+        the id of the round, which we echo in our answer.
         """
         msg = self.c_port_alice.rx_input().items
         self.m_0 = msg[0][1]
+        self.round_id = msg[0][2] if len(msg[0]) > 2 else None
 
     def process_m_1(self):
         """Extract the message m_1 from the port with Bob.
@@ -74,6 +77,22 @@ class CharlieProtocol(NodeProtocol):
         msg = self.c_port_bob.rx_input().items
         self.m_1 = msg[0][1]
 
+    @profiled
+    def send_answer(self, answer, value):
+        """Send an answer to Alice and Bob, tagged with the id of the round if the verifiers run in
+        pipelined mode.
+
+        :param answer: The type of answer, `MEASUREMENT` or `NO_PHOTON`.
+        :type answer: str
+        :param value: The measurement outcome, if any.
+        :type value: int
+        """
+        msg = (answer, value) if self.round_id is None else (answer, value, self.round_id)
+
+        self.c_port_alice.tx_output(msg)
+        self.c_port_bob.tx_output(msg)
+
+    @profiled
     def measure_qubit(self):
         """Start the quantum measurement program with the values received from Alice
         and Bob.
@@ -85,6 +104,7 @@ class CharlieProtocol(NodeProtocol):
         self.m_0 = None
         self.m_1 = None
 
+    @profiled
     def process_measurement(self):
         """Process the measurement outcome, and send the results to Alice and Bob. If the qubit has been
         lost in the measurement process, we tell Alice and Bob that the photon was lost.
@@ -97,12 +117,11 @@ class CharlieProtocol(NodeProtocol):
         qapi.discard(q)
 
         if c_i is not None:
-            self.c_port_alice.tx_output(('MEASUREMENT', c_i))
-            self.c_port_bob.tx_output(('MEASUREMENT', c_i))
+            self.send_answer('MEASUREMENT', c_i)
         else:
-            self.c_port_alice.tx_output(('NO_PHOTON', None))
-            self.c_port_bob.tx_output(('NO_PHOTON', None))
+            self.send_answer('NO_PHOTON', None)
 
+    @profiled
     def run(self):
         """Continuously check for messages from Alice or Bob.
         """
@@ -115,6 +134,7 @@ class CharlieProtocol(NodeProtocol):
 
         self.m_0 = None
         self.m_1 = None
+        self.round_id = None
 
         while True:
             # Check if we received a classical or quantum message and from whom.
@@ -144,8 +164,7 @@ class CharlieProtocol(NodeProtocol):
                 yield self.await_timer(end_time=ns.sim_time() + .001)
 
                 if not self.node.qmemory.peek(0)[0]:
-                    self.c_port_alice.tx_output(('NO_PHOTON', None))
-                    self.c_port_bob.tx_output(('NO_PHOTON', None))
+                    self.send_answer('NO_PHOTON', None)
 
                     self.m_0 = None
                     self.m_1 = None
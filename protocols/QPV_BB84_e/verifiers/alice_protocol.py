@@ -2,8 +2,11 @@ from netsquid.protocols.nodeprotocols import NodeProtocol
 from netsquid.components.qprogram import QuantumProgram
 from netsquid.components import instructions as instr
 from QPV_BB84_e.custom_models.quantum_gates import PreparationGate
+from QPV_BB84_e.verifiers.outcomes import INCORRECT, CORRECT, NO_PHOTON, NOT_SENT
+from QPV_BB84_e.verifiers.sequential_test import UNDECIDED
+from QPV_BB84_e.verifiers.profiler import profiled
 
-import random
+import heapq
 import math
 import netsquid as ns
 import numpy as np
@@ -88,19 +91,36 @@ class AliceProtocol(NodeProtocol):
 
         self.qubit_prep_time = self.node.cdata['qubit_prep_time']
 
-    def send_values_to_bob(self):
+    @profiled
+    def send_values_to_bob(self, round_id=None):
         """Send our choice of bit and r to Bob, so that he can check the prover's correctness and
-        send m_1.
+        send m_1. In pipelined mode, the round id is sent along.
+
+        :param round_id: The id of the round. Defaults to `None`.
+        :type round_id: optional, int
         """
-        self.r = random.randint(0, 2 * self.m)
-        self.c_port_bob.tx_output(('VALUES', [self.b, self.r]))
+        self.r = self.random.randint(0, 2 * self.m)
 
-    def choose_basis_and_bit(self):
-        """Choose a random basis to use and bit to encode."""
-        self.b = random.getrandbits(1)
-        self.theta = random.randint(0, self.m - 1)
-        self.phi = random.randint(0, np.round(2 * self.m * np.sin(np.arccos(2 * (self.theta / self.m) - 1))))
+        if self.skipped_messages is not None:
+            # The messages of Bob in the rounds that were skipped before this one.
+            self.c_port_bob.tx_output(('VALUES', [self.b, self.r], self.skipped_messages))
+            self.skipped_messages = None
+        else:
+            self.c_port_bob.tx_output(('VALUES', [self.b, self.r] + ([round_id] if round_id is not None else [])))
 
+    def choose_basis_and_bit(self):
+        """Choose a random basis to use and bit to encode. If the round follows skipped rounds, the bit is chosen
+        given that the photon survives.
+        """
+        if self.survives:
+            survival = self.source_survival()
+            self.b = int(self.random.random() < survival[1] / (survival[0] + survival[1]))
+        else:
+            self.b = self.random.getrandbits(1)
+        self.theta = self.random.randint(0, self.m - 1)
+        self.phi = self.random.randint(0, np.round(2 * self.m * np.sin(np.arccos(2 * (self.theta / self.m) - 1))))
+
+    @profiled
     def process_result(self, msg, results):
         """Process the result received from the prover. We check whether it was received within the
         expected time and whether it was correct. If we did not send a photon, we disregard the message.
@@ -109,27 +129,277 @@ class AliceProtocol(NodeProtocol):
         time_expected = 2 * self.classical_delta_time_P_v + self.node.cdata['c_quantum_time']
 
         # Account for small numerical errors with isclose()
-        results['t_i'].append(time_took <= time_expected or math.isclose(time_took, time_expected))
-
-        results['m_0_i'].append(self.theta - self.r % self.m)
+        on_time = time_took <= time_expected or math.isclose(time_took, time_expected)
+
+        if self.not_sent:
+            outcome = NOT_SENT
+        elif msg[0] == 'NO_PHOTON':
+            outcome = NO_PHOTON
+        else:
+            outcome = CORRECT if msg[1] == self.b else INCORRECT
+            self.node.cdata['ans_count'] += 1
 
-        if msg[0] == 'NO_PHOTON' and not self.not_sent:
-            results['r_i'].append(msg[0])
-        elif not self.not_sent:
-            r = msg[1]
+        results.append(outcome, on_time, self.theta - self.r % self.m)
 
-            results['r_i'].append(r == self.b)
-            self.node.cdata['ans_count'] += 1
+        if self.node.cdata['transcript'] is not None:
+            self.node.cdata['transcript'].append(self.b, self.theta, self.phi, self.r, not self.not_sent)
 
         self.not_sent = False
 
+        # The duration of the round, from the previous answer to this one.
+        self.round_duration = ns.sim_time() - self.result_time if self.result_time is not None else None
+        self.result_time = ns.sim_time()
+
+        self.check_sequential_test(results)
+
+        if self.node.cdata['fast_forward']:
+            self.skip_lost_rounds(outcome, on_time, results)
+
+    def check_sequential_test(self, results):
+        """Stop the simulation as soon as the decision of the sequential test is settled.
+
+        :param results: The buffer the rounds are recorded in.
+        :type results: :class:`QPV_BB84_e.verifiers.round_buffer.RoundBuffer`
+        """
+        test = self.node.cdata['sequential_test']
+
+        if test is not None and test.update(results) != UNDECIDED:
+            ns.sim_stop()
+
+    def source_survival(self):
+        """Returns the probabilities that the photon survives the beam splitter in loss-first mode, which it passes
+        once more if the X gate is applied.
+
+        :return: The probabilities of survival for the bit 0 and 1.
+        :rtype: (float, float)
+        """
+        absorption = self.node.cdata['loss_first']['absorption']
+
+        return 1 - absorption, (1 - absorption)**2
+
+    @profiled
+    def skip_lost_rounds(self, outcome, on_time, results):
+        """Skip the lost rounds that follow a lost round in fast-forward mode. As the rounds are independent, the
+        number of further rounds until the photon survives follows a geometric distribution. These rounds are
+        recorded at once, with the timing of the lost round that was simulated, and their duration is added to the
+        skipped time. The next round is one in which the photon survives.
+
+        :param outcome: The outcome code of the round that was simulated.
+        :type outcome: int
+        :param on_time: Whether the answer of the round was received within the expected time.
+        :type on_time: bool
+        :param results: The buffer the rounds are recorded in.
+        :type results: :class:`QPV_BB84_e.verifiers.round_buffer.RoundBuffer`
+        """
+        self.survives = False
+
+        if outcome not in [NO_PHOTON, NOT_SENT] or self.round_duration is None:
+            return
+
+        loss = self.node.cdata['loss_first']
+        survival = np.array(self.source_survival())
+        lost = 1 - survival * loss['channel'] * loss['prover']
+
+        skipped = int(self.rng.geometric(1 - np.mean(lost))) - 1
+        self.survives = True
+
+        if not skipped:
+            return
+
+        # The bit of a lost round, and whether its photon was lost before it was sent, given that it is lost.
+        b = (self.rng.random(skipped) < lost[1] / (lost[0] + lost[1])).astype(int)
+        not_sent = self.rng.random(skipped) * lost[b] < 1 - survival[b]
+
+        theta = self.rng.integers(0, self.m, skipped)
+        r = self.rng.integers(0, 2 * self.m + 1, skipped)
+
+        results.extend(np.where(not_sent, NOT_SENT, NO_PHOTON).astype(np.int8), np.full(skipped, on_time),
+                       theta - r % self.m)
+
+        if self.node.cdata['transcript'] is not None:
+            # The value of phi does not matter for a lost round, so it is only drawn for the transcript.
+            phi = self.rng.integers(0, np.round(2 * self.m * np.sin(np.arccos(2 * (theta / self.m) - 1))).astype(int)
+                                    + 1)
+
+            self.node.cdata['transcript'].extend(b, theta, phi, r, ~not_sent)
+
+        # Bob records these rounds when their messages reach him with those of the next round, so that the
+        # sequential test only takes them into account in the check of the next round.
+        self.skipped_messages = r
+        self.node.cdata['skipped_time'] += skipped * self.round_duration
+
+    def sample_loss(self):
+        """Sample where the photon of the round is lost in loss-first mode: at the beam splitter, which it passes
+        once more if the X gate is applied, or after it has been sent.
+
+        :return: `NOT_SENT` or `NO_PHOTON` when the photon is lost, and `None` when it is measured by the prover.
+        :rtype: int
+        """
+        loss = self.node.cdata['loss_first']
+
+        # Both values are drawn in every round, so that the stream stays aligned with that of other runs.
+        source, transit = self.loss_random.random(), self.loss_random.random()
+
+        if source >= self.source_survival()[self.b]:
+            return NOT_SENT
+
+        if transit >= loss['channel'] * loss['prover']:
+            return NO_PHOTON
+
+        return None
+
+    @profiled
     def prepare_qubit(self):
-        """Start the qubit preparation program with the chosen basis values.
+        """Start the qubit preparation program with the chosen basis values. In loss-first mode, no qubit is
+        prepared if the photon will be lost.
+
+        :return: Whether the qubit is being prepared.
+        :rtype: bool
         """
+        self.lost = None
+
+        if self.node.cdata['loss_first'] is not None and not self.survives:
+            self.lost = self.sample_loss()
+
+        self.survives = False
+
+        if self.lost is not None:
+            return False
+
         qubit_init_program = InitStateProgram()
         self.node.qmemory.execute_program(qubit_init_program, b=self.b, m=self.m, theta=self.theta,
                                           phi=self.phi, physical=True)
 
+        return True
+
+    @profiled
+    def start_round(self, actions):
+        """Start a new round in pipelined mode. The basis and bit are chosen and sent to Bob, and the
+        preparation of the qubit and the sending of m_0 are scheduled such that they reach P_v at the same
+        time as Bob's message.
+
+        :param actions: The heap of scheduled actions, as tuples of the time, the action and the round id.
+        :type actions: list
+        """
+        round_id = self.next_round_id
+        self.next_round_id += 1
+
+        self.choose_basis_and_bit()
+        self.send_values_to_bob(round_id)
+
+        self.rounds[round_id] = {'b': self.b, 'theta': self.theta, 'phi': self.phi, 'r': self.r,
+                                 'not_sent': False, 't_sent': None}
+
+        # The time at which m_1 reaches P_v, after Bob has received our values.
+        arrival_time = (ns.sim_time() + self.classical_delta_time_P_v + self.bob_classical_delta_time_P_v
+                        + max(0, -self.delta_send_time) + self.bob_classical_delta_time_P_v)
+
+        heapq.heappush(actions, (max(ns.sim_time(), arrival_time - self.quantum_delta_time_P_v
+                                     - self.qubit_prep_time), 'prepare', round_id))
+        heapq.heappush(actions, (arrival_time - self.classical_delta_time_P_v, 'm_0', round_id))
+
+    def restore_round(self, round_id):
+        """Restore the basis, bit and r of an outstanding round in pipelined mode.
+
+        :param round_id: The id of the round.
+        :type round_id: int
+        """
+        outstanding = self.rounds[round_id]
+
+        self.b, self.theta, self.phi, self.r = (outstanding['b'], outstanding['theta'], outstanding['phi'],
+                                                outstanding['r'])
+
+    def run_pipelined(self, results):
+        """Run the protocol with up to `pipeline_depth` rounds in flight, starting a new round every
+        `round_period` nanoseconds. Messages carry round ids, so that the answers of the prover can be
+        matched to the outstanding rounds and their own timing windows.
+
+        :param results: The buffer to record the rounds in.
+        :type results: :class:`QPV_BB84_e.verifiers.round_buffer.RoundBuffer`
+        """
+        depth = self.node.cdata['pipeline_depth']
+        period = self.node.cdata['round_period']
+
+        self.rounds = {}
+        self.next_round_id = 0
+        self.not_sent = False
+
+        actions = []
+        preparing = None
+        next_start = ns.sim_time()
+
+        while self.node.cdata['ans_count'] < self.node.cdata['n']:
+            now = ns.sim_time()
+
+            if len(self.rounds) < depth and (now >= next_start or math.isclose(now, next_start)):
+                self.start_round(actions)
+                next_start = now + period
+
+            # Perform the scheduled actions that are due, one qubit preparation at a time.
+            while actions and (actions[0][0] <= now or math.isclose(actions[0][0], now)):
+                if actions[0][1] == 'prepare' and preparing is not None:
+                    break
+
+                _, action, round_id = heapq.heappop(actions)
+
+                if round_id not in self.rounds:
+                    continue
+
+                if action == 'prepare':
+                    self.restore_round(round_id)
+
+                    if self.prepare_qubit():
+                        preparing = round_id
+                    else:
+                        self.rounds[round_id]['not_sent'] = self.lost == NOT_SENT
+                else:
+                    outstanding = self.rounds[round_id]
+                    outstanding['t_sent'] = now
+
+                    self.c_port_player.tx_output(('m_0', ((outstanding['theta'] - outstanding['r']) % (2 * self.m + 1),
+                                                          (outstanding['phi'] - outstanding['r']) % (2 * self.m + 1)),
+                                                  round_id))
+
+            wake_times = []
+
+            if actions and not (actions[0][1] == 'prepare' and preparing is not None):
+                wake_times.append(actions[0][0])
+
+            if len(self.rounds) < depth:
+                wake_times.append(next_start)
+
+            expr = self.await_port_input(self.c_port_player) | self.await_program(self.node.qmemory)
+
+            if wake_times:
+                expr = expr | self.await_timer(end_time=max(min(wake_times), ns.sim_time()))
+
+            expr = yield expr
+            terms = expr.first_term if wake_times else expr
+
+            if terms.second_term.value and preparing is not None:
+                # Only send the qubit if it has not been lost in manipulation.
+                if (self.node.qmemory.peek(0)[0].qstate):
+                    self.q_port_player.tx_output(self.node.qmemory.pop(positions=0))
+                elif preparing in self.rounds:
+                    self.rounds[preparing]['not_sent'] = True
+
+                preparing = None
+
+            if terms.first_term.value:
+                for msg in self.c_port_player.rx_input().items:
+                    # Disregard answers that do not belong to an outstanding round.
+                    if len(msg) < 3 or msg[2] not in self.rounds:
+                        continue
+
+                    self.restore_round(msg[2])
+                    outstanding = self.rounds.pop(msg[2])
+
+                    self.t_sent = outstanding['t_sent']
+                    self.not_sent = outstanding['not_sent']
+
+                    self.process_result(msg, results)
+
+    @profiled
     def run(self):
         """Continuously check for messages from the connected player or Bob, until n instances of
         :math:`c_1` and :math:`c_2` have been recorded.
@@ -137,9 +407,22 @@ class AliceProtocol(NodeProtocol):
         results = self.node.cdata['results']
 
         self.m = self.node.cdata['m']
+        self.random = self.node.cdata['random']
+        self.loss_random = self.node.cdata['loss_random']
         self.setup_ports()
         self.setup_timing_vals(self.node.cdata['network'])
 
+        self.survives = False
+        self.skipped_messages = None
+        self.result_time = None
+
+        if self.node.cdata['fast_forward']:
+            self.rng = np.random.default_rng(self.loss_random.getrandbits(64))
+
+        if self.node.cdata['pipeline_depth'] > 1:
+            yield from self.run_pipelined(results)
+            return
+
         received_bob_ready = False
         received_result = False
         qubit_ready = False
@@ -155,7 +438,7 @@ class AliceProtocol(NodeProtocol):
         yield self.await_timer(end_time=ns.sim_time() + max(self.classical_delta_time_P_v
                                                             + self.bob_classical_delta_time_P_v
                                + self.delta_send_time - self.qubit_prep_time - .001, 0))
-        self.prepare_qubit()
+        qubit_ready = not self.prepare_qubit()
 
         if (self.classical_delta_time_P_v + self.bob_classical_delta_time_P_v
                 + self.delta_send_time < self.qubit_prep_time - .001):
@@ -179,11 +462,11 @@ class AliceProtocol(NodeProtocol):
                 qubit_ready = False
                 received_bob_ready = False
 
-                # Only send the qubit if it has not been lost in manipulation.
-                if (self.node.qmemory.peek(0)[0].qstate):
+                # Only send the qubit if it has not been lost in manipulation. A photon that is lost after
+                # sending in loss-first mode is not prepared, and the prover will not receive it.
+                if self.lost is None and self.node.qmemory.peek(0)[0].qstate:
                     self.q_port_player.tx_output(self.node.qmemory.pop(positions=0))
-                else:
-                    results['r_i'].append('NOT_SENT')
+                elif self.lost != NO_PHOTON:
                     self.not_sent = True
 
                 if max(0, self.delta_send_time_classical) - self.delta_send_time > 0:
@@ -217,7 +500,7 @@ class AliceProtocol(NodeProtocol):
                 yield self.await_timer(end_time=ns.sim_time() + max(self.classical_delta_time_P_v
                                                                     + self.bob_classical_delta_time_P_v
                                        + self.delta_send_time - self.qubit_prep_time - .001, 0))
-                self.prepare_qubit()
+                qubit_ready = not self.prepare_qubit()
 
                 if (self.classical_delta_time_P_v + self.bob_classical_delta_time_P_v
                         + self.delta_send_time < self.qubit_prep_time - .001):
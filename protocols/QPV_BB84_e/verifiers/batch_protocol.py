@@ -0,0 +1,346 @@
+from QPV_BB84_e.verifiers.protocol import GATE_TIME, MEASURE_TIME, CCONN_SPEED
+from QPV_BB84_e.verifiers.outcomes import INCORRECT, CORRECT, NO_PHOTON, NOT_SENT
+from QPV_BB84_e.verifiers.round_buffer import RoundBuffer
+from QPV_BB84_e.verifiers.sequential_test import UNDECIDED
+from QPV_BB84_e.verifiers.run_stats import run_stats
+from QPV_BB84_e.custom_models.error_models import PhotonGeneratorErrorModel, compiled_depolarisation_parameter
+
+import math
+import time
+import numpy as np
+
+"""
+batch_protocol.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains a vectorised implementation of the verifiers in the QPV_BB84_e protocol. Instead of
+simulating every round with NetSquid events, whole arrays of rounds are sampled at once with NumPy. The
+players that partake in the protocol provide their answers for these arrays of rounds.
+"""
+
+
+# The answer of a player that did not report a measurement outcome.
+NO_ANSWER = -1
+
+
+class BatchProtocol():
+    """This is a vectorised class representation of the QPV_BB84_e protocol. It samples the same rounds as
+    :class:`QPV_BB84_e.verifiers.protocol.Protocol`, but for thousands of rounds at once. A player takes part
+    by implementing an `answer` method that returns the answers of the player for an array of rounds.
+
+    :param n: The number of rounds to run the protocol for.
+    :type n: int
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param P_A: The position of Alice on the real number line.
+    :type P_A: float
+    :param P_B: The position of Bob on the real number line.
+    :type P_B: float
+    :param P_v: The verification position on the real number line.
+    :type P_v: float
+    :param fidelity_loss: The amount of loss in fidelity for qubit initialisation. Defaults to `.005`.
+    :type fidelity_loss: optional, float
+    :param prob_absorption: the probability of absorption of a photon when travelling through a beam splitter.
+        Defaults to `.3`.
+    :type prob_absorption: optional, float
+    :param seed: The seed of the random number generator. Defaults to `None`.
+    :type seed: optional, int
+    :param sequential_test: A test that stops a run as soon as its decision is settled. Defaults to `None`.
+    :type sequential_test: optional, :class:`QPV_BB84_e.verifiers.sequential_test.SequentialTest`
+    """
+    def __init__(self, n, m, P_A, P_B, P_v, fidelity_loss=.005, prob_absorption=.3, seed=None,
+                 sequential_test=None):
+        self.n = n
+        self.m = m
+        self.sequential_test = sequential_test
+        self.fidelity_loss = fidelity_loss
+        self.prob_absorption = prob_absorption
+        self.rng = np.random.default_rng(seed)
+
+        self.__alice_position = P_A
+        self.__bob_position = P_B
+        self.__verification_position = P_v
+
+        # The same timing details as computed by the verifiers in the event-driven protocol.
+        self.alice_classical_delta_time_P_v = (P_v - P_A) / CCONN_SPEED * 1e9
+        self.bob_classical_delta_time_P_v = (P_B - P_v) / CCONN_SPEED * 1e9
+        self.c_quantum_time = GATE_TIME + MEASURE_TIME + .001
+
+    @property
+    def alice_position(self):
+        """Returns the position of Alice (P_A).
+
+        :return: Alice's position, P_A.
+        :rtype: float
+        """
+        return self.__alice_position
+
+    @property
+    def bob_position(self):
+        """Returns the position of Bob (P_B).
+
+        :return: Bob's position, P_B.
+        :rtype: float
+        """
+        return self.__bob_position
+
+    @property
+    def verification_position(self):
+        """Returns the verification position (P_v).
+
+        :return: The verification position, P_v.
+        :rtype: float
+        """
+        return self.__verification_position
+
+    def reset(self, n=None, seed=None, streams=None):
+        """Resets the protocol for the next run, in the same way as
+        :meth:`QPV_BB84_e.verifiers.protocol.Protocol.reset`.
+
+        :param n: The number of rounds to run the protocol for in the next run. Defaults to the current value.
+        :type n: optional, int
+        :param seed: A seed for the random number generator. Defaults to `None`, in which case the generator is
+            not reseeded.
+        :type seed: optional, int
+        :param streams: The random streams of the next run, of which the generator of the vectorised engine is
+            used. Defaults to `None`.
+        :type streams: optional, :class:`QPV_BB84_e.verifiers.random_streams.RandomStreams`
+        """
+        if n is not None:
+            self.n = n
+
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+
+        if streams is not None:
+            self.rng = streams.generator()
+
+    def choose_bases(self, size, rng=None):
+        r"""Chooses random bases for an array of rounds, with the same distribution as
+        :meth:`QPV_BB84_e.verifiers.alice_protocol.AliceProtocol.choose_basis_and_bit`.
+
+        :param size: The number of bases to choose.
+        :type size: int
+        :param rng: The random number generator to use. Defaults to the generator of the protocol.
+        :type rng: optional, :class:`numpy.random.Generator`
+
+        :return: The arrays of :math:`\theta` and :math:`\phi`.
+        :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+        """
+        rng = self.rng if rng is None else rng
+
+        theta = rng.integers(0, self.m, size)
+        phi_max = np.round(2 * self.m * np.sin(np.arccos(2 * (theta / self.m) - 1))).astype(int)
+        phi = rng.integers(0, phi_max + 1)
+
+        return theta, phi
+
+    def sample_rounds(self, size):
+        r"""Samples the verifiers' side of an array of rounds: the encoded bit, the basis, the value r and whether
+        Alice's photon survived the preparation.
+
+        :param size: The number of rounds to sample.
+        :type size: int
+
+        :return: A dictionary with the arrays `b`, `theta`, `phi`, `r` and `sent`.
+        :rtype: dict
+        """
+        b = self.rng.integers(0, 2, size)
+        theta, phi = self.choose_bases(size)
+        r = self.rng.integers(0, 2 * self.m + 1, size)
+
+        # The beam splitter of Alice's processor absorbs the photon during the preparation gate, and once more
+        # during the X gate if it is applied.
+        sent = self.rng.random(size) < (1 - self.prob_absorption)**(1 + b)
+
+        return {'b': b, 'theta': theta, 'phi': phi, 'r': r, 'sent': sent}
+
+    def source_bloch_length(self):
+        r"""Returns the length of the Bloch vector of a photon prepared by Alice. Since the photon generator starts
+        from :math:`| 0 \rangle` and the gates are unitary, it is the same for every round.
+
+        :return: The length of the Bloch vector.
+        :rtype: float
+        """
+        rho = np.array([[1, 0], [0, 0]], dtype=complex)
+
+        return PhotonGeneratorErrorModel(self.fidelity_loss).depolarisation_parameter(rho)
+
+    def quantum_channel(self, length, p_loss_init=.2, p_loss_length=.18, fidelity_loss=(.047, 50)):
+        """Returns the characteristics of a quantum connection from Alice with the given specifications, as used
+        by :class:`QPV_BB84_e.custom_models.network_components.QuantumConnection`.
+
+        :param length: The length of the channel in kilometres.
+        :type length: float
+        :param p_loss_init: The probability of qubit loss as it enters the channel. Defaults to `.2`.
+        :type p_loss_init: optional, float
+        :param p_loss_length: The attenuation of photons in fibre in decibel per kilometre. Defaults to `.18`.
+        :type p_loss_length: optional, float
+        :param fidelity_loss: A tuple containing the fidelity loss due to the environment for a certain length
+            of fibre. Defaults to `(.047, 50)`.
+        :type fidelity_loss: optional, (float, float)
+
+        :return: The probability that a photon survives the channel and the length of its Bloch vector afterwards.
+        :rtype: (float, float)
+        """
+        prob_survival = (1 - p_loss_init) * 10**(-length * p_loss_length / 10)
+
+        # The generator and the fibre compose into a single depolarisation channel.
+        xi = compiled_depolarisation_parameter(self.fidelity_loss, fidelity_loss[0], length / fidelity_loss[1])
+
+        return prob_survival, xi
+
+    def timing(self, alice_arrival, bob_arrival):
+        """Checks for arrays of answers whether they were received within the expected time. The arrival times are
+        given relative to the moment that the messages of both verifiers reach P_v.
+
+        :param alice_arrival: The arrival times of the answers at Alice in nanoseconds.
+        :type alice_arrival: :class:`numpy.ndarray`
+        :param bob_arrival: The arrival times of the answers at Bob in nanoseconds.
+        :type bob_arrival: :class:`numpy.ndarray`
+
+        :return: Whether the answers were on time for Alice and for Bob.
+        :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+        """
+        on_time = []
+
+        for arrival, delta_time in [(alice_arrival, self.alice_classical_delta_time_P_v),
+                                    (bob_arrival, self.bob_classical_delta_time_P_v)]:
+            time_took = arrival + delta_time
+            time_expected = 2 * delta_time + self.c_quantum_time
+
+            # Account for small numerical errors with isclose()
+            on_time.append((time_took <= time_expected) | np.isclose(time_took, time_expected, rtol=1e-9, atol=0))
+
+        return tuple(on_time)
+
+    def run(self, player, chunk_size=None):
+        """Runs the QPV_BB84_e protocol with the given player, until n rounds have been answered or the decision
+        of the sequential test is settled.
+
+        :param player: The player taking part in the protocol. Its `answer` method receives the sampled rounds
+            and returns a dictionary with the answers (`alice`, `bob`) and their arrival times
+            (`alice_arrival`, `bob_arrival`).
+        :type player: object
+        :param chunk_size: The number of rounds to sample at once. Defaults to an estimate based on the
+            answer rate so far.
+        :type chunk_size: optional, int
+
+        :return: The statistics of the run, the results of Alice, and the results of Bob. The statistics have no
+            simulated time or event counts, see :func:`QPV_BB84_e.verifiers.run_stats.run_stats`. If the player
+            returns the logarithms of the likelihood ratios of the rounds (`log_weight`), as with importance
+            sampling, the statistics have the likelihood ratio of the run (`weight`), over the rounds up to the
+            one in which it stopped. With a sequential test, they have its decision and the alpha and thresholds
+            it was made for, see :meth:`QPV_BB84_e.verifiers.sequential_test.SequentialTest.record`.
+        :rtype: list
+        """
+        start_time = time.perf_counter()
+
+        chunks = []
+        answered = 0
+        rounds = 0
+        done = False
+
+        # The running counts of correct and incorrect rounds, and of answered, no-photon and not-sent rounds among
+        # the first n rounds, for the sequential test.
+        totals = [0, 0, 0, 0, 0]
+
+        if self.sequential_test is not None:
+            self.sequential_test.reset(self.n)
+
+        while not done:
+            if chunk_size:
+                size = chunk_size
+            elif answered == 0:
+                size = max(2 * self.n, 2 * rounds, 1024)
+            else:
+                size = int(min(math.ceil(1.5 * (self.n - answered) * rounds / answered) + 64, 1e7))
+
+            chunk = self.sample_rounds(size)
+            chunk.update(player.answer(chunk))
+
+            # Only rounds in which Alice sent the photon count towards n.
+            alice_answered = chunk['sent'] & (chunk['alice'] != NO_ANSWER)
+            count = np.cumsum(alice_answered)
+            last = size
+
+            if answered + count[-1] >= self.n:
+                # Stop at the round in which the n-th answer is received.
+                last = np.searchsorted(count, self.n - answered) + 1
+                done = True
+
+            if self.sequential_test is not None:
+                index = rounds + np.arange(1, size + 1)
+                first = index <= self.sequential_test.n
+
+                correct = totals[0] + np.cumsum(alice_answered & (chunk['alice'] == chunk['b']))
+                incorrect = totals[1] + np.cumsum(alice_answered & (chunk['alice'] != chunk['b']))
+                first_answered = totals[2] + np.cumsum(first & alice_answered)
+                first_no_photon = totals[3] + np.cumsum(first & chunk['sent'] & (chunk['alice'] == NO_ANSWER))
+                first_not_sent = totals[4] + np.cumsum(first & ~chunk['sent'])
+
+                # As in the event-driven protocol, every round is a check.
+                decisions = self.sequential_test.decide(correct, incorrect, first_answered, first_no_photon,
+                                                        first_not_sent, index)
+                settled = np.flatnonzero(decisions[:last] != UNDECIDED)
+
+                if settled.size:
+                    last = settled[0] + 1
+                    done = True
+
+                    self.sequential_test.decision = int(decisions[settled[0]])
+
+                self.sequential_test.checks = rounds + last
+                totals = [int(counts[last - 1]) for counts in [correct, incorrect, first_answered, first_no_photon,
+                                                                first_not_sent]]
+
+            chunk = {key: value[:last] for key, value in chunk.items()}
+
+            answered += int(np.count_nonzero(chunk['sent'] & (chunk['alice'] != NO_ANSWER)))
+            rounds += len(chunk['b'])
+            chunks.append(chunk)
+
+        data = {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+
+        alice_data, bob_data = self.results(data)
+        stats = run_stats(alice_data, wall_time=time.perf_counter() - start_time)
+
+        if 'log_weight' in data:
+            stats['weight'] = float(np.exp(np.sum(data['log_weight'])))
+
+        if self.sequential_test is not None:
+            stats.update(self.sequential_test.record())
+
+        return stats, alice_data, bob_data
+
+    def results(self, data):
+        """Converts the sampled rounds and answers to the results that the verifiers in
+        :class:`QPV_BB84_e.verifiers.protocol.Protocol` record.
+
+        :param data: A dictionary with the sampled rounds and the answers of the player.
+        :type data: dict
+
+        :return: The results of Alice and the results of Bob, see
+            :meth:`QPV_BB84_e.verifiers.round_buffer.RoundBuffer.results`.
+        :rtype: (dict, dict)
+        """
+        alice_on_time, bob_on_time = self.timing(data['alice_arrival'], data['bob_arrival'])
+
+        alice_outcomes = np.where(data['alice'] == NO_ANSWER, NO_PHOTON,
+                                  np.where(data['alice'] == data['b'], CORRECT, INCORRECT))
+        alice_outcomes = np.where(data['sent'], alice_outcomes, NOT_SENT)
+
+        bob_outcomes = np.where(data['bob'] == NO_ANSWER, NO_PHOTON, np.where(data['bob'] == data['b'], CORRECT,
+                                                                              INCORRECT))
+
+        alice_results = RoundBuffer('m_0_i', len(alice_outcomes))
+        alice_results.extend(alice_outcomes, alice_on_time, data['theta'] - data['r'] % self.m)
+
+        bob_results = RoundBuffer('m_1_i', len(bob_outcomes))
+        bob_results.extend(bob_outcomes, bob_on_time, data['r'])
+
+        return alice_results.results(), bob_results.results()
@@ -1,7 +1,11 @@
 from netsquid.protocols.nodeprotocols import NodeProtocol
+from QPV_BB84_e.verifiers.outcomes import INCORRECT, CORRECT, NO_PHOTON
+from QPV_BB84_e.verifiers.profiler import profiled
 
+import heapq
 import math
 import netsquid as ns
+import numpy as np
 
 """
 bob_protocol.py
@@ -55,6 +59,7 @@ class BobProtocol(NodeProtocol):
 
         self.qubit_prep_time = self.node.cdata['alice_qubit_prep_time']
 
+    @profiled
     def process_result(self, msg, results):
         """Process the result received from the prover. We check whether it was received within the
         expected time and whether it was correct.
@@ -63,18 +68,76 @@ class BobProtocol(NodeProtocol):
         time_expected = 2 * self.classical_delta_time_P_v + self.node.cdata['c_quantum_time']
 
         # Account for small numerical errors with isclose()
-        results['t_i'].append(time_took <= time_expected or math.isclose(time_took, time_expected))
-
-        results['m_1_i'].append(self.r)
+        on_time = time_took <= time_expected or math.isclose(time_took, time_expected)
 
         if msg[0] == 'NO_PHOTON':
-            results['r_i'].append(msg[0])
+            outcome = NO_PHOTON
         else:
-            r = msg[1]
-
-            results['r_i'].append(r == self.b)
+            outcome = CORRECT if msg[1] == self.b else INCORRECT
             self.node.cdata['ans_count'] += 1
 
+        results.append(outcome, on_time, self.r)
+
+        self.on_time = on_time
+
+    @profiled
+    def skip_rounds(self, messages, results):
+        """Record the rounds that Alice skipped in fast-forward mode. The photons of these rounds were lost, and
+        they are recorded with the timing of the last round, which was lost as well.
+
+        :param messages: The messages of the skipped rounds.
+        :type messages: :class:`numpy.ndarray`
+        :param results: The buffer to record the rounds in.
+        :type results: :class:`QPV_BB84_e.verifiers.round_buffer.RoundBuffer`
+        """
+        results.extend(np.full(len(messages), NO_PHOTON, dtype=np.int8), np.full(len(messages), self.on_time),
+                       messages)
+
+    def run_pipelined(self, results):
+        """Run the protocol with multiple rounds in flight. Every round Alice starts is tagged with a round id,
+        and m_1 is sent for it such that it reaches P_v at the same time as Alice's messages. The answers of the
+        prover are matched to the outstanding rounds by their round id.
+
+        :param results: The buffer to record the rounds in.
+        :type results: :class:`QPV_BB84_e.verifiers.round_buffer.RoundBuffer`
+        """
+        rounds = {}
+        pending = []
+
+        while self.node.cdata['ans_count'] < self.node.cdata['n']:
+            expr = self.await_port_input(self.c_port_alice) | self.await_port_input(self.c_port_player)
+
+            if pending:
+                expr = expr | self.await_timer(end_time=max(pending[0][0], ns.sim_time()))
+
+            expr = yield expr
+            terms = expr.first_term if pending else expr
+
+            if terms.first_term.value:
+                for msg in self.c_port_alice.rx_input().items:
+                    b, r, round_id = msg[1]
+                    rounds[round_id] = {'b': b, 'r': r, 't_sent': None}
+
+                    heapq.heappush(pending, (ns.sim_time() + max(0, self.delta_send_time), round_id))
+
+            if terms.second_term.value:
+                for msg in self.c_port_player.rx_input().items:
+                    # Disregard answers that do not belong to an outstanding round.
+                    if len(msg) < 3 or msg[2] not in rounds:
+                        continue
+
+                    outstanding = rounds.pop(msg[2])
+                    self.b, self.r, self.t_sent = outstanding['b'], outstanding['r'], outstanding['t_sent']
+
+                    self.process_result(msg, results)
+
+            while pending and (pending[0][0] <= ns.sim_time() or math.isclose(pending[0][0], ns.sim_time())):
+                _, round_id = heapq.heappop(pending)
+                rounds[round_id]['t_sent'] = ns.sim_time()
+
+                self.c_port_player.tx_output(('m_1', rounds[round_id]['r'], round_id))
+
+    @profiled
     def run(self):
         """Continuously check for messages from the connected player or Bob, until n instances of
         :math:`c_1` and :math:`c_2` have been recorded.
@@ -85,6 +148,10 @@ class BobProtocol(NodeProtocol):
         self.setup_ports()
         self.setup_timing_vals(self.node.cdata['network'])
 
+        if self.node.cdata['pipeline_depth'] > 1:
+            yield from self.run_pipelined(results)
+            return
+
         received_values = False
         received_result = False
 
@@ -108,6 +175,9 @@ class BobProtocol(NodeProtocol):
                 msg = self.c_port_alice.rx_input().items
                 self.b, self.r = msg[0][1]
 
+                if len(msg[0]) > 2:
+                    self.skip_rounds(msg[0][2], results)
+
                 if self.delta_send_time > 0:
                     self.send_time = ns.sim_time() + self.delta_send_time
 
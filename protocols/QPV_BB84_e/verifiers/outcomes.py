@@ -0,0 +1,66 @@
+from collections import Counter
+
+import numpy as np
+
+"""
+outcomes.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the integer codes of the outcomes of a round in the QPV_BB84_e protocol, as recorded by the
+verifiers, and functions to convert between these codes and the values in the results of the verifiers.
+"""
+
+
+# The outcome codes of a round.
+INCORRECT = 0
+CORRECT = 1
+NO_PHOTON = 2
+NOT_SENT = 3
+
+# The codes of the values that the verifiers record in r_i.
+OUTCOMES = {False: INCORRECT, True: CORRECT, 'NO_PHOTON': NO_PHOTON, 'NOT_SENT': NOT_SENT}
+VALUES = [False, True, 'NO_PHOTON', 'NOT_SENT']
+
+
+def encode_outcomes(r_i):
+    """Converts the results of a verifier to outcome codes.
+
+    :param r_i: The results, as booleans or the strings `NO_PHOTON` and `NOT_SENT`. An array of outcome codes is
+        returned as is.
+    :type r_i: list or :class:`numpy.ndarray`
+
+    :return: The outcome codes.
+    :rtype: :class:`numpy.ndarray`
+    """
+    if isinstance(r_i, np.ndarray) and r_i.dtype == np.int8:
+        return r_i
+
+    return np.fromiter((OUTCOMES[r] for r in r_i), dtype=np.int8, count=len(r_i))
+
+
+def count_outcomes(codes):
+    """Counts the number of rounds per outcome.
+
+    :param codes: The outcome codes.
+    :type codes: :class:`numpy.ndarray`
+
+    :return: The number of rounds per outcome code.
+    :rtype: :class:`numpy.ndarray`
+    """
+    return np.bincount(codes, minlength=len(VALUES))
+
+
+def decode_counts(codes):
+    """Counts the number of rounds per outcome, indexed by the values that the verifiers record in r_i.
+
+    :param codes: The outcome codes.
+    :type codes: :class:`numpy.ndarray`
+
+    :return: The number of rounds per value.
+    :rtype: :class:`collections.Counter`
+    """
+    return Counter(dict(zip(VALUES, count_outcomes(codes).tolist())))
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import functools
+import inspect
+
+"""
+profiler.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains opt-in profiling of the protocols and the error models of the QPV_BB84_e protocol. Handlers
+that are decorated with `profiled` record their number of calls, their cumulative wall-clock time and, for the
+generators that run the protocols, the number of events that resumed them. When the profiler is disabled, a
+handler only checks a flag.
+"""
+
+
+class Profiler():
+    """This is a class representation of the profiler of a process. The records are kept per handler and per
+    component, under the name of the class of the instance and the name of the method. The wall-clock time of a
+    handler includes the time of the handlers it calls.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.__records = {}
+
+    def enable(self):
+        """Starts recording the calls of the profiled handlers.
+        """
+        self.enabled = True
+
+    def disable(self):
+        """Stops recording the calls of the profiled handlers. The records are kept.
+        """
+        self.enabled = False
+
+    def reset(self):
+        """Clears the records, for example between runs.
+        """
+        self.__records = {}
+
+    def record(self, name, wall_time, calls=1, events=0):
+        """Adds to the record of a handler.
+
+        :param name: The name of the handler.
+        :type name: str
+        :param wall_time: The wall-clock time spent in the handler in seconds.
+        :type wall_time: float
+        :param calls: The number of calls. Defaults to `1`.
+        :type calls: optional, int
+        :param events: The number of events that resumed the handler. Defaults to `0`.
+        :type events: optional, int
+        """
+        entry = self.__records.setdefault(name, [0, 0., 0])
+
+        entry[0] += calls
+        entry[1] += wall_time
+        entry[2] += events
+
+    def trace(self, name, generator):
+        """Runs a generator that is driven by the events of the simulation, and records the time spent in it and
+        the number of events that resumed it.
+
+        :param name: The name of the handler.
+        :type name: str
+        :param generator: The generator.
+        :type generator: generator
+
+        :return: The return value of the generator.
+        :rtype: object
+        """
+        self.record(name, 0.)
+        value = None
+
+        try:
+            while True:
+                start = time.perf_counter()
+
+                try:
+                    expr = generator.send(value)
+                except StopIteration as stop:
+                    self.record(name, time.perf_counter() - start, calls=0)
+
+                    return stop.value
+
+                self.record(name, time.perf_counter() - start, calls=0)
+
+                value = yield expr
+
+                self.record(name, 0., calls=0, events=1)
+        finally:
+            generator.close()
+
+    def report(self):
+        """Returns the records, sorted by the wall-clock time.
+
+        :return: A dictionary with, per handler, the number of calls, the wall-clock time in seconds and the
+            number of events.
+        :rtype: dict
+        """
+        records = sorted(self.__records.items(), key=lambda record: record[1][1], reverse=True)
+
+        return {name: {'calls': calls, 'wall_time': wall_time, 'events': events}
+                for name, (calls, wall_time, events) in records}
+
+    def write(self, filename, **metadata):
+        r"""Writes the report to a JSON file.
+
+        :param filename: The name of the file.
+        :type filename: str
+        :param \*\*metadata: Values that identify the run, such as the parameter and the replicate.
+        :type \*\*metadata: dict
+        """
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+
+        with open(filename, 'w') as f:
+            json.dump(dict(metadata, handlers=self.report()), f, indent=2)
+
+
+# The profiler of this process.
+PROFILER = Profiler()
+
+
+def profile_filename(path, param, replicate):
+    """Returns the name of the file of the report of a run, in the directory of the results of the sweep.
+
+    :param path: The directory of the results.
+    :type path: str
+    :param param: The parameter of the run.
+    :type param: float
+    :param replicate: The replicate of the run.
+    :type replicate: int
+
+    :return: The name of the file.
+    :rtype: str
+    """
+    return os.path.join(path, 'profiles', f'profile_{param:.1f}_{replicate}.json')
+
+
+def profiled(function):
+    """Decorates a method of a protocol or a model to be recorded by the profiler when it is enabled. Generators,
+    such as the `run` methods of protocols, remain generators.
+
+    :param function: The method.
+    :type function: function
+
+    :return: The decorated method.
+    :rtype: function
+    """
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            if not PROFILER.enabled:
+                return (yield from function(self, *args, **kwargs))
+
+            return (yield from PROFILER.trace(f'{type(self).__name__}.{function.__name__}',
+                                              function(self, *args, **kwargs)))
+    else:
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            if not PROFILER.enabled:
+                return function(self, *args, **kwargs)
+
+            start = time.perf_counter()
+
+            try:
+                return function(self, *args, **kwargs)
+            finally:
+                PROFILER.record(f'{type(self).__name__}.{function.__name__}', time.perf_counter() - start)
+
+    return wrapper
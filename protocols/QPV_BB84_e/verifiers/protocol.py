@@ -2,13 +2,17 @@ from netsquid.components.qprocessor import QuantumProcessor, PhysicalInstruction
 from netsquid.nodes import Node, Network
 from netsquid.components import instructions as instr
 from netsquid.qubits.qformalism import QFormalism
-from collections import defaultdict
 from QPV_BB84_e.custom_models.network_components import QuantumConnection, ClassicalConnection, ConnectionDirection
 from QPV_BB84_e.verifiers.alice_protocol import AliceProtocol
 from QPV_BB84_e.verifiers.bob_protocol import BobProtocol
+from QPV_BB84_e.verifiers.round_buffer import RoundBuffer
+from QPV_BB84_e.verifiers.transcript import Transcript
+from QPV_BB84_e.verifiers.run_stats import run_stats
 from QPV_BB84_e.custom_models.quantum_gates import PreparationGate
 from QPV_BB84_e.custom_models.error_models import PhotonGeneratorErrorModel, BeamSplitterErrorModel
 
+import time
+import random
 import netsquid as ns
 import numpy as np
 
@@ -34,6 +38,9 @@ MEASURE_TIME = .02
 CCONN_SPEED = 3e5
 QCONN_SPEED = 2e5
 
+# The loss in fidelity of the photon generator of Alice.
+SOURCE_FIDELITY_LOSS = .005
+
 
 class Protocol():
     """This is a class representation of the QPV_BB84_e protocol. When the 'run' method is called, two verifiers
@@ -50,11 +57,52 @@ class Protocol():
     :type P_B: float
     :param P_v: The verification position on the real number line.
     :type P_v: float
+    :param pipeline_depth: The maximum number of rounds in flight at once. With a depth of `1`, the verifiers
+        only start a round when the answer of the previous round has arrived. Otherwise, messages carry round
+        ids that the prover must echo in its answers. Defaults to `1`.
+    :type pipeline_depth: optional, int
+    :param round_period: The time between the start of consecutive rounds in nanoseconds in pipelined mode,
+        given by the repetition rate of the source.
+    :type round_period: optional, float
+    :param sequential_test: A test that Alice updates after every round, which stops the simulation as soon as
+        its decision is settled. Defaults to `None`.
+    :type sequential_test: optional, :class:`QPV_BB84_e.verifiers.sequential_test.SequentialTest`
+    :param channel_noise: How the noise of the photon generator of Alice and of the quantum connections from Alice
+        is applied, `staged`, `compiled` or `validate`, see
+        :class:`QPV_BB84_e.custom_models.network_components.QuantumConnection`. When compiled, Alice prepares her
+        photons without noise. Defaults to `staged`.
+    :type channel_noise: optional, str
+    :param loss_first: Whether Alice samples up front where the photon of a round is lost, at her beam splitter,
+        in the quantum connection from her, or at the prover as registered with :meth:`set_prover_survival`. The
+        components then have no loss models, and no quantum state is prepared for a photon that will be lost.
+        Defaults to `False`.
+    :type loss_first: optional, bool
+    :param fast_forward: Whether Alice skips the runs of lost rounds that follow a lost round, by drawing their
+        number from a geometric distribution and recording them at once. Their simulated time is added to the time
+        of the run. It requires loss-first mode without pipelining, and a prover that answers every lost round in
+        the same way. Defaults to `False`.
+    :type fast_forward: optional, bool
+    :param record_transcript: Whether Alice records the transcript of the verifiers' side of every round, which
+        can be replayed to other players, see :meth:`transcript`. Defaults to `False`.
+    :type record_transcript: optional, bool
+
+    :raises ValueError: When the round period is not given or too short in pipelined mode, when the channel
+        noise is unknown, or when fast-forward is used without loss-first mode or with pipelining.
     """
-    def __init__(self, n, m, P_A, P_B, P_v):
+    def __init__(self, n, m, P_A, P_B, P_v, pipeline_depth=1, round_period=None, sequential_test=None,
+                 channel_noise='staged', loss_first=False, fast_forward=False, record_transcript=False):
         # Work in the density matrix formalism to allow for error modelling.
         ns.set_qstate_formalism(QFormalism.DM)
 
+        if channel_noise not in ['staged', 'compiled', 'validate']:
+            raise ValueError(f'Unknown channel noise {channel_noise}, expected staged, compiled or validate.')
+
+        if fast_forward and (not loss_first or pipeline_depth > 1):
+            raise ValueError('Fast-forward requires loss-first mode without pipelining.')
+
+        self.__channel_noise = channel_noise
+        self.__loss_first = loss_first
+
         self.__setup_network(P_A, P_B)
 
         # Distances to verification position and connection speeds.
@@ -67,25 +115,35 @@ class Protocol():
         # The expected quantum time of Charlie, based on the quantum processing time of Alice.
         c_quantum_time = GATE_TIME + MEASURE_TIME + .001
 
+        # The prover can only handle one qubit at a time, so rounds may not overlap at P_v.
+        if pipeline_depth > 1 and (round_period is None or round_period < max(c_quantum_time, INIT_TIME)):
+            raise ValueError('In pipelined mode, the round period must be at least {} ns.'
+                             .format(max(c_quantum_time, INIT_TIME)))
+
         alice = self.__alice['node']
-        alice.cdata['results'] = defaultdict(list)
-        alice.cdata['ans_count'] = 0
-        alice.cdata['n'] = n
         alice.cdata['m'] = m
         alice.cdata['network'] = network_details
         alice.cdata['c_quantum_time'] = c_quantum_time
         alice.cdata['qubit_prep_time'] = INIT_TIME
+        alice.cdata['pipeline_depth'] = pipeline_depth
+        alice.cdata['round_period'] = round_period
+        alice.cdata['sequential_test'] = sequential_test
+        alice.cdata['loss_first'] = self.__loss if loss_first else None
+        alice.cdata['fast_forward'] = fast_forward
 
         bob = self.__bob['node']
-        bob.cdata['results'] = defaultdict(list)
-        bob.cdata['ans_count'] = 0
-        bob.cdata['n'] = n
         bob.cdata['m'] = m
         bob.cdata['network'] = network_details
         bob.cdata['c_quantum_time'] = c_quantum_time
         bob.cdata['alice_qubit_prep_time'] = INIT_TIME
+        bob.cdata['pipeline_depth'] = pipeline_depth
 
         self.__verification_position = P_v
+        self.__record_transcript = record_transcript
+        self.__protocols = []
+        self.__sim_time = 0
+
+        self.reset(n)
 
     @property
     def alice_position(self):
@@ -114,11 +172,26 @@ class Protocol():
         """
         return self.__verification_position
 
-    def __create_processor(self, fidelity_loss=.005, prob_absorption=.3):
+    def verification_rate(self):
+        """Returns the number of rounds that Alice recorded an answer for per second of simulated time,
+        in the last run of the protocol.
+
+        :return: The verification rate in rounds per second.
+        :rtype: float
+        """
+        if not self.__sim_time:
+            return 0.
+
+        return self.__alice['node'].cdata['ans_count'] / (self.__sim_time * 1e-9)
+
+    def __create_processor(self, fidelity_loss=SOURCE_FIDELITY_LOSS, prob_absorption=.3):
         """A private method that returns a quantum processor with the given specifications. The processor
         supports qubit initialisation, the X gate, and the preparation gate used in the QPV_BB84_e protocol.
+        When the channel noise is compiled, the noise of initialisation is applied by the quantum connections.
+        In loss-first mode, the absorption of the beam splitter is sampled by Alice instead.
 
-        :param fidelity_loss: The amount of loss in fidelity for qubit initialisation. Defaults to `.005`.
+        :param fidelity_loss: The amount of loss in fidelity for qubit initialisation. Defaults to
+            `SOURCE_FIDELITY_LOSS`.
         :type fidelity_loss: optional, float
         :param prob_absorption: the probability of absorption of a photon when travelling through a beam splitter.
             Defaults to `.3`.
@@ -127,8 +200,18 @@ class Protocol():
         :returns: A quantum processor object with the given noise/loss characteristics.
         :rtype: :class:`netsquid.components.qprocessor.QuantumProcessor`
         """
-        initialisation_error_model = PhotonGeneratorErrorModel(fidelity_loss)
-        operation_error_model = BeamSplitterErrorModel(prob_absorption)
+        initialisation_error_model = None
+        operation_error_model = None
+
+        if self.__channel_noise != 'compiled':
+            initialisation_error_model = PhotonGeneratorErrorModel(fidelity_loss)
+
+        # The probabilities that a photon survives the beam splitter of Alice, the quantum connection and the
+        # prover, which are sampled by Alice in loss-first mode.
+        self.__loss = {'absorption': prob_absorption, 'channel': 1., 'prover': 1.}
+
+        if not self.__loss_first:
+            operation_error_model = BeamSplitterErrorModel(prob_absorption)
 
         instructions = [
             PhysicalInstruction(instr.INSTR_INIT, duration=INIT_TIME, quantum_noise_model=initialisation_error_model),
@@ -167,6 +250,8 @@ class Protocol():
         if node2['node'].name not in self.__network.nodes:
             self.__network.add_node(node2['node'])
 
+        self.__connections.append(conn)
+
         return self.__network.add_connection(node1['node'], node2['node'], conn, label=label,
                                              port_name_node1=port_name_node1, port_name_node2=port_name_node2)
 
@@ -183,12 +268,13 @@ class Protocol():
         self.__bob = {'node': Node('Bob'), 'pos': P_B}
 
         self.__network = Network('QPVBB84_network')
+        self.__connections = []
 
         # Classical connection from Alice to Bob and back to set up the state and basis to send to the prover.
         cconn = ClassicalConnection(length=P_B - P_A, direction=ConnectionDirection.BIDIRECTIONAL)
         self.__add_network_connection(self.__alice, self.__bob, cconn, 'Alice2Bob_classical', 'c_bob', 'c_alice')
 
-    def __create_connection(self, conn_type, direction, length):
+    def __create_connection(self, conn_type, direction, length, from_alice=False):
         """A private method that creates a classical or quantum connection of a certain length and direction.
 
         :param conn_type: A string indicating the connection type, `classical` or `quantum`.
@@ -197,6 +283,9 @@ class Protocol():
         :type direction: :class:`QPV_BB84_e.custom_models.network_components.ConnectionDirection`
         :param length: The length of the channel in kilometres.
         :type length: float
+        :param from_alice: Whether Alice is at side A of the connection, in which case the channel noise of the
+            protocol is used. Defaults to `False`.
+        :type from_alice: optional, bool
 
         :return: A connection object with the given specifications.
         :rtype: :class:`QPV_BB84_e.custom_models.network_components.ClassicalConnection` or
@@ -204,6 +293,12 @@ class Protocol():
         """
         if conn_type == 'classical':
             return ClassicalConnection(length=length, direction=direction)
+        if conn_type == 'quantum' and from_alice:
+            conn = QuantumConnection(length=length, direction=direction, noise=self.__channel_noise,
+                                     source_fidelity_loss=SOURCE_FIDELITY_LOSS, loss_first=self.__loss_first)
+            self.__loss['channel'] = conn.prob_survival
+
+            return conn
         if conn_type == 'quantum':
             return QuantumConnection(length=length, direction=direction)
 
@@ -270,14 +365,85 @@ class Protocol():
             verifier = self.__bob
             length = self.bob_position - node['pos']
 
-        conn = self.__create_connection(*connection, length)
+        conn = self.__create_connection(*connection, length, from_alice=verifier_name == 'Alice')
 
         return self.__add_network_connection(verifier, node, conn, label, port_name_node, port_name_verifier)
 
+    def transcript(self):
+        """Returns the transcript of the verifiers' side of the rounds of the last run, if it is recorded.
+
+        :return: The transcript, or `None` if it is not recorded.
+        :rtype: :class:`QPV_BB84_e.verifiers.transcript.Transcript`
+        """
+        return self.__alice['node'].cdata['transcript']
+
+    def set_prover_survival(self, prob_survival):
+        """Sets the probability that a photon that reaches the prover is measured, for the prover to leave the
+        loss of its own components to Alice in loss-first mode.
+
+        :param prob_survival: The probability that a photon survives the components of the prover.
+        :type prob_survival: float
+        """
+        self.__loss['prover'] = prob_survival
+
+    def reset(self, n=None, seed=None, streams=None):
+        """Resets the per-run state of the verifiers, so that the protocol can be run again on the same network.
+        The verifier protocols of a previous run are stopped, the results and answer counts are cleared, and the
+        quantum memory of Alice and the channels of all connections are emptied.
+
+        :param n: The number of rounds to run the protocol for in the next run. Defaults to the current value.
+        :type n: optional, int
+        :param seed: A seed for the random number generators used in the simulation. Defaults to `None`, in which
+            case the generators are not reseeded.
+        :type seed: optional, int
+        :param streams: The random streams of the next run. Defaults to `None`, in which case the verifiers draw
+            from the global random number generators.
+        :type streams: optional, :class:`QPV_BB84_e.verifiers.random_streams.RandomStreams`
+        """
+        for protocol in self.__protocols:
+            protocol.stop()
+
+        self.__protocols = []
+
+        for verifier, message_key in [(self.__alice, 'm_0_i'), (self.__bob, 'm_1_i')]:
+            node = verifier['node']
+            node.cdata['results'] = RoundBuffer(message_key)
+            node.cdata['ans_count'] = 0
+
+            if n is not None:
+                node.cdata['n'] = n
+
+        self.__alice['node'].qmemory.reset()
+        self.__alice['node'].cdata['skipped_time'] = 0.
+        self.__alice['node'].cdata['transcript'] = (Transcript(self.__alice['node'].cdata['m'], self.alice_position,
+                                                               self.bob_position, self.verification_position)
+                                                    if self.__record_transcript else None)
+
+        if self.__alice['node'].cdata['sequential_test'] is not None:
+            self.__alice['node'].cdata['sequential_test'].reset(n)
+
+        for conn in self.__connections:
+            conn.reset()
+
+        # The global random module has the same methods as a stream.
+        self.__alice['node'].cdata['random'] = streams.verifiers if streams is not None else random
+        self.__alice['node'].cdata['loss_random'] = streams.loss if streams is not None else random
+
+        if seed is not None:
+            random.seed(seed)
+            ns.set_random_state(seed=seed)
+
+        if streams is not None:
+            ns.set_random_state(seed=streams.netsquid_seed)
+
     def run(self):
         """Runs the QPV_BB84_e protocol.
 
-        :return: The simulation statistics, the results of Alice, and the results of Bob.
+        :return: The statistics of the run, the results of Alice, and the results of Bob. The statistics are a flat
+            record, see :func:`QPV_BB84_e.verifiers.run_stats.run_stats`, with the decision of the sequential test
+            and the alpha and thresholds it was made for if there is one, see
+            :meth:`QPV_BB84_e.verifiers.sequential_test.SequentialTest.record`. The results are dictionaries of
+            arrays, see :meth:`QPV_BB84_e.verifiers.round_buffer.RoundBuffer.results`.
         :rtype: list
         """
         protocol_alice = AliceProtocol(self.__alice['node'])
@@ -286,6 +452,21 @@ class Protocol():
         protocol_alice.start()
         protocol_bob.start()
 
-        stats = ns.sim_run()
+        self.__protocols = [protocol_alice, protocol_bob]
+
+        start_time = time.perf_counter()
+        sim_stats = ns.sim_run()
+        wall_time = time.perf_counter() - start_time
+
+        # The simulated time of the run includes the rounds that were skipped in fast-forward mode.
+        self.__sim_time = ns.sim_time() + self.__alice['node'].cdata['skipped_time']
+
+        alice_data = self.__alice['node'].cdata['results'].results()
+        bob_data = self.__bob['node'].cdata['results'].results()
+
+        stats = run_stats(alice_data, self.__sim_time, wall_time, sim_stats)
+
+        if self.__alice['node'].cdata['sequential_test'] is not None:
+            stats.update(self.__alice['node'].cdata['sequential_test'].record())
 
-        return stats, self.__alice['node'].cdata['results'], self.__bob['node'].cdata['results']
+        return stats, alice_data, bob_data
@@ -0,0 +1,99 @@
+import zlib
+import random
+import numpy as np
+
+"""
+random_streams.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the random streams of a run of the QPV_BB84_e protocol. The streams are derived from the id of
+the sweep, the parameter and the replicate of the run, so that a run gives the same results regardless of the
+process or MPI rank it runs on. With common random numbers, the streams of the verifiers do not depend on the
+player, so that the honest prover and the adversaries face the same rounds at the same parameter and replicate.
+"""
+
+
+# The keys of the streams of a run.
+VERIFIERS = 0
+LOSS = 1
+PLAYER = 2
+NETSQUID = 3
+ENGINE = 4
+
+
+def words(value):
+    """Returns the 32-bit words that identify a value in the key of a stream. Strings are hashed, floats are
+    identified by their binary representation.
+
+    :param value: The value.
+    :type value: str, int or float
+
+    :return: The words.
+    :rtype: list
+    """
+    if isinstance(value, str):
+        return [zlib.crc32(value.encode())]
+
+    if isinstance(value, (int, np.integer)):
+        return [int(value) & 0xffffffff, (int(value) >> 32) & 0xffffffff]
+
+    bits = int(np.float64(value).view(np.uint64))
+
+    return [bits & 0xffffffff, bits >> 32]
+
+
+class RandomStreams():
+    """This is a class representation of the random streams of a run. The verifiers draw their bits, bases and
+    values r from one stream, and the loss they sample up front in loss-first mode from another, so that the rounds
+    stay aligned when the loss is sampled differently. The player draws from its own stream, and the random state
+    of NetSquid, which drives the loss and noise models and the measurements, is seeded per run.
+
+    :param sweep: The id of the sweep, shared by the sweeps that are compared with common random numbers.
+    :type sweep: str or int
+    :param param: The parameter of the run, for example the distance.
+    :type param: float
+    :param replicate: The replicate of the run.
+    :type replicate: int
+    :param player: The name of the player, for example `honest` or `fidelity_attack`.
+    :type player: str
+    :param common: Whether the streams of the verifiers are common to all players. Defaults to `False`.
+    :type common: optional, bool
+    """
+    def __init__(self, sweep, param, replicate, player, common=False):
+        run_key = words(sweep) + words(float(param)) + words(replicate)
+        player_key = run_key + words(player)
+        verifier_key = run_key if common else player_key
+
+        self.verifiers = random.Random(self.seed(verifier_key + [VERIFIERS]))
+        self.loss = random.Random(self.seed(verifier_key + [LOSS]))
+        self.player = random.Random(self.seed(player_key + [PLAYER]))
+
+        # The random state of NetSquid takes a 32-bit seed.
+        self.netsquid_seed = int(np.random.SeedSequence(player_key + [NETSQUID]).generate_state(1)[0])
+        self.engine_seed = np.random.SeedSequence(player_key + [ENGINE])
+
+    @staticmethod
+    def seed(key):
+        """Returns a 128-bit seed for a stream with the given key.
+
+        :param key: The words of the key.
+        :type key: list
+
+        :return: The seed.
+        :rtype: int
+        """
+        state = np.random.SeedSequence(key).generate_state(2, dtype=np.uint64)
+
+        return int(state[0]) << 64 | int(state[1])
+
+    def generator(self):
+        """Returns a NumPy random number generator for the run, for the vectorised engine.
+
+        :return: The generator.
+        :rtype: :class:`numpy.random.Generator`
+        """
+        return np.random.default_rng(self.engine_seed)
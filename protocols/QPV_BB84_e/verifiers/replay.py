@@ -0,0 +1,94 @@
+from QPV_BB84_e.verifiers.batch_protocol import BatchProtocol, NO_ANSWER
+from QPV_BB84_e.verifiers.run_stats import run_stats
+
+import time
+import numpy as np
+
+"""
+replay.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the replay of a transcript of the verifiers to any number of players. The rounds of the
+transcript are given to the players as arrays, in the same way as the vectorised engine gives them its sampled
+rounds, so that comparing players costs one simulation of the verifiers and one pass over the arrays per player.
+"""
+
+
+class Replay():
+    """This is a class representation of the replay of a transcript. A player takes part by providing an `answer`
+    method, or by being a function, that returns the answers of the player for the arrays of rounds, as for
+    :meth:`QPV_BB84_e.verifiers.batch_protocol.BatchProtocol.run`. The answers are checked by the verifiers with
+    the timing and positions of the transcript.
+
+    :param transcript: The transcript to replay.
+    :type transcript: :class:`QPV_BB84_e.verifiers.transcript.Transcript`
+    """
+    def __init__(self, transcript):
+        self.transcript = transcript
+        self.rounds = transcript.rounds()
+
+        self.model = BatchProtocol(len(transcript), transcript.m, transcript.alice_position, transcript.bob_position,
+                                   transcript.verification_position)
+
+    def evaluate(self, player, n=None):
+        """Replays the transcript to a player.
+
+        :param player: The player, or a function with the signature of the `answer` method of a player.
+        :type player: object or function
+        :param n: The number of answers of the player after which the run stops, as in a simulated run. Defaults
+            to `None`, in which case all rounds of the transcript are replayed.
+        :type n: optional, int
+
+        :raises ValueError: When the player answers fewer than n rounds of the transcript.
+
+        :return: The statistics of the run, the results of Alice, and the results of Bob, as returned by
+            :meth:`QPV_BB84_e.verifiers.batch_protocol.BatchProtocol.run`.
+        :rtype: list
+        """
+        start_time = time.perf_counter()
+
+        answer = player.answer if hasattr(player, 'answer') else player
+
+        data = dict(self.rounds)
+        data.update(answer(self.rounds))
+
+        if n is not None:
+            count = np.cumsum(data['sent'] & (data['alice'] != NO_ANSWER))
+
+            if not len(count) or count[-1] < n:
+                raise ValueError(f'The player answers {int(count[-1]) if len(count) else 0} rounds of the '
+                                 f'transcript, fewer than n = {n}.')
+
+            # Stop at the round in which the n-th answer is received.
+            last = int(np.searchsorted(count, n)) + 1
+
+            data = {key: value[:last] for key, value in data.items()}
+
+        alice_data, bob_data = self.model.results(data)
+        stats = run_stats(alice_data, wall_time=time.perf_counter() - start_time)
+
+        if 'log_weight' in data:
+            stats['weight'] = float(np.exp(np.sum(data['log_weight'])))
+
+        return stats, alice_data, bob_data
+
+    def evaluate_all(self, players, n=None):
+        """Replays the transcript to every player.
+
+        :param players: The players, or functions with the signature of the `answer` method of a player.
+        :type players: list
+        :param n: The number of answers of a player after which its run stops. Defaults to `None`.
+        :type n: optional, int
+
+        :raises ValueError: When a player answers fewer than n rounds of the transcript.
+
+        :raises ValueError: When the player answers fewer than n rounds of the transcript.
+
+        :return: The statistics and results of every player, see :meth:`evaluate`.
+        :rtype: list
+        """
+        return [self.evaluate(player, n) for player in players]
@@ -0,0 +1,169 @@
+from QPV_BB84_e.verifiers.outcomes import INCORRECT, CORRECT, NO_PHOTON, NOT_SENT, VALUES, count_outcomes
+
+import numpy as np
+
+"""
+round_buffer.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the buffer in which the verifiers of the QPV_BB84_e protocol record their rounds. The rounds
+are kept in preallocated NumPy arrays that grow when they are full, with the outcomes as codes from
+:mod:`QPV_BB84_e.verifiers.outcomes` and the timing as bits.
+"""
+
+
+class RoundBuffer():
+    """This is a class representation of the rounds recorded by a verifier. Per round, the outcome code, whether
+    the answer was on time, and the message sent by the verifier are stored. Running counts of the outcomes and
+    of the late answers are kept as well, so that the decision statistics are available during the run.
+
+    :param message_key: The key of the messages in the results, `m_0_i` for Alice or `m_1_i` for Bob.
+    :type message_key: str
+    :param capacity: The number of rounds to allocate initially. Defaults to `1024`.
+    :type capacity: optional, int
+    """
+    def __init__(self, message_key, capacity=1024):
+        self.message_key = message_key
+        self.length = 0
+
+        # The number of rounds per outcome code, and the number of rounds answered too late.
+        self.counts = [0] * len(VALUES)
+        self.late = 0
+
+        # The counts of the first rounds, once that many rounds have been recorded, indexed by their number.
+        self.__head_counts = {}
+
+        self.__outcomes = np.empty(capacity, dtype=np.int8)
+        self.__timing = np.zeros((capacity + 7) // 8, dtype=np.uint8)
+        self.__messages = np.empty(capacity, dtype=np.int32)
+
+    def __len__(self):
+        return self.length
+
+    def __grow(self):
+        """A private method that doubles the capacity of the buffer.
+        """
+        capacity = 2 * len(self.__outcomes)
+
+        self.__outcomes = np.resize(self.__outcomes, capacity)
+        self.__messages = np.resize(self.__messages, capacity)
+        self.__timing = np.concatenate([self.__timing, np.zeros((capacity + 7) // 8 - len(self.__timing),
+                                                                dtype=np.uint8)])
+
+    def append(self, outcome, on_time, message):
+        """Records a round.
+
+        :param outcome: The outcome code of the round.
+        :type outcome: int
+        :param on_time: Whether the answer was received within the expected time.
+        :type on_time: bool
+        :param message: The message sent by the verifier in the round.
+        :type message: int
+        """
+        if self.length == len(self.__outcomes):
+            self.__grow()
+
+        i = self.length
+
+        self.__outcomes[i] = outcome
+        self.__messages[i] = message
+        self.counts[outcome] += 1
+
+        # The bits are stored in the same order as numpy.packbits.
+        if on_time:
+            self.__timing[i >> 3] |= 0x80 >> (i & 7)
+        else:
+            self.late += 1
+
+        self.length += 1
+
+    def extend(self, outcomes, on_time, messages):
+        """Records arrays of rounds at once.
+
+        :param outcomes: The outcome codes of the rounds.
+        :type outcomes: :class:`numpy.ndarray`
+        :param on_time: Whether the answers were received within the expected time.
+        :type on_time: :class:`numpy.ndarray`
+        :param messages: The messages sent by the verifier.
+        :type messages: :class:`numpy.ndarray`
+        """
+        while self.length + len(outcomes) > len(self.__outcomes):
+            self.__grow()
+
+        start, end = self.length, self.length + len(outcomes)
+
+        self.__outcomes[start:end] = outcomes
+        self.__messages[start:end] = messages
+
+        timing = np.unpackbits(self.__timing, count=end).astype(bool)
+        timing[start:end] = on_time
+        self.__timing[:(end + 7) // 8] = np.packbits(timing)
+
+        self.length = end
+
+        self.counts = (np.array(self.counts) + count_outcomes(outcomes)).tolist()
+        self.late += len(outcomes) - int(np.count_nonzero(on_time))
+
+    def counters(self):
+        """Returns the running counts of the recorded rounds.
+
+        :return: A dictionary with the number of correct, incorrect, no-photon, not-sent and late rounds.
+        :rtype: dict
+        """
+        return {
+            'correct': self.counts[CORRECT],
+            'incorrect': self.counts[INCORRECT],
+            'no_photon': self.counts[NO_PHOTON],
+            'not_sent': self.counts[NOT_SENT],
+            'late': self.late
+        }
+
+    def head_counters(self, length):
+        """Returns the counts of the outcomes of the first rounds. Once that many rounds have been recorded, the
+        counts do not change anymore, and are only computed once.
+
+        :param length: The number of rounds.
+        :type length: int
+
+        :return: A dictionary with the number of correct, incorrect, no-photon and not-sent rounds.
+        :rtype: dict
+        """
+        if self.length <= length:
+            counts = self.counts
+        else:
+            if length not in self.__head_counts:
+                self.__head_counts[length] = count_outcomes(self.__outcomes[:length]).tolist()
+
+            counts = self.__head_counts[length]
+
+        return {
+            'correct': counts[CORRECT],
+            'incorrect': counts[INCORRECT],
+            'no_photon': counts[NO_PHOTON],
+            'not_sent': counts[NOT_SENT]
+        }
+
+    def results(self):
+        """Returns the recorded rounds as arrays, in the same layout as the results of the verifiers were
+        recorded before: `r_i`, `t_i` and the messages of the verifier.
+
+        :return: A dictionary with the outcome codes, whether the answers were on time and the messages.
+        :rtype: dict
+        """
+        return {
+            'r_i': self.__outcomes[:self.length].copy(),
+            't_i': np.unpackbits(self.__timing, count=self.length).astype(bool),
+            self.message_key: self.__messages[:self.length].copy()
+        }
+
+    def nbytes(self):
+        """Returns the memory used by the buffer.
+
+        :return: The number of bytes.
+        :rtype: int
+        """
+        return self.__outcomes.nbytes + self.__timing.nbytes + self.__messages.nbytes
@@ -0,0 +1,118 @@
+from QPV_BB84_e.verifiers.outcomes import INCORRECT, CORRECT, NO_PHOTON, NOT_SENT, count_outcomes, encode_outcomes
+
+import numpy as np
+
+"""
+run_stats.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the statistics of a run of the QPV_BB84_e protocol, as a flat record of numbers. The record
+is returned by the protocols and stored along with the rounds, so that the cost of the simulation and the
+latency of the protocol can be analysed over a sweep from arrays.
+"""
+
+
+# The fields of the record of a run. Times are in nanoseconds of simulated time, except for the wall-clock time in
+# seconds. Photons are lost either at the source of Alice (the rounds in which she sent none), or in the channel
+# or at the prover (the rounds answered with NO_PHOTON). Counts that an engine does not provide are `nan`.
+STATS_DTYPE = np.dtype([('sim_time', '<f8'), ('wall_time', '<f8'), ('events', '<f8'), ('callbacks', '<f8'),
+                        ('rounds', '<i8'), ('answered', '<i8'), ('correct', '<i8'), ('incorrect', '<i8'),
+                        ('lost_at_source', '<i8'), ('lost_in_transit', '<i8'), ('late', '<i8')])
+
+# The labels of the values in the summary of the simulation statistics of NetSquid.
+SIMULATION_COUNTS = {'events': 'Triggered events', 'callbacks': 'Handled callbacks'}
+SIMULATION_TIME = 'Elapsed simulation time'
+
+
+def summary_value(sim_stats, label):
+    """Returns a value from the summary of the statistics of the NetSquid simulator. The value is looked up by its
+    label, so that it does not depend on the layout of the summary.
+
+    :param sim_stats: The statistics returned by :func:`netsquid.sim_run`, or `None`.
+    :type sim_stats: :class:`netsquid.util.simstats.SimStats`
+    :param label: The label of the value, for example `Triggered events`.
+    :type label: str
+
+    :return: The value, or `nan` when not available.
+    :rtype: float
+    """
+    if sim_stats is None:
+        return np.nan
+
+    for line in str(sim_stats).splitlines():
+        name, _, value = line.partition(':')
+
+        if name.strip() == label:
+            try:
+                return float(value.split()[0])
+            except (IndexError, ValueError):
+                return np.nan
+
+    return np.nan
+
+
+def simulation_counts(sim_stats):
+    """Returns the number of events and callbacks from the statistics of the NetSquid simulator.
+
+    :param sim_stats: The statistics returned by :func:`netsquid.sim_run`, or `None`.
+    :type sim_stats: :class:`netsquid.util.simstats.SimStats`
+
+    :return: A dictionary with the number of events and callbacks, which are `nan` when not available.
+    :rtype: dict
+    """
+    return {key: summary_value(sim_stats, label) for key, label in SIMULATION_COUNTS.items()}
+
+
+def run_stats(alice_data, sim_time=np.nan, wall_time=np.nan, sim_stats=None):
+    """Returns the statistics of a run.
+
+    :param alice_data: The results of Alice, see :meth:`QPV_BB84_e.verifiers.round_buffer.RoundBuffer.results`.
+    :type alice_data: dict
+    :param sim_time: The simulated time at the end of the run in nanoseconds. Defaults to `nan`.
+    :type sim_time: optional, float
+    :param wall_time: The wall-clock duration of the run in seconds. Defaults to `nan`.
+    :type wall_time: optional, float
+    :param sim_stats: The statistics returned by :func:`netsquid.sim_run`. Defaults to `None`.
+    :type sim_stats: optional, :class:`netsquid.util.simstats.SimStats`
+
+    :return: A dictionary with the fields of `STATS_DTYPE`.
+    :rtype: dict
+    """
+    counts = count_outcomes(encode_outcomes(alice_data['r_i']))
+
+    stats = {
+        'sim_time': float(sim_time),
+        'wall_time': float(wall_time),
+        'rounds': len(alice_data['r_i']),
+        'answered': int(counts[CORRECT] + counts[INCORRECT]),
+        'correct': int(counts[CORRECT]),
+        'incorrect': int(counts[INCORRECT]),
+        'lost_at_source': int(counts[NOT_SENT]),
+        'lost_in_transit': int(counts[NO_PHOTON]),
+        'late': len(alice_data['t_i']) - int(np.count_nonzero(alice_data['t_i']))
+    }
+    stats.update(simulation_counts(sim_stats))
+
+    return stats
+
+
+def stats_to_record(stats):
+    """Converts the statistics of a run to a record. Missing fields are `nan` or `-1`.
+
+    :param stats: The statistics, for example as returned by :func:`run_stats`.
+    :type stats: dict
+
+    :return: The record.
+    :rtype: :class:`numpy.ndarray`
+    """
+    record = np.zeros(1, dtype=STATS_DTYPE)
+
+    for name in STATS_DTYPE.names:
+        missing = np.nan if STATS_DTYPE[name].kind == 'f' else -1
+        record[name] = stats.get(name, missing) if stats is not None else missing
+
+    return record
@@ -0,0 +1,140 @@
+import numpy as np
+
+"""
+sequential_test.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains a sequential test on the decision statistics of the QPV_BB84_e protocol. After every round,
+the verifiers check whether accepting or rejecting the prover against the thresholds on the correctness rate
+R_c and the reporting rate R_r of the complete run is settled, so that the run can be stopped early.
+"""
+
+
+# The decisions of the test.
+UNDECIDED = 0
+ACCEPT = 1
+REJECT = 2
+
+
+class SequentialTest():
+    r"""This is a class representation of a sequential test on the statistics that the verifiers compute from a
+    complete run, see :func:`QPV_BB84_e.experiments.aggregate.rates`: the correctness rate
+    :math:`R_c = c / (c + i)` over the n answered rounds of the run, and the reporting rate
+    :math:`R_r = (c + i) / (c + i + p)` over the first n rounds, where :math:`c`, :math:`i` and :math:`p` are the
+    number of correct, incorrect and no-photon rounds. If the rounds in which no photon was sent are not excluded,
+    they count in the denominator of :math:`R_r` as well. The prover is accepted when both rates exceed their
+    thresholds, and rejected otherwise.
+
+    After every round, both rates of the complete run are bounded exactly by the outcomes of the rounds that
+    remain, which can be anything. The test is settled as soon as the bounds are on one side of the thresholds, so
+    that a stopped run has the decision that its complete run would have had.
+
+    :param n: The number of answered rounds of a complete run, which is also the number of rounds over which
+        :math:`R_r` is computed.
+    :type n: int
+    :param R_c_threshold: The threshold on the correctness rate.
+    :type R_c_threshold: float
+    :param R_r_threshold: The threshold on the reporting rate.
+    :type R_r_threshold: float
+    :param exclude_not_sent: Whether the rounds in which no photon was sent are left out of the reporting rate.
+        Defaults to `True`.
+    :type exclude_not_sent: optional, bool
+    :param alpha: The significance level at which the thresholds were estimated from the honest runs, which is
+        recorded with the decision. Defaults to `nan`.
+    :type alpha: optional, float
+    """
+    def __init__(self, n, R_c_threshold, R_r_threshold, exclude_not_sent=True, alpha=np.nan):
+        self.n = n
+        self.R_c_threshold = R_c_threshold
+        self.R_r_threshold = R_r_threshold
+        self.exclude_not_sent = exclude_not_sent
+        self.alpha = alpha
+
+        self.reset()
+
+    def reset(self, n=None):
+        """Resets the test for the next run.
+
+        :param n: The number of answered rounds of a complete run. Defaults to the current value.
+        :type n: optional, int
+        """
+        if n is not None:
+            self.n = n
+
+        self.checks = 0
+        self.decision = UNDECIDED
+
+    def record(self):
+        """Returns the decision of the test with the alpha and the thresholds it was made for, as the analysis
+        can only use the decision of a stopped run at those.
+
+        :return: A dictionary with the decision (`decision`), the alpha (`decision_alpha`) and the thresholds on
+            R_c (`R_c_threshold`) and R_r (`R_r_threshold`).
+        :rtype: dict
+        """
+        return {'decision': self.decision, 'decision_alpha': self.alpha, 'R_c_threshold': self.R_c_threshold,
+                'R_r_threshold': self.R_r_threshold}
+
+    def decide(self, correct, incorrect, first_answered, first_no_photon, first_not_sent, rounds):
+        """Returns the decisions for the given counts. The arguments may be arrays, for example the cumulative
+        counts of an array of rounds.
+
+        :param correct: The number of correct rounds.
+        :type correct: int or :class:`numpy.ndarray`
+        :param incorrect: The number of incorrect rounds.
+        :type incorrect: int or :class:`numpy.ndarray`
+        :param first_answered: The number of answered rounds among the first n rounds.
+        :type first_answered: int or :class:`numpy.ndarray`
+        :param first_no_photon: The number of rounds without a photon among the first n rounds.
+        :type first_no_photon: int or :class:`numpy.ndarray`
+        :param first_not_sent: The number of rounds in which no photon was sent among the first n rounds.
+        :type first_not_sent: int or :class:`numpy.ndarray`
+        :param rounds: The number of rounds.
+        :type rounds: int or :class:`numpy.ndarray`
+
+        :return: The decisions, `UNDECIDED`, `ACCEPT` or `REJECT`.
+        :rtype: int or :class:`numpy.ndarray`
+        """
+        # The correctness rate over the n answers, of which the remaining ones may all be correct or incorrect.
+        remaining = np.maximum(self.n - (correct + incorrect), 0)
+
+        R_c_low = correct / self.n
+        R_c_high = (correct + remaining) / self.n
+
+        # The reporting rate over the first n rounds. Of the rounds that remain, all may be answered, or all may
+        # be without a photon, while rounds in which no photon was sent do not count or count as not answered.
+        remaining = np.maximum(self.n - rounds, 0)
+        reported = first_answered + first_no_photon + (0 if self.exclude_not_sent else first_not_sent) + remaining
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            R_r_low = np.where(reported > 0, first_answered / np.maximum(reported, 1), 0.)
+            R_r_high = np.where(reported > 0, (first_answered + remaining) / np.maximum(reported, 1), 0.)
+
+        reject = (R_c_high <= self.R_c_threshold) | (R_r_high <= self.R_r_threshold)
+        accept = (R_c_low > self.R_c_threshold) & (R_r_low > self.R_r_threshold)
+
+        decision = np.where(reject, REJECT, np.where(accept, ACCEPT, UNDECIDED))
+
+        return int(decision) if np.ndim(decision) == 0 else decision
+
+    def update(self, results):
+        """Performs the next check with the rounds recorded by a verifier.
+
+        :param results: The rounds recorded by the verifier.
+        :type results: :class:`QPV_BB84_e.verifiers.round_buffer.RoundBuffer`
+
+        :return: The decision, `UNDECIDED`, `ACCEPT` or `REJECT`.
+        :rtype: int
+        """
+        counters = results.counters()
+        first = results.head_counters(self.n)
+
+        self.checks += 1
+        self.decision = self.decide(counters['correct'], counters['incorrect'], first['correct'] + first['incorrect'],
+                                    first['no_photon'], first['not_sent'], len(results))
+
+        return self.decision
@@ -0,0 +1,49 @@
+"""
+session.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains a simulation session, which builds the network of the QPV_BB84_e protocol once for a given
+geometry and runs any number of replicates on it.
+"""
+
+
+class Session():
+    r"""This is a class representation of a simulation session. The player (for example
+    :class:`QPV_BB84_e.honest_player.charlie.Charlie` or :class:`QPV_BB84_e.attacks.fidelity_attack.attack.Attack`)
+    is instantiated once, which sets up the nodes, processors and connections of the network. Before every
+    replicate, only the per-run state is reset.
+
+    :param player_class: The class of the player, which must provide the methods `reset` and `run`.
+    :type player_class: type
+    :param \*args: Positional arguments for the player, for example `n, m, P_A, P_C, P_B, P_v`.
+    :type \*args: list
+    :param \*\*kwargs: Keyword arguments for the player.
+    :type \*\*kwargs: dict
+    """
+    def __init__(self, player_class, *args, **kwargs):
+        self.player = player_class(*args, **kwargs)
+        self.replicates = 0
+
+    def run(self, n=None, seed=None, streams=None):
+        """Resets the per-run state and runs the next replicate.
+
+        :param n: The number of rounds to run the protocol for. Defaults to the value the player was created with.
+        :type n: optional, int
+        :param seed: A seed for the random number generators used in the replicate. Defaults to `None`.
+        :type seed: optional, int
+        :param streams: The random streams of the replicate. Defaults to `None`.
+        :type streams: optional, :class:`QPV_BB84_e.verifiers.random_streams.RandomStreams`
+
+        :return: The statistics of the run, the results of Alice, and the results of Bob.
+        :rtype: list
+        """
+        if self.replicates > 0 or n is not None or seed is not None or streams is not None:
+            self.player.reset(n, seed, streams)
+
+        self.replicates += 1
+
+        return self.player.run()
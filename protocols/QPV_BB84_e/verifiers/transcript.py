@@ -0,0 +1,155 @@
+import os
+import numpy as np
+
+"""
+transcript.py
+
+Author: Julian Verweij
+Institution: University of Amsterdam
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+DESCRIPTION:
+This file contains the transcript of the verifiers' side of the rounds of a run of the QPV_BB84_e protocol: the
+bit, the basis and the value r that Alice chose, and whether her photon was sent. As the verifiers' side does not
+depend on the player, a transcript can be replayed to any number of players, see
+:mod:`QPV_BB84_e.verifiers.replay`.
+"""
+
+
+# The columns of a round in a transcript.
+TRANSCRIPT_DTYPE = np.dtype([('b', np.int8), ('theta', np.int32), ('phi', np.int32), ('r', np.int32),
+                             ('sent', bool)])
+
+
+class Transcript():
+    """This is a class representation of the transcript of a run. The rounds are kept in a preallocated structured
+    array that grows when it is full, along with the parameters of the verifiers that are needed to replay them.
+
+    :param m: The parameter in the protocol giving the amount of bases to encode in.
+    :type m: int
+    :param P_A: The position of Alice on the real number line.
+    :type P_A: float
+    :param P_B: The position of Bob on the real number line.
+    :type P_B: float
+    :param P_v: The verification position on the real number line.
+    :type P_v: float
+    :param capacity: The number of rounds to allocate initially. Defaults to `1024`.
+    :type capacity: optional, int
+    """
+    def __init__(self, m, P_A, P_B, P_v, capacity=1024):
+        self.m = m
+        self.alice_position = P_A
+        self.bob_position = P_B
+        self.verification_position = P_v
+        self.length = 0
+
+        self.__rounds = np.zeros(capacity, dtype=TRANSCRIPT_DTYPE)
+
+    def __len__(self):
+        return self.length
+
+    def __reserve(self, length):
+        """A private method that doubles the capacity of the transcript until it holds the given number of rounds.
+
+        :param length: The number of rounds.
+        :type length: int
+        """
+        capacity = len(self.__rounds)
+
+        while capacity < length:
+            capacity *= 2
+
+        if capacity > len(self.__rounds):
+            rounds = np.zeros(capacity, dtype=TRANSCRIPT_DTYPE)
+            rounds[:self.length] = self.__rounds[:self.length]
+
+            self.__rounds = rounds
+
+    def append(self, b, theta, phi, r, sent):
+        r"""Records a round.
+
+        :param b: The bit that Alice encoded.
+        :type b: int
+        :param theta: The :math:`\theta` parameter of the basis.
+        :type theta: int
+        :param phi: The :math:`\phi` parameter of the basis.
+        :type phi: int
+        :param r: The value r that Alice sent to Bob.
+        :type r: int
+        :param sent: Whether the photon survived the preparation and was sent.
+        :type sent: bool
+        """
+        self.__reserve(self.length + 1)
+
+        self.__rounds[self.length] = (b, theta, phi, r, sent)
+        self.length += 1
+
+    def extend(self, b, theta, phi, r, sent):
+        r"""Records arrays of rounds at once.
+
+        :param b: The bits that Alice encoded.
+        :type b: :class:`numpy.ndarray`
+        :param theta: The :math:`\theta` parameters of the bases.
+        :type theta: :class:`numpy.ndarray`
+        :param phi: The :math:`\phi` parameters of the bases.
+        :type phi: :class:`numpy.ndarray`
+        :param r: The values r that Alice sent to Bob.
+        :type r: :class:`numpy.ndarray`
+        :param sent: Whether the photons survived the preparation and were sent.
+        :type sent: :class:`numpy.ndarray`
+        """
+        start, end = self.length, self.length + len(b)
+
+        self.__reserve(end)
+
+        for key, values in zip(TRANSCRIPT_DTYPE.names, [b, theta, phi, r, sent]):
+            self.__rounds[key][start:end] = values
+
+        self.length = end
+
+    def rounds(self):
+        """Returns the recorded rounds as arrays, in the same layout as
+        :meth:`QPV_BB84_e.verifiers.batch_protocol.BatchProtocol.sample_rounds`.
+
+        :return: A dictionary with the arrays `b`, `theta`, `phi`, `r` and `sent`.
+        :rtype: dict
+        """
+        return {key: self.__rounds[key][:self.length].astype(bool if key == 'sent' else int)
+                for key in TRANSCRIPT_DTYPE.names}
+
+    def save(self, filename):
+        """Writes the transcript to a file. It is written under a temporary name first, so that an interrupted
+        write is never read as a transcript.
+
+        :param filename: The name of the file.
+        :type filename: str
+        """
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+
+        temporary = f'{filename}.{os.getpid()}.tmp'
+
+        with open(temporary, 'wb') as f:
+            np.savez(f, rounds=self.__rounds[:self.length], m=self.m,
+                     positions=[self.alice_position, self.bob_position, self.verification_position])
+
+        os.replace(temporary, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """Reads a transcript from a file written by :meth:`save`.
+
+        :param filename: The name of the file.
+        :type filename: str
+
+        :return: The transcript.
+        :rtype: :class:`QPV_BB84_e.verifiers.transcript.Transcript`
+        """
+        with np.load(filename) as data:
+            rounds = data['rounds']
+
+            transcript = cls(int(data['m']), *data['positions'].tolist(), capacity=max(len(rounds), 1))
+
+        transcript.__rounds[:len(rounds)] = rounds
+        transcript.length = len(rounds)
+
+        return transcript